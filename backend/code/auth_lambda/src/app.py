@@ -1,28 +1,96 @@
 import os
 import json
+import hmac
+from functools import lru_cache
+from hashlib import sha256
 
-AUTH_TOKEN = os.getenv('AUTH_TOKEN', 'invalid-token')
+AUTH_TOKEN = os.getenv("AUTH_TOKEN", "invalid-token")
+# {"<sha256 hex of token>": {"principalId": "dashboard", "projects": ["*"]}}
+AUTH_TOKENS = os.getenv("AUTH_TOKENS", "{}")
 
-def handler(event: dict, context) -> dict:
-    auth_policy = {
-      "principalId": "user",
-      "policyDocument": {
-        "Version": "2012-10-17",
-        "Statement": [
-          {
-            "Action": "execute-api:Invoke",
-            "Effect": None,
-            "Resource": event["methodArn"]
-          }
+ALL_PROJECTS = "*"
+
+
+def load_token_registry() -> dict:
+    token_registry = {}
+    for token_digest, token_entry in json.loads(AUTH_TOKENS).items():
+        token_registry[bytes.fromhex(token_digest)] = (
+            bytes.fromhex(token_digest),
+            token_entry.get("principalId", token_digest[:12]),
+            tuple(sorted(str(project) for project in token_entry.get("projects", []))),
+        )
+    if AUTH_TOKEN != "invalid-token":
+        auth_token_digest = sha256(AUTH_TOKEN.encode("utf-8")).digest()
+        token_registry[auth_token_digest] = (
+            auth_token_digest,
+            "user",
+            (ALL_PROJECTS,),
+        )
+    return token_registry
+
+
+token_registry = load_token_registry()
+
+
+def method_arn_base(method_arn: str) -> str:
+    # arn:aws:execute-api:{region}:{account}:{api id}/{stage}/{method}/{path}
+    arn_prefix, _, api_path = method_arn.partition("/")
+    stage = api_path.split("/", 1)[0]
+    return f"{arn_prefix}/{stage}"
+
+
+@lru_cache(maxsize=4096)
+def build_policy(principal_id: str, arn_base: str, projects: tuple) -> dict:
+    # wildcard resources keep the policy valid for every route the token can
+    # reach, so API Gateway can cache it against the token
+    if not projects:
+        effect = "Deny"
+        resources = [f"{arn_base}/*/*"]
+    elif ALL_PROJECTS in projects:
+        effect = "Allow"
+        resources = [f"{arn_base}/*/*"]
+    else:
+        effect = "Allow"
+        resources = [
+            resource
+            for project in projects
+            for resource in (
+                f"{arn_base}/GET/*/{project}",
+                f"{arn_base}/GET/*/{project}/*",
+            )
         ]
-      }
+    return {
+        "principalId": principal_id,
+        "policyDocument": {
+            "Version": "2012-10-17",
+            "Statement": [
+                {
+                    "Action": "execute-api:Invoke",
+                    "Effect": effect,
+                    "Resource": resources,
+                }
+            ],
+        },
     }
-    print('request: {}'.format(json.dumps(event)))
-    if (
-        "authorizationToken" in event and
-        event["authorizationToken"] == AUTH_TOKEN
-    ):
-        auth_policy["policyDocument"]["Statement"][0]["Effect"] = 'Allow'
-    else:
-        auth_policy["policyDocument"]["Statement"][0]["Effect"] = 'Deny'
-    return auth_policy
\ No newline at end of file
+
+
+def lookup_token(token: str):
+    token_digest = sha256(token.encode("utf-8")).digest()
+    token_entry = token_registry.get(token_digest)
+    if token_entry is None:
+        return None
+    # the dict lookup can only leak timing about the digest, never the token
+    registered_digest, principal_id, projects = token_entry
+    if not hmac.compare_digest(registered_digest, token_digest):
+        return None
+    return principal_id, projects
+
+
+def handler(event: dict, context) -> dict:
+    print("request: {}".format(event.get("methodArn")))
+    arn_base = method_arn_base(event["methodArn"])
+    token_entry = lookup_token(event.get("authorizationToken") or "")
+    if token_entry is None:
+        return build_policy("anonymous", arn_base, ())
+    principal_id, projects = token_entry
+    return build_policy(principal_id, arn_base, projects)
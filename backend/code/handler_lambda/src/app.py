@@ -14,14 +14,58 @@ from aws_lambda_powertools.logging import correlation_paths
 from aws_lambda_powertools.utilities.typing import LambdaContext
 from aws_lambda_powertools.event_handler import Response, content_types
 
-from .exceptions import FiveHundredError, FourTwoTwoError
+from .exceptions import FiveHundredError, FourOhOneError, FourTwoTwoError
 from .handlers.get_lead_time_for_changes import get_lead_time_for_changes_handler
 from .handlers.get_deployment_frequency import get_deployment_frequency_handler
 from .handlers.get_mean_time_to_recovery_handler import (
     get_mean_time_to_recovery_handler,
 )
 from .handlers.get_change_failure_rate import get_change_failure_rate_handler
+from .handlers.get_lead_time_for_changes_series import (
+    get_lead_time_for_changes_series_handler,
+)
+from .handlers.get_mean_time_to_recovery_series import (
+    get_mean_time_to_recovery_series_handler,
+)
+from .handlers.get_lead_time_for_changes_stream import (
+    get_lead_time_for_changes_stream_handler,
+)
+from .handlers.get_mean_time_to_recovery_stream import (
+    get_mean_time_to_recovery_stream_handler,
+)
+from .handlers.get_lead_time_for_changes_estimate import (
+    get_lead_time_for_changes_estimate_handler,
+)
+from .handlers.get_mean_time_to_recovery_estimate import (
+    get_mean_time_to_recovery_estimate_handler,
+)
+from .handlers.get_export import get_export_handler
+from .handlers.get_metrics import get_metrics_handler
+from .handlers.post_webhooks import (
+    post_bitbucket_webhook_handler,
+    post_jenkins_webhook_handler,
+)
 from .globals import validate_project_id_param
+from .helpers.metrics import (
+    publish_cache_metrics,
+    publish_upstream_limiter_metrics,
+    publish_upstream_scheduler_metrics,
+)
+from .helpers.cassette import flush_cassette
+from .helpers.deadline import Deadline, current_deadline, invocation_deadline
+from .helpers.pagination import (
+    parse_estimate_query,
+    parse_series_query,
+    parse_time_window,
+)
+from .helpers.encoding import compress_response
+from .helpers.profiling import profile_call, requested_profiling_mode
+from .helpers.scheduler import (
+    INTERACTIVE,
+    UpstreamScope,
+    project_of_path,
+    upstream_scope,
+)
 
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
@@ -35,7 +79,11 @@ def get_deployment_frequency_route(project_id: str):
     try:
         global_variables = validate_project_id_param(int(project_id))
 
-        return get_deployment_frequency_handler(global_variables)
+        return get_deployment_frequency_handler(
+            global_variables,
+            parse_time_window(app.current_event),
+            app.current_event.get_header_value("If-None-Match", case_sensitive=False),
+        )
     except FourTwoTwoError as err:
         return Response(
             status_code=status_codes.codes.UNPROCESSABLE_ENTITY,
@@ -55,7 +103,13 @@ def get_lead_time_for_changes(project_id: str):
     try:
         global_variables = validate_project_id_param(int(project_id))
 
-        return get_lead_time_for_changes_handler(global_variables)
+        return get_lead_time_for_changes_handler(
+            global_variables,
+            current_deadline(),
+            app.current_event.get_query_string_value("continuationToken"),
+            parse_time_window(app.current_event),
+            app.current_event.get_header_value("If-None-Match", case_sensitive=False),
+        )
     except FourTwoTwoError as err:
         return Response(
             status_code=status_codes.codes.UNPROCESSABLE_ENTITY,
@@ -75,7 +129,13 @@ def get_mean_time_to_recovery(project_id: str):
     try:
         global_variables = validate_project_id_param(int(project_id))
 
-        return get_mean_time_to_recovery_handler(global_variables)
+        return get_mean_time_to_recovery_handler(
+            global_variables,
+            current_deadline(),
+            app.current_event.get_query_string_value("continuationToken"),
+            parse_time_window(app.current_event),
+            app.current_event.get_header_value("If-None-Match", case_sensitive=False),
+        )
     except FourTwoTwoError as err:
         return Response(
             status_code=status_codes.codes.UNPROCESSABLE_ENTITY,
@@ -90,12 +150,186 @@ def get_mean_time_to_recovery(project_id: str):
         )
 
 
+@app.get("/lead-time-for-changes/<project_id>/series")
+def get_lead_time_for_changes_series(project_id: str):
+    try:
+        global_variables = validate_project_id_param(int(project_id))
+
+        return get_lead_time_for_changes_series_handler(
+            global_variables,
+            current_deadline(),
+            parse_series_query(app.current_event),
+        )
+    except FourTwoTwoError as err:
+        return Response(
+            status_code=status_codes.codes.UNPROCESSABLE_ENTITY,
+            content_type=content_types.APPLICATION_JSON,
+            body=json.dumps(
+                {"message": err.message, "path": "/lead-time-for-changes/series"}
+            ),
+        )
+    except FiveHundredError as err:
+        return Response(
+            status_code=status_codes.codes.SERVER_ERROR,
+            content_type=content_types.APPLICATION_JSON,
+            body=json.dumps(
+                {"message": err.message, "path": "/lead-time-for-changes/series"}
+            ),
+        )
+
+
+@app.get("/mean-time-to-recovery/<project_id>/series")
+def get_mean_time_to_recovery_series(project_id: str):
+    try:
+        global_variables = validate_project_id_param(int(project_id))
+
+        return get_mean_time_to_recovery_series_handler(
+            global_variables,
+            current_deadline(),
+            parse_series_query(app.current_event),
+        )
+    except FourTwoTwoError as err:
+        return Response(
+            status_code=status_codes.codes.UNPROCESSABLE_ENTITY,
+            content_type=content_types.APPLICATION_JSON,
+            body=json.dumps(
+                {"message": err.message, "path": "/mean-time-to-recovery/series"}
+            ),
+        )
+    except FiveHundredError as err:
+        return Response(
+            status_code=status_codes.codes.SERVER_ERROR,
+            content_type=content_types.APPLICATION_JSON,
+            body=json.dumps(
+                {"message": err.message, "path": "/mean-time-to-recovery/series"}
+            ),
+        )
+
+
+@app.get("/lead-time-for-changes/<project_id>/stream")
+def get_lead_time_for_changes_stream(project_id: str):
+    try:
+        global_variables = validate_project_id_param(int(project_id))
+
+        return get_lead_time_for_changes_stream_handler(
+            global_variables,
+            current_deadline(),
+            parse_time_window(app.current_event),
+        )
+    except FourTwoTwoError as err:
+        return Response(
+            status_code=status_codes.codes.UNPROCESSABLE_ENTITY,
+            content_type=content_types.APPLICATION_JSON,
+            body=json.dumps(
+                {"message": err.message, "path": "/lead-time-for-changes/stream"}
+            ),
+        )
+    except FiveHundredError as err:
+        return Response(
+            status_code=status_codes.codes.SERVER_ERROR,
+            content_type=content_types.APPLICATION_JSON,
+            body=json.dumps(
+                {"message": err.message, "path": "/lead-time-for-changes/stream"}
+            ),
+        )
+
+
+@app.get("/mean-time-to-recovery/<project_id>/stream")
+def get_mean_time_to_recovery_stream(project_id: str):
+    try:
+        global_variables = validate_project_id_param(int(project_id))
+
+        return get_mean_time_to_recovery_stream_handler(
+            global_variables,
+            current_deadline(),
+            parse_time_window(app.current_event),
+        )
+    except FourTwoTwoError as err:
+        return Response(
+            status_code=status_codes.codes.UNPROCESSABLE_ENTITY,
+            content_type=content_types.APPLICATION_JSON,
+            body=json.dumps(
+                {"message": err.message, "path": "/mean-time-to-recovery/stream"}
+            ),
+        )
+    except FiveHundredError as err:
+        return Response(
+            status_code=status_codes.codes.SERVER_ERROR,
+            content_type=content_types.APPLICATION_JSON,
+            body=json.dumps(
+                {"message": err.message, "path": "/mean-time-to-recovery/stream"}
+            ),
+        )
+
+
+@app.get("/lead-time-for-changes/<project_id>/estimate")
+def get_lead_time_for_changes_estimate(project_id: str):
+    try:
+        global_variables = validate_project_id_param(int(project_id))
+
+        return get_lead_time_for_changes_estimate_handler(
+            global_variables,
+            current_deadline(),
+            parse_time_window(app.current_event),
+            parse_estimate_query(app.current_event),
+        )
+    except FourTwoTwoError as err:
+        return Response(
+            status_code=status_codes.codes.UNPROCESSABLE_ENTITY,
+            content_type=content_types.APPLICATION_JSON,
+            body=json.dumps(
+                {"message": err.message, "path": "/lead-time-for-changes/estimate"}
+            ),
+        )
+    except FiveHundredError as err:
+        return Response(
+            status_code=status_codes.codes.SERVER_ERROR,
+            content_type=content_types.APPLICATION_JSON,
+            body=json.dumps(
+                {"message": err.message, "path": "/lead-time-for-changes/estimate"}
+            ),
+        )
+
+
+@app.get("/mean-time-to-recovery/<project_id>/estimate")
+def get_mean_time_to_recovery_estimate(project_id: str):
+    try:
+        global_variables = validate_project_id_param(int(project_id))
+
+        return get_mean_time_to_recovery_estimate_handler(
+            global_variables,
+            current_deadline(),
+            parse_time_window(app.current_event),
+            parse_estimate_query(app.current_event),
+        )
+    except FourTwoTwoError as err:
+        return Response(
+            status_code=status_codes.codes.UNPROCESSABLE_ENTITY,
+            content_type=content_types.APPLICATION_JSON,
+            body=json.dumps(
+                {"message": err.message, "path": "/mean-time-to-recovery/estimate"}
+            ),
+        )
+    except FiveHundredError as err:
+        return Response(
+            status_code=status_codes.codes.SERVER_ERROR,
+            content_type=content_types.APPLICATION_JSON,
+            body=json.dumps(
+                {"message": err.message, "path": "/mean-time-to-recovery/estimate"}
+            ),
+        )
+
+
 @app.get("/change-failure-rate/<project_id>")
 def get_change_failure_rate(project_id: str):
     try:
         global_variables = validate_project_id_param(int(project_id))
 
-        return get_change_failure_rate_handler(global_variables)
+        return get_change_failure_rate_handler(
+            global_variables,
+            parse_time_window(app.current_event),
+            app.current_event.get_header_value("If-None-Match", case_sensitive=False),
+        )
     except FourTwoTwoError as err:
         return Response(
             status_code=status_codes.codes.UNPROCESSABLE_ENTITY,
@@ -110,6 +344,100 @@ def get_change_failure_rate(project_id: str):
         )
 
 
+@app.get("/export/<project_id>/<table>")
+def get_export(project_id: str, table: str):
+    try:
+        global_variables = validate_project_id_param(int(project_id))
+
+        return get_export_handler(
+            global_variables,
+            current_deadline(),
+            table,
+            app.current_event.get_query_string_value("format", "csv"),
+        )
+    except FourTwoTwoError as err:
+        return Response(
+            status_code=status_codes.codes.UNPROCESSABLE_ENTITY,
+            content_type=content_types.APPLICATION_JSON,
+            body=json.dumps({"message": err.message, "path": "/export"}),
+        )
+    except FiveHundredError as err:
+        return Response(
+            status_code=status_codes.codes.SERVER_ERROR,
+            content_type=content_types.APPLICATION_JSON,
+            body=json.dumps({"message": err.message, "path": "/export"}),
+        )
+
+
+@app.post("/webhooks/bitbucket")
+def post_bitbucket_webhook():
+    try:
+        return post_bitbucket_webhook_handler(
+            app.current_event.decoded_body,
+            app.current_event.get_header_value("X-Event-Key", case_sensitive=False),
+            app.current_event.get_header_value("X-Hub-Signature", case_sensitive=False),
+        )
+    except FourOhOneError as err:
+        return Response(
+            status_code=status_codes.codes.UNAUTHORIZED,
+            content_type=content_types.APPLICATION_JSON,
+            body=json.dumps({"message": err.message, "path": "/webhooks/bitbucket"}),
+        )
+    except FourTwoTwoError as err:
+        return Response(
+            status_code=status_codes.codes.UNPROCESSABLE_ENTITY,
+            content_type=content_types.APPLICATION_JSON,
+            body=json.dumps({"message": err.message, "path": "/webhooks/bitbucket"}),
+        )
+    except FiveHundredError as err:
+        return Response(
+            status_code=status_codes.codes.SERVER_ERROR,
+            content_type=content_types.APPLICATION_JSON,
+            body=json.dumps({"message": err.message, "path": "/webhooks/bitbucket"}),
+        )
+
+
+@app.post("/webhooks/jenkins")
+def post_jenkins_webhook():
+    try:
+        return post_jenkins_webhook_handler(
+            app.current_event.decoded_body,
+            app.current_event.get_header_value("X-Webhook-Token", case_sensitive=False),
+        )
+    except FourOhOneError as err:
+        return Response(
+            status_code=status_codes.codes.UNAUTHORIZED,
+            content_type=content_types.APPLICATION_JSON,
+            body=json.dumps({"message": err.message, "path": "/webhooks/jenkins"}),
+        )
+    except FourTwoTwoError as err:
+        return Response(
+            status_code=status_codes.codes.UNPROCESSABLE_ENTITY,
+            content_type=content_types.APPLICATION_JSON,
+            body=json.dumps({"message": err.message, "path": "/webhooks/jenkins"}),
+        )
+    except FiveHundredError as err:
+        return Response(
+            status_code=status_codes.codes.SERVER_ERROR,
+            content_type=content_types.APPLICATION_JSON,
+            body=json.dumps({"message": err.message, "path": "/webhooks/jenkins"}),
+        )
+
+
+@app.get("/metrics")
+def get_metrics():
+    try:
+        return get_metrics_handler(
+            app.current_event.get_header_value("Accept", case_sensitive=False)
+        )
+    except FiveHundredError as err:
+        return Response(
+            status_code=status_codes.codes.SERVER_ERROR,
+            content_type=content_types.APPLICATION_JSON,
+            body=json.dumps({"message": err.message, "path": "/metrics"}),
+        )
+
+
 @app.get("/json-test")
 def get_json_test():
     event: dict = app.current_event
@@ -151,4 +479,27 @@ def get_handler():
 
 @logger.inject_lambda_context(correlation_id_path=correlation_paths.API_GATEWAY_REST)
 def handler(event: dict, context: LambdaContext) -> dict:
-    return app.resolve(event, context)
+    deadline_token = invocation_deadline.set(Deadline(context))
+    # upstream work is queued and limited per project
+    scope_token = upstream_scope.set(
+        UpstreamScope(project_of_path(event.get("path", "")), INTERACTIVE)
+    )
+    try:
+        profiling_mode = requested_profiling_mode(event)
+        if profiling_mode is None:
+            return compress_response(event, app.resolve(event, context))
+        return compress_response(
+            event,
+            profile_call(
+                profiling_mode,
+                event.get("path", ""),
+                lambda: app.resolve(event, context),
+            ),
+        )
+    finally:
+        invocation_deadline.reset(deadline_token)
+        upstream_scope.reset(scope_token)
+        publish_upstream_limiter_metrics()
+        publish_upstream_scheduler_metrics()
+        publish_cache_metrics()
+        flush_cassette()
@@ -0,0 +1,61 @@
+from __future__ import annotations
+from typing import List, Optional
+from typing_extensions import TypedDict
+
+from ..models import PullRequest
+
+
+class ChangeFailureAggregate(TypedDict):
+    # running totals over every merged pull request folded in so far, tagged
+    # with the newest one so later merges are folded in without a rescan
+    newestPullRequestId: Optional[int]
+    totalPullRequests: int
+    hotfixCount: int
+
+
+class ChangeFailureRate(TypedDict):
+    percentageOfChangeFailures: int
+
+
+def empty_change_failure_aggregate() -> ChangeFailureAggregate:
+    return {"newestPullRequestId": None, "totalPullRequests": 0, "hotfixCount": 0}
+
+
+def add_merged_pull_requests(
+    change_failure_aggregate: ChangeFailureAggregate,
+    pull_requests: List[PullRequest],
+) -> ChangeFailureAggregate:
+    # newest first, as bitbucket lists them, and all newer than the aggregate
+    if not pull_requests:
+        return change_failure_aggregate
+    total_pull_requests = change_failure_aggregate["totalPullRequests"]
+    hotfix_count = change_failure_aggregate["hotfixCount"]
+    for pull_request in reversed(pull_requests):
+        # the oldest pull request is not counted as a failure
+        if total_pull_requests and pull_request.is_hotfix:
+            hotfix_count += 1
+        total_pull_requests += 1
+    return {
+        "newestPullRequestId": pull_requests[0].id,
+        "totalPullRequests": total_pull_requests,
+        "hotfixCount": hotfix_count,
+    }
+
+
+def build_change_failure_aggregate(
+    pull_requests: List[PullRequest],
+) -> ChangeFailureAggregate:
+    return add_merged_pull_requests(empty_change_failure_aggregate(), pull_requests)
+
+
+def calculate_change_failure_rate(
+    change_failure_aggregate: ChangeFailureAggregate,
+) -> ChangeFailureRate:
+    total_pull_requests = change_failure_aggregate["totalPullRequests"]
+    return {
+        "percentageOfChangeFailures": int(
+            (change_failure_aggregate["hotfixCount"] / total_pull_requests) * 100
+        )
+        if total_pull_requests
+        else 0
+    }
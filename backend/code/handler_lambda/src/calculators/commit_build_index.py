@@ -0,0 +1,161 @@
+from __future__ import annotations
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+from aws_lambda_powertools import Logger
+
+from ..helpers.network import APIS, make_request
+from ..helpers.scheduler import BACKGROUND, scheduled_as
+from ..exceptions import FiveHundredError, JenkinsHistoryLimit
+from ..models import JenkinsBuild, parse_jenkins_builds
+from .jenkins_folders import get_folder_builds
+
+logger = Logger(child=True)
+
+COMMIT_BUILD_INDEX_TTL_SECONDS = int(os.getenv("COMMIT_BUILD_INDEX_TTL_SECONDS", "300"))
+
+# bitbucket abbreviates merge commit hashes, so the index is keyed on a prefix
+SHA_PREFIX_LENGTH = 12
+
+
+class CommitBuildIndex:
+    def __init__(self, all_builds: List[JenkinsBuild]):
+        self.builds = sorted(all_builds, key=lambda build: build.number)
+        self.numbers = [build.number for build in self.builds]
+        self.first_build_number_by_sha: Dict[str, int] = {}
+        self.last_build_number_by_sha: Dict[str, int] = {}
+        for build in self.builds:
+            for sha in build.revisions:
+                key = sha[:SHA_PREFIX_LENGTH]
+                self.first_build_number_by_sha.setdefault(key, build.number)
+                self.last_build_number_by_sha[key] = build.number
+        self.built_at = time.monotonic()
+
+    def add_build(self, number: int, timestamp: int, result: str, shas: List[str]):
+        # builds only ever arrive newer than the ones already indexed
+        if self.numbers and number <= self.numbers[-1]:
+            return
+        self.builds.append(
+            JenkinsBuild(number, result, timestamp, revisions=tuple(shas))
+        )
+        self.numbers.append(number)
+        for sha in shas:
+            key = sha[:SHA_PREFIX_LENGTH]
+            self.first_build_number_by_sha.setdefault(key, number)
+            self.last_build_number_by_sha[key] = number
+
+    def first_build_number_of_commit(self, sha: str) -> Optional[int]:
+        return self.first_build_number_by_sha.get(sha[:SHA_PREFIX_LENGTH])
+
+    def last_build_number_of_commit(self, sha: str) -> Optional[int]:
+        return self.last_build_number_by_sha.get(sha[:SHA_PREFIX_LENGTH])
+
+    def next_build_number(self, number: int) -> Optional[int]:
+        position = bisect_left(self.numbers, number + 1)
+        return self.numbers[position] if position < len(self.numbers) else None
+
+    def first_green_build_from(self, number: int) -> Optional[JenkinsBuild]:
+        for build in self.builds[bisect_left(self.numbers, number) :]:
+            if build.result == "SUCCESS":
+                return build
+        return None
+
+
+commit_build_indexes: Dict[str, CommitBuildIndex] = {}
+commit_build_index_refresh_locks: Dict[str, threading.Lock] = {}
+commit_build_indexes_lock = threading.Lock()
+
+
+def fetch_commit_build_index(job_name: str) -> CommitBuildIndex:
+    folder_builds = get_folder_builds(job_name)
+    if folder_builds is not None:
+        return CommitBuildIndex(folder_builds)
+
+    all_builds_path = f"{job_name}/api/json?tree=allBuilds[number,timestamp,result,actions[lastBuiltRevision[SHA1]]]"
+
+    logger.debug(
+        "making request to build the commit to build index", path=all_builds_path
+    )
+    all_builds_response = make_request(APIS.JENKINS, all_builds_path)
+
+    if not all_builds_response["success"]:
+        raise FiveHundredError(response=all_builds_response)
+
+    return CommitBuildIndex(parse_jenkins_builds(all_builds_response["data"]))
+
+
+def is_stale(commit_build_index: Optional[CommitBuildIndex]) -> bool:
+    return (
+        commit_build_index is None
+        or time.monotonic() - commit_build_index.built_at
+        > COMMIT_BUILD_INDEX_TTL_SECONDS
+    )
+
+
+def get_commit_build_index(job_name: str) -> CommitBuildIndex:
+    with commit_build_indexes_lock:
+        commit_build_index = commit_build_indexes.get(job_name)
+        refresh_lock = commit_build_index_refresh_locks.setdefault(
+            job_name, threading.Lock()
+        )
+
+    # only this job is locked while its rebuild waits on jenkins, and readers
+    # of an index built before use it as it is rather than queue behind it
+    if not is_stale(commit_build_index):
+        return commit_build_index
+    if not refresh_lock.acquire(blocking=commit_build_index is None):
+        return commit_build_index
+    try:
+        with commit_build_indexes_lock:
+            commit_build_index = commit_build_indexes.get(job_name)
+        if is_stale(commit_build_index):
+            with scheduled_as(priority=BACKGROUND):
+                commit_build_index = fetch_commit_build_index(job_name)
+            with commit_build_indexes_lock:
+                commit_build_indexes[job_name] = commit_build_index
+    finally:
+        refresh_lock.release()
+    return commit_build_index
+
+
+def record_finished_commit_build(
+    job_name: str, number: int, timestamp: int, result: str, shas: List[str]
+) -> bool:
+    with commit_build_indexes_lock:
+        commit_build_index = commit_build_indexes.get(job_name)
+        if commit_build_index is None:
+            return False
+        commit_build_index.add_build(number, timestamp, result, shas)
+        return True
+
+
+def resolve_first_st_build_from_index(
+    global_variables, merge_commit_hash: str, parent_commit_hash: str
+) -> Optional[Tuple[int, int]]:
+    commit_build_index = get_commit_build_index(global_variables["JENKINS_ST_JOB_NAME"])
+
+    first_build_number = commit_build_index.first_build_number_of_commit(
+        merge_commit_hash
+    )
+    if first_build_number is None:
+        parent_build_number = commit_build_index.last_build_number_of_commit(
+            parent_commit_hash
+        )
+        if parent_build_number is not None:
+            first_build_number = commit_build_index.next_build_number(
+                parent_build_number
+            )
+
+    if first_build_number is None:
+        return None
+
+    green_build = commit_build_index.first_green_build_from(first_build_number)
+    if green_build is None:
+        return None
+
+    if green_build.number == 1:
+        raise JenkinsHistoryLimit()
+
+    return green_build.number, green_build.timestamp
@@ -1,9 +1,10 @@
 from __future__ import annotations
+from typing import List
 from typing_extensions import TypedDict, NotRequired
-from datetime import timedelta
+from datetime import datetime, timedelta
 
 from ..helpers.datetime import jenkins_build_datetime, timedelta_to_string
-from ..exceptions import FiveHundredError
+from ..models import JenkinsBuild
 
 
 class DeploymentFrequency(TypedDict):
@@ -14,34 +15,36 @@ class DeploymentFrequency(TypedDict):
 
 
 def calculate_deployment_frequency(
-    jenkins_api_response: dict,
+    builds: List[JenkinsBuild],
 ) -> DeploymentFrequency:
-    try:
-        # this commented out section is for multibranch pipelines
-        # main_jenkins_job_list = [
-        #     job for job in jenkins_api_response["jobs"] if job["name"] == "main"
-        # ]
-        # if len(main_jenkins_job_list) > 1:
-        #     return_value = {
-        #         "success": False,
-        #         "message": "unexpected number of sub jobs with name main for job in jenkins",
-        #     }
-        #     return return_value
-        # main_jenkins_job = main_jenkins_job_list[0]
-        successful_builds_from_jenkins_job = [
-            build
-            for build in jenkins_api_response["allBuilds"]
-            if build["result"] == "SUCCESS"
-        ]
-    except KeyError as err:
-        raise FiveHundredError(message=f"Key {str(err)} cannot be found in the dict")
+    # this commented out section is for multibranch pipelines
+    # main_jenkins_job_list = [
+    #     job for job in jenkins_api_response["jobs"] if job["name"] == "main"
+    # ]
+    # if len(main_jenkins_job_list) > 1:
+    #     return_value = {
+    #         "success": False,
+    #         "message": "unexpected number of sub jobs with name main for job in jenkins",
+    #     }
+    #     return return_value
+    # main_jenkins_job = main_jenkins_job_list[0]
+    successful_builds_from_jenkins_job = [
+        build for build in builds if build.result == "SUCCESS"
+    ]
 
     number_of_deployments = len(successful_builds_from_jenkins_job)
+    if number_of_deployments == 0:
+        return {
+            "numberOfDeployments": 0,
+            "latestBuildDatetime": None,
+            "firstBuildDatetime": None,
+            "timeBetweenLatestAndFirstBuild": None,
+        }
     latest_build_datetime = jenkins_build_datetime(
-        successful_builds_from_jenkins_job[0]
+        {"timestamp": successful_builds_from_jenkins_job[0].timestamp}
     )
     first_build_datetime = jenkins_build_datetime(
-        successful_builds_from_jenkins_job[-1]
+        {"timestamp": successful_builds_from_jenkins_job[-1].timestamp}
     )
 
     time_delta_between_latest_and_first_build = (
@@ -58,3 +61,32 @@ def calculate_deployment_frequency(
         "firstBuildDatetime": first_build_datetime.isoformat(),
         "timeBetweenLatestAndFirstBuild": time_between_builds_str,
     }
+
+
+def add_deployment(
+    deployment_frequency: DeploymentFrequency, timestamp: int
+) -> DeploymentFrequency:
+    deployment_datetime = jenkins_build_datetime({"timestamp": timestamp})
+    if deployment_frequency["numberOfDeployments"] == 0:
+        first_build_datetime = deployment_datetime
+    else:
+        latest_build_datetime = datetime.fromisoformat(
+            deployment_frequency["latestBuildDatetime"]
+        )
+        if deployment_datetime <= latest_build_datetime:
+            # already counted when the result was calculated
+            return deployment_frequency
+        first_build_datetime = datetime.fromisoformat(
+            deployment_frequency["firstBuildDatetime"]
+        )
+
+    return {
+        "numberOfDeployments": deployment_frequency["numberOfDeployments"] + 1,
+        "latestBuildDatetime": deployment_datetime.isoformat(),
+        "firstBuildDatetime": first_build_datetime.isoformat(),
+        "timeBetweenLatestAndFirstBuild": timedelta_to_string(
+            timedelta(
+                seconds=(deployment_datetime - first_build_datetime).total_seconds()
+            )
+        ),
+    }
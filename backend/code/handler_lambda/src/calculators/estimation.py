@@ -0,0 +1,270 @@
+from __future__ import annotations
+import math
+import os
+from bisect import bisect_right
+from random import Random
+from typing import Callable, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+from typing_extensions import TypedDict
+
+from ..helpers.deadline import Deadline
+
+# a stratum variance needs two values, so every stratum starts with this many
+# samples before the rest of the budget goes where it narrows the interval most
+ESTIMATE_MIN_STRATUM_SAMPLES = int(os.getenv("ESTIMATE_MIN_STRATUM_SAMPLES", "2"))
+ESTIMATE_TIME_STRATA = int(os.getenv("ESTIMATE_TIME_STRATA", "4"))
+
+# two sided student t quantiles at each confidence level by degrees of
+# freedom, read at the nearest tabulated row below, and the normal quantiles
+# past the table
+CONFIDENCE_LEVELS = (0.8, 0.9, 0.95, 0.99)
+T_QUANTILES = {
+    1: (3.078, 6.314, 12.706, 63.657),
+    2: (1.886, 2.920, 4.303, 9.925),
+    3: (1.638, 2.353, 3.182, 5.841),
+    4: (1.533, 2.132, 2.776, 4.604),
+    5: (1.476, 2.015, 2.571, 4.032),
+    6: (1.440, 1.943, 2.447, 3.707),
+    7: (1.415, 1.895, 2.365, 3.499),
+    8: (1.397, 1.860, 2.306, 3.355),
+    9: (1.383, 1.833, 2.262, 3.250),
+    10: (1.372, 1.812, 2.228, 3.169),
+    12: (1.356, 1.782, 2.179, 3.055),
+    15: (1.341, 1.753, 2.131, 2.947),
+    20: (1.325, 1.725, 2.086, 2.845),
+    30: (1.310, 1.697, 2.042, 2.750),
+}
+T_QUANTILE_DEGREES = sorted(T_QUANTILES)
+Z_QUANTILES = (1.2816, 1.6449, 1.96, 2.5758)
+
+TARGET_WIDTH = "target-width"
+BUDGET = "budget"
+EXHAUSTED = "exhausted"
+DEADLINE = "deadline"
+
+Unit = TypeVar("Unit")
+
+
+def time_stratum(timestamp: Optional[int], first: int, last: int) -> Optional[int]:
+    # equal width buckets between the oldest and newest timestamp
+    if timestamp is None:
+        return None
+    if last <= first:
+        return 0
+    return min(
+        (timestamp - first) * ESTIMATE_TIME_STRATA // (last - first),
+        ESTIMATE_TIME_STRATA - 1,
+    )
+
+
+def time_stratum_bounds(
+    stratum: Optional[int], first: int, last: int
+) -> Tuple[Optional[int], Optional[int]]:
+    if stratum is None:
+        return None, None
+    width = (last - first) / ESTIMATE_TIME_STRATA
+    return int(first + stratum * width), int(first + (stratum + 1) * width)
+
+
+def t_quantile(confidence: float, degrees_of_freedom: float) -> float:
+    level = CONFIDENCE_LEVELS.index(confidence)
+    if degrees_of_freedom > T_QUANTILE_DEGREES[-1]:
+        return Z_QUANTILES[level]
+    position = max(bisect_right(T_QUANTILE_DEGREES, degrees_of_freedom) - 1, 0)
+    return T_QUANTILES[T_QUANTILE_DEGREES[position]][level]
+
+
+class Stratum(Generic[Unit]):
+    def __init__(self, key: Hashable, units: List[Unit]):
+        self.key = key
+        self.remaining = units
+        self.population_size = len(units)
+        self.values: List[float] = []
+
+    @property
+    def sample_size(self) -> int:
+        return len(self.values)
+
+    def mean(self) -> float:
+        return sum(self.values) / len(self.values)
+
+    def variance(self) -> Optional[float]:
+        if len(self.values) < 2:
+            return None
+        mean = self.mean()
+        return sum((value - mean) ** 2 for value in self.values) / (
+            len(self.values) - 1
+        )
+
+
+class StratumSummary(TypedDict):
+    stratum: Hashable
+    populationSize: int
+    sampleSize: int
+    meanSeconds: Optional[float]
+
+
+class Estimate(TypedDict):
+    meanSeconds: Optional[float]
+    lowerSeconds: Optional[float]
+    upperSeconds: Optional[float]
+    widthSeconds: Optional[float]
+    sampleSize: int
+    populationSize: int
+    strata: List[StratumSummary]
+
+
+class StratifiedSampler(Generic[Unit]):
+    def __init__(self, units: List[Tuple[Hashable, Unit]], seed: Optional[int] = None):
+        random = Random(seed)
+        units_by_stratum: Dict[Hashable, List[Unit]] = {}
+        for key, unit in units:
+            units_by_stratum.setdefault(key, []).append(unit)
+        self.strata: List[Stratum[Unit]] = []
+        for key, stratum_units in units_by_stratum.items():
+            random.shuffle(stratum_units)
+            self.strata.append(Stratum(key, stratum_units))
+
+    @property
+    def population_size(self) -> int:
+        return sum(stratum.population_size for stratum in self.strata)
+
+    def pooled_variance(self) -> float:
+        values = [value for stratum in self.strata for value in stratum.values]
+        if len(values) < 2:
+            return 0.0
+        mean = sum(values) / len(values)
+        return sum((value - mean) ** 2 for value in values) / (len(values) - 1)
+
+    def next_stratum(self) -> Optional[Stratum[Unit]]:
+        open_strata = [stratum for stratum in self.strata if stratum.remaining]
+        if not open_strata:
+            return None
+
+        starting = [
+            stratum
+            for stratum in open_strata
+            if stratum.sample_size < ESTIMATE_MIN_STRATUM_SAMPLES
+        ]
+        if starting:
+            return max(starting, key=lambda stratum: stratum.population_size)
+
+        # the sample that shrinks W_h^2 S_h^2 (1/n_h - 1/N_h) the most, which
+        # converges on neyman allocation one sample at a time
+        population_size = self.population_size
+        pooled_variance = self.pooled_variance()
+
+        def reduction(stratum: Stratum[Unit]) -> float:
+            weight = stratum.population_size / population_size
+            variance = stratum.variance()
+            if variance is None:
+                variance = pooled_variance
+            sample_size = stratum.sample_size
+            return weight**2 * variance / (sample_size * (sample_size + 1))
+
+        return max(open_strata, key=reduction)
+
+    def estimate(self, confidence: float) -> Estimate:
+        sampled = [stratum for stratum in self.strata if stratum.sample_size]
+        population_size = sum(stratum.population_size for stratum in sampled)
+        summaries: List[StratumSummary] = [
+            {
+                "stratum": stratum.key,
+                "populationSize": stratum.population_size,
+                "sampleSize": stratum.sample_size,
+                "meanSeconds": stratum.mean() if stratum.sample_size else None,
+            }
+            for stratum in self.strata
+        ]
+        if not sampled:
+            return {
+                "meanSeconds": None,
+                "lowerSeconds": None,
+                "upperSeconds": None,
+                "widthSeconds": None,
+                "sampleSize": 0,
+                "populationSize": self.population_size,
+                "strata": summaries,
+            }
+
+        pooled_variance = self.pooled_variance()
+        pooled_degrees = max(sum(stratum.sample_size for stratum in sampled) - 1, 1)
+        mean = 0.0
+        variance_of_mean = 0.0
+        # welch-satterthwaite: a few samples per stratum leave far fewer
+        # degrees of freedom than the total sample size suggests
+        degrees_denominator = 0.0
+        for stratum in sampled:
+            weight = stratum.population_size / population_size
+            mean += weight * stratum.mean()
+            variance = stratum.variance()
+            degrees = stratum.sample_size - 1
+            if variance is None:
+                variance = pooled_variance
+                degrees = pooled_degrees
+            term = (
+                weight**2
+                * variance
+                * max(1 / stratum.sample_size - 1 / stratum.population_size, 0.0)
+            )
+            variance_of_mean += term
+            if term:
+                degrees_denominator += term**2 / degrees
+
+        degrees_of_freedom = (
+            variance_of_mean**2 / degrees_denominator
+            if degrees_denominator
+            else math.inf
+        )
+        half_width = t_quantile(confidence, degrees_of_freedom) * math.sqrt(
+            variance_of_mean
+        )
+        return {
+            "meanSeconds": mean,
+            "lowerSeconds": mean - half_width,
+            "upperSeconds": mean + half_width,
+            "widthSeconds": 2 * half_width,
+            "sampleSize": sum(stratum.sample_size for stratum in sampled),
+            "populationSize": self.population_size,
+            "strata": summaries,
+        }
+
+
+def refine_estimate(
+    sampler: StratifiedSampler[Unit],
+    measure: Callable[[Unit], Optional[float]],
+    spent: Callable[[], int],
+    deadline: Deadline,
+    confidence: float,
+    target_width: Optional[float],
+    budget: int,
+) -> Tuple[Estimate, str]:
+    # measure returns None for a unit that cannot be measured, which leaves
+    # the population instead of the sample
+    while True:
+        estimate = sampler.estimate(confidence)
+        every_stratum_started = all(
+            stratum.sample_size
+            >= min(ESTIMATE_MIN_STRATUM_SAMPLES, stratum.population_size)
+            for stratum in sampler.strata
+        )
+        if (
+            target_width is not None
+            and every_stratum_started
+            and estimate["widthSeconds"] is not None
+            and estimate["widthSeconds"] <= target_width
+        ):
+            return estimate, TARGET_WIDTH
+        if spent() >= budget:
+            return estimate, BUDGET
+        if deadline.expired():
+            return estimate, DEADLINE
+
+        stratum = sampler.next_stratum()
+        if stratum is None:
+            return estimate, EXHAUSTED
+
+        value = measure(stratum.remaining.pop())
+        if value is None:
+            stratum.population_size -= 1
+        else:
+            stratum.values.append(value)
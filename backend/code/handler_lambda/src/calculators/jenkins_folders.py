@@ -0,0 +1,199 @@
+from __future__ import annotations
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import unquote
+from aws_lambda_powertools import Logger
+
+from ..exceptions import FiveHundredError
+from ..globals import get_all_project_global_variables
+from ..helpers.network import APIS, make_request
+from ..helpers.scheduler import BACKGROUND, scheduled_as
+from ..models import JenkinsBuild, missing_key_error, parse_jenkins_builds
+
+logger = Logger(child=True)
+
+# "folder" reads every configured job sharing a parent in one request, "job"
+# keeps one allBuilds request per job
+JENKINS_FETCH_MODE = os.getenv("JENKINS_FETCH_MODE", "folder")
+JENKINS_FOLDER_REFRESH_SECONDS = int(os.getenv("JENKINS_FOLDER_REFRESH_SECONDS", "60"))
+# builds per job read back by a refresh after the first, full, read
+JENKINS_FOLDER_REFRESH_PAGE = int(os.getenv("JENKINS_FOLDER_REFRESH_PAGE", "200"))
+
+# the union of the fields every per-job build table reads
+FOLDER_BUILD_TREE = "number,timestamp,duration,result,url,actions[lastBuiltRevision[SHA1],causes[upstreamBuild,upstreamUrl]]"
+
+JENKINS_JOB_KEYS = (
+    "JENKINS_ST_JOB_NAME",
+    "JENKINS_AT_JOB_NAME",
+    "JENKINS_PR_JOB_NAME",
+    "JENKINS_JOB_NAME",
+)
+
+
+class FolderBuilds:
+    def __init__(self):
+        # replaced whole on every refresh, so readers never see it half merged
+        self.builds_by_job: Dict[str, List[JenkinsBuild]] = {}
+        self.fetched_at: Optional[float] = None
+        self.refresh_lock = threading.Lock()
+
+
+folder_builds: Dict[str, FolderBuilds] = {}
+folder_builds_lock = threading.Lock()
+
+
+def split_job_name(job_name: str) -> Tuple[str, str]:
+    # /job/folder/job/name is the job "name" in the folder /job/folder, and a
+    # top level /job/name sits in the root folder ""
+    folder, _, name = job_name.rstrip("/").rpartition("/job/")
+    return folder, unquote(name)
+
+
+def configured_jobs_by_folder() -> Dict[str, List[str]]:
+    jobs_by_folder: Dict[str, List[str]] = {}
+    for global_variables in get_all_project_global_variables():
+        for key in JENKINS_JOB_KEYS:
+            job_name = global_variables[key]
+            folder, _ = split_job_name(job_name)
+            jobs = jobs_by_folder.setdefault(folder, [])
+            if job_name not in jobs:
+                jobs.append(job_name)
+    return jobs_by_folder
+
+
+def iter_folder_jobs(folder_data: dict) -> Iterator[Tuple[str, list]]:
+    try:
+        jobs = folder_data["jobs"]
+    except KeyError as err:
+        raise missing_key_error(err)
+    for job in jobs:
+        # nested folders and views carry no builds of their own
+        if "allBuilds" in job:
+            yield job["name"], job["allBuilds"]
+
+
+def fetch_folder_builds(
+    folder: str, job_names: List[str], page: Optional[int] = None
+) -> Dict[str, List[JenkinsBuild]]:
+    build_range = f"{{0,{page}}}" if page else ""
+    folder_path = (
+        f"{folder}/api/json?tree=jobs[name,allBuilds[{FOLDER_BUILD_TREE}]{build_range}]"
+    )
+
+    logger.debug("making request for every job in the folder", path=folder_path)
+    folder_response = make_request(APIS.JENKINS, folder_path)
+
+    if not folder_response["success"]:
+        raise FiveHundredError(response=folder_response)
+
+    # only the configured jobs are parsed, one at a time, so the rest of the
+    # folder costs no more than its share of the response
+    job_names_by_name = {
+        split_job_name(job_name)[1]: job_name for job_name in job_names
+    }
+    builds_by_job = {}
+    for name, all_builds in iter_folder_jobs(folder_response["data"]):
+        job_name = job_names_by_name.get(name)
+        if job_name is not None:
+            builds_by_job[job_name] = parse_jenkins_builds(
+                {"allBuilds": all_builds}, ("timestamp",)
+            )
+    return builds_by_job
+
+
+def merge_newest_builds(
+    builds: List[JenkinsBuild], newest_builds: List[JenkinsBuild]
+) -> Optional[List[JenkinsBuild]]:
+    # None when the newest page does not reach back to every build that was
+    # still running, or to the one after the newest known, so a build would
+    # be missed or left unfinished
+    if not builds:
+        return newest_builds
+    if not newest_builds:
+        return builds
+    unfinished = [build.number for build in builds if build.result is None]
+    reach_back_to = min(unfinished + [max(build.number for build in builds) + 1])
+    if min(build.number for build in newest_builds) > reach_back_to:
+        return None
+    newest_numbers = {build.number for build in newest_builds}
+    return sorted(
+        newest_builds
+        + [build for build in builds if build.number not in newest_numbers],
+        key=lambda build: build.number,
+        reverse=True,
+    )
+
+
+def refresh_folder_builds(
+    folder: str, job_names: List[str], cached: FolderBuilds
+) -> Dict[str, List[JenkinsBuild]]:
+    # after the first read only the newest page of every job is fetched and
+    # merged in, so a refresh does not grow with the history of the folder
+    if cached.fetched_at is None or any(
+        job_name not in cached.builds_by_job for job_name in job_names
+    ):
+        return fetch_folder_builds(folder, job_names)
+
+    newest_builds_by_job = fetch_folder_builds(
+        folder, job_names, JENKINS_FOLDER_REFRESH_PAGE
+    )
+    builds_by_job = {}
+    for job_name in job_names:
+        builds = merge_newest_builds(
+            cached.builds_by_job[job_name], newest_builds_by_job.get(job_name, [])
+        )
+        if builds is None:
+            # more new builds than one page holds
+            return fetch_folder_builds(folder, job_names)
+        builds_by_job[job_name] = builds
+    return builds_by_job
+
+
+def is_stale(cached: FolderBuilds) -> bool:
+    return (
+        cached.fetched_at is None
+        or time.monotonic() - cached.fetched_at > JENKINS_FOLDER_REFRESH_SECONDS
+    )
+
+
+def get_folder_builds(job_name: str) -> Optional[List[JenkinsBuild]]:
+    # None sends the caller to its own per-job request: the folder mode is off,
+    # the job shares its folder with no other configured job, or the folder
+    # listing did not include it
+    if JENKINS_FETCH_MODE != "folder":
+        return None
+    folder, _ = split_job_name(job_name)
+    job_names = configured_jobs_by_folder().get(folder, [])
+    if len(job_names) < 2:
+        return None
+
+    with folder_builds_lock:
+        cached = folder_builds.setdefault(folder, FolderBuilds())
+
+    # only this folder is locked while its refresh waits on jenkins, and
+    # readers of a folder read before use it as it is rather than queue
+    if is_stale(cached) and cached.refresh_lock.acquire(
+        blocking=cached.fetched_at is None
+    ):
+        try:
+            if is_stale(cached):
+                try:
+                    with scheduled_as(priority=BACKGROUND):
+                        cached.builds_by_job = refresh_folder_builds(
+                            folder, job_names, cached
+                        )
+                except FiveHundredError as err:
+                    # remembered as empty so every job falls back until the
+                    # next refresh instead of retrying the folder once per job
+                    logger.warning(
+                        "folder request failed, falling back to per-job requests",
+                        folder=folder,
+                        error=err.message,
+                    )
+                    cached.builds_by_job = {}
+                cached.fetched_at = time.monotonic()
+        finally:
+            cached.refresh_lock.release()
+    return cached.builds_by_job.get(job_name)
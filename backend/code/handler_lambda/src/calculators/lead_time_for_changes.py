@@ -2,79 +2,31 @@ from __future__ import annotations
 import os
 from typing_extensions import TypedDict, NotRequired
 from aws_lambda_powertools import Logger
-from .shared import (
-    extract_parent_commits,
-    fetch_parent_commit_statuses,
-    get_last_build_of_parent_commit,
-    get_first_jenkins_build_of_current_pull_request,
-    get_at_jenkins_build_of_current_pull_request,
-    get_pr_jenkins_build_of_current_pull_request,
-)
-from ..helpers.datetime import jenkins_build_datetime
-from ..exceptions import JenkinsHistoryLimit
+from .shared import resolve_pipeline_lineage
+from ..models import PullRequest
 
 logger = Logger(child=True)
 
 
-def calculate_lead_time_for_changes(global_variables, pull_request) -> int:
-    (
-        parent_commit_hash,
-        parent_commit_hash_url,
-        statuses_of_parent_commit_url,
-    ) = extract_parent_commits(global_variables, pull_request)
+class LeadTimeRecord(TypedDict):
+    pullRequestId: int
+    mergeCommit: str
+    stBuildNumber: int
+    atBuildNumber: int
+    stStartTimestamp: int
+    productionFinishTimestamp: int
+    durationSeconds: float
 
-    last_build_of_parent_commit_display_url = fetch_parent_commit_statuses(
-        global_variables,
-        parent_commit_hash,
-        parent_commit_hash_url,
-        statuses_of_parent_commit_url,
-    )
 
-    if "master" in last_build_of_parent_commit_display_url:
-        raise JenkinsHistoryLimit()
+def calculate_lead_time_for_changes(
+    global_variables, pull_request: PullRequest
+) -> float:
+    return resolve_lead_time_record(global_variables, pull_request)["durationSeconds"]
 
-    first_jenkins_build_of_current_pull_request_url = get_last_build_of_parent_commit(
-        global_variables, last_build_of_parent_commit_display_url
-    )
 
-    (
-        first_jenkins_build_of_current_pull_request_id,
-        first_jenkins_build_of_current_pull_request_timestamp,
-    ) = get_first_jenkins_build_of_current_pull_request(
-        global_variables, first_jenkins_build_of_current_pull_request_url
-    )
-
-    first_jenkins_build_of_current_pull_request_datetime = jenkins_build_datetime(
-        {"timestamp": first_jenkins_build_of_current_pull_request_timestamp}
-    )
-
-    first_jenkins_at_build_of_current_pull_request_id = (
-        get_at_jenkins_build_of_current_pull_request(
-            global_variables, first_jenkins_build_of_current_pull_request_id
-        )
-    )
-
-    (
-        first_jenkins_pr_build_of_current_pull_request_duration_seconds,
-        first_jenkins_pr_build_of_current_pull_request_start_timestamp,
-    ) = get_pr_jenkins_build_of_current_pull_request(
-        global_variables, first_jenkins_at_build_of_current_pull_request_id
-    )
-
-    # eighth section
-
-    first_jenkins_pr_build_of_current_pull_request_finish_timestamp = (
-        first_jenkins_pr_build_of_current_pull_request_start_timestamp
-        + first_jenkins_pr_build_of_current_pull_request_duration_seconds
-    )
-
-    first_jenkins_pr_build_of_current_pull_request_finish_datetime = jenkins_build_datetime(
-        {"timestamp": first_jenkins_pr_build_of_current_pull_request_finish_timestamp}
-    )
-
-    duration = (
-        first_jenkins_pr_build_of_current_pull_request_finish_datetime
-        - first_jenkins_build_of_current_pull_request_datetime
-    )
-
-    return duration.total_seconds()
+def resolve_lead_time_record(
+    global_variables, pull_request: PullRequest
+) -> LeadTimeRecord:
+    return resolve_pipeline_lineage(
+        global_variables, pull_request
+    ).to_lead_time_record()
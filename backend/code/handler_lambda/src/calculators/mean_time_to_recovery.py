@@ -1,37 +1,47 @@
+from __future__ import annotations
+from typing import List, Optional, Tuple
+from typing_extensions import TypedDict
 from aws_lambda_powertools import Logger
-from .shared import (
-    extract_parent_commits,
-    fetch_parent_commit_statuses,
-    get_last_build_of_parent_commit,
-    get_first_jenkins_build_of_current_pull_request,
-    get_at_jenkins_build_of_current_pull_request,
-    get_pr_jenkins_build_of_current_pull_request,
-)
-from ..exceptions import FiveHundredError, JenkinsHistoryLimit
+from .shared import resolve_pipeline_lineage
+from ..models import PullRequest
 
 logger = Logger(child=True)
 
 
-def filter_only_hotfix_pull_requests(pull_requests):
-    max_pull_requests_count = len(pull_requests) + 1
-    filtered_pull_request_indexes = []
+class RecoveryRecord(TypedDict):
+    pullRequestId: int
+    previousPullRequestId: int
+    incidentStartTimestamp: int
+    recoveryFinishTimestamp: int
+    durationSeconds: float
 
-    for index, pull_request in enumerate(pull_requests):
-        try:
-            if (
-                index < max_pull_requests_count
-                and "hotfix" in pull_request["source"]["branch"]["name"]
-            ):
-                filtered_pull_request_indexes.append(index)
-        except KeyError as err:
-            raise FiveHundredError(
-                message=f"Key {str(err)} cannot be found in the dict"
-            )
 
-    return filtered_pull_request_indexes
+class OpenIncident(TypedDict):
+    # the newest deployment counted so far, which the next one recovers from
+    pullRequestId: int
+    finishTimestamp: int
 
 
-def filter_out_hotfix_pull_requests(pull_requests):
+class RecoveryAggregate(TypedDict):
+    # running totals over every merged pull request folded in so far, tagged
+    # with the newest one so later merges are folded in without a rescan
+    newestPullRequestId: Optional[int]
+    openIncident: Optional[OpenIncident]
+    # whole milliseconds, so that summing forever never drifts
+    recoveryMillisecondsSum: int
+    recoveryCount: int
+    skipped: int
+
+
+def filter_only_hotfix_pull_requests(pull_requests: List[PullRequest]):
+    return [
+        index
+        for index, pull_request in enumerate(pull_requests)
+        if pull_request.is_hotfix
+    ]
+
+
+def filter_out_hotfix_pull_requests(pull_requests: List[PullRequest]):
     filtered_pull_request_indexes = filter_only_hotfix_pull_requests(pull_requests)
 
     filtered_pull_request_with_non_hotfixes = []
@@ -46,7 +56,8 @@ def filter_out_hotfix_pull_requests(pull_requests):
                     pull_requests[higher_pull_request_index]
                 )
         else:
-            if pull_request_index < len(pull_requests):
+            # a window can end on a hotfix, leaving nothing merged before it
+            if higher_pull_request_index < len(pull_requests):
                 filtered_pull_request_with_non_hotfixes.append(
                     pull_requests[higher_pull_request_index]
                 )
@@ -54,50 +65,95 @@ def filter_out_hotfix_pull_requests(pull_requests):
     return filtered_pull_request_with_non_hotfixes
 
 
-def get_timestamp_of_pr_build_of_pull_request(global_variables, pull_request):
-    (
-        parent_commit_hash,
-        parent_commit_hash_url,
-        statuses_of_parent_commit_url,
-    ) = extract_parent_commits(global_variables, pull_request)
-
-    last_build_of_parent_commit_display_url = fetch_parent_commit_statuses(
-        global_variables,
-        parent_commit_hash,
-        parent_commit_hash_url,
-        statuses_of_parent_commit_url,
+def get_timestamp_of_pr_build_of_pull_request(
+    global_variables, pull_request: PullRequest
+) -> int:
+    return resolve_pipeline_lineage(
+        global_variables, pull_request
+    ).production_finish_timestamp
+
+
+def build_recovery_record(
+    pull_request_id,
+    finish_timestamp,
+    previous_pull_request_id,
+    previous_finish_timestamp,
+) -> RecoveryRecord:
+    # pull requests arrive newest first, so the previously processed one is
+    # the later deployment that recovered from this one
+    return {
+        "pullRequestId": previous_pull_request_id,
+        "previousPullRequestId": pull_request_id,
+        "incidentStartTimestamp": finish_timestamp,
+        "recoveryFinishTimestamp": previous_finish_timestamp,
+        "durationSeconds": (previous_finish_timestamp - finish_timestamp) / 1000.0,
+    }
+
+
+def empty_recovery_aggregate() -> RecoveryAggregate:
+    return {
+        "newestPullRequestId": None,
+        "openIncident": None,
+        "recoveryMillisecondsSum": 0,
+        "recoveryCount": 0,
+        "skipped": 0,
+    }
+
+
+def is_recovery_candidate(
+    pull_request: PullRequest, newer_pull_request: Optional[PullRequest]
+) -> bool:
+    # the same pull requests filter_out_hotfix_pull_requests keeps: every
+    # hotfix and the pull request merged just before it
+    return pull_request.is_hotfix or (
+        newer_pull_request is not None and newer_pull_request.is_hotfix
     )
 
-    if "master" in last_build_of_parent_commit_display_url:
-        raise JenkinsHistoryLimit()
 
-    first_jenkins_build_of_current_pull_request_url = get_last_build_of_parent_commit(
-        global_variables, last_build_of_parent_commit_display_url
+def pass_over_pull_request(
+    recovery_aggregate: RecoveryAggregate, pull_request_id: int, skipped: bool
+) -> RecoveryAggregate:
+    return {
+        **recovery_aggregate,
+        "newestPullRequestId": pull_request_id,
+        "skipped": recovery_aggregate["skipped"] + int(skipped),
+    }
+
+
+def add_finished_pull_request(
+    recovery_aggregate: RecoveryAggregate, pull_request_id: int, finish_timestamp: int
+) -> Tuple[RecoveryAggregate, Optional[RecoveryRecord]]:
+    open_incident = recovery_aggregate["openIncident"]
+    folded: RecoveryAggregate = {
+        **recovery_aggregate,
+        "newestPullRequestId": pull_request_id,
+        "openIncident": {
+            "pullRequestId": pull_request_id,
+            "finishTimestamp": finish_timestamp,
+        },
+    }
+    if open_incident is None:
+        return folded, None
+
+    folded["recoveryMillisecondsSum"] += (
+        finish_timestamp - open_incident["finishTimestamp"]
     )
-
-    (
-        first_jenkins_build_of_current_pull_request_id,
-        _,
-    ) = get_first_jenkins_build_of_current_pull_request(
-        global_variables, first_jenkins_build_of_current_pull_request_url
+    folded["recoveryCount"] += 1
+    return folded, build_recovery_record(
+        open_incident["pullRequestId"],
+        open_incident["finishTimestamp"],
+        pull_request_id,
+        finish_timestamp,
     )
 
-    first_jenkins_at_build_of_current_pull_request_id = (
-        get_at_jenkins_build_of_current_pull_request(
-            global_variables, first_jenkins_build_of_current_pull_request_id
-        )
-    )
 
-    (
-        first_jenkins_pr_build_of_current_pull_request_duration_seconds,
-        first_jenkins_pr_build_of_current_pull_request_start_timestamp,
-    ) = get_pr_jenkins_build_of_current_pull_request(
-        global_variables, first_jenkins_at_build_of_current_pull_request_id
+def calculate_mean_time_to_recovery_seconds(
+    recovery_aggregate: RecoveryAggregate,
+) -> Optional[float]:
+    if not recovery_aggregate["recoveryCount"]:
+        return None
+    return (
+        recovery_aggregate["recoveryMillisecondsSum"]
+        / 1000.0
+        / recovery_aggregate["recoveryCount"]
     )
-
-    first_jenkins_pr_build_of_current_pull_request_finish_timestamp = (
-        first_jenkins_pr_build_of_current_pull_request_start_timestamp
-        + first_jenkins_pr_build_of_current_pull_request_duration_seconds
-    )
-
-    return first_jenkins_pr_build_of_current_pull_request_finish_timestamp
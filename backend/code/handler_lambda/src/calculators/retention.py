@@ -0,0 +1,101 @@
+from __future__ import annotations
+import os
+from typing import List, Optional
+from typing_extensions import TypedDict
+from aws_lambda_powertools import Logger
+
+from ..exceptions import FiveHundredError
+from ..helpers.datetime import bitbucket_datetime_to_jenkins_timestamp
+from ..helpers.network import APIS, make_request
+from ..models import JenkinsBuild, PullRequest, missing_key_error
+from ..stores.cache import result_cache
+from .shared import get_merged_pull_requests_since
+
+logger = Logger(child=True)
+
+# jenkins only ever discards builds from the old end, so a stale boundary is
+# merely conservative
+RETENTION_BOUNDARY_TTL_SECONDS = float(
+    os.getenv("RETENTION_BOUNDARY_TTL_SECONDS", "3600")
+)
+
+
+class RetentionBoundary(TypedDict):
+    # the oldest build jenkins still keeps, both None for a job with no builds
+    number: Optional[int]
+    timestamp: Optional[int]
+
+
+def fetch_retention_boundary(job_name: str) -> RetentionBoundary:
+    first_build_path = f"{job_name}/api/json?tree=firstBuild[number,timestamp]"
+
+    logger.debug("making request for the oldest retained build", path=first_build_path)
+    first_build_response = make_request(APIS.JENKINS, first_build_path)
+
+    if not first_build_response["success"]:
+        raise FiveHundredError(response=first_build_response)
+
+    try:
+        first_build = first_build_response["data"]["firstBuild"]
+    except KeyError as err:
+        raise missing_key_error(err)
+    if not first_build:
+        return {"number": None, "timestamp": None}
+
+    build = JenkinsBuild.from_jenkins(first_build)
+    return {"number": build.number, "timestamp": build.timestamp}
+
+
+def get_retention_boundary(job_name: str) -> RetentionBoundary:
+    cache_key = f"retention-boundary:{job_name}"
+    retention_boundary = result_cache.get(cache_key)
+    if retention_boundary is None:
+        retention_boundary = fetch_retention_boundary(job_name)
+        result_cache.set(cache_key, retention_boundary, RETENTION_BOUNDARY_TTL_SECONDS)
+    return retention_boundary
+
+
+def drop_pull_requests_before_retention(
+    global_variables, pull_requests: List[PullRequest]
+) -> List[PullRequest]:
+    # a lineage starts at the first st build after the merge, so a pull request
+    # merged before the oldest retained st build can only end in
+    # JenkinsHistoryLimit, after several wasted round trips
+    retention_timestamp = get_retention_boundary(
+        global_variables["JENKINS_ST_JOB_NAME"]
+    )["timestamp"]
+    if retention_timestamp is None:
+        return pull_requests
+
+    retained_pull_requests = [
+        pull_request
+        for pull_request in pull_requests
+        if pull_request.merge_commit_date is None
+        or bitbucket_datetime_to_jenkins_timestamp(pull_request.merge_commit_date)
+        >= retention_timestamp
+    ]
+    if len(retained_pull_requests) != len(pull_requests):
+        logger.debug(
+            "dropped pull requests merged before the jenkins retention boundary",
+            repoSlug=global_variables["BITBUCKET_REPO_SLUG"],
+            retentionTimestamp=retention_timestamp,
+            dropped=len(pull_requests) - len(retained_pull_requests),
+        )
+    return retained_pull_requests
+
+
+def get_retained_pull_requests_since(
+    global_variables, since: Optional[int]
+) -> List[PullRequest]:
+    # paging back also stops at the retention boundary, since nothing merged
+    # before it can resolve
+    retention_timestamp = get_retention_boundary(
+        global_variables["JENKINS_ST_JOB_NAME"]
+    )["timestamp"]
+    if retention_timestamp is not None:
+        since = (
+            retention_timestamp if since is None else max(since, retention_timestamp)
+        )
+    return drop_pull_requests_before_retention(
+        global_variables, get_merged_pull_requests_since(global_variables, since)
+    )
@@ -1,24 +1,48 @@
 import os
 import json
+import time
+from typing import Iterator, List, Optional, Tuple
 from aws_lambda_powertools import Logger
 from ..helpers.network import APIS, make_request, RequestResponse
 
 logger = Logger(child=True)
 
 BITBUCKET_WORKSPACE = os.getenv("BITBUCKET_WORKSPACE", "workspace")
-from ..exceptions import FiveHundredError, JenkinsHistoryLimit
-
-
-def extract_status_of_parent_commit_url(pull_request):
-    parent_commit_hash = pull_request["merge_commit"]["parents"][0]["hash"]
-    parent_commit_hash_url = pull_request["merge_commit"]["parents"][0]["links"][
-        "html"
-    ]["href"]
-    statuses_of_parent_commit_url = pull_request["merge_commit"]["parents"][0]["links"][
-        "statuses"
-    ]["href"]
-
-    return parent_commit_hash, parent_commit_hash_url, statuses_of_parent_commit_url
+ST_BUILD_RESOLVER = os.getenv("ST_BUILD_RESOLVER", "jenkins-index")
+UPSTREAM_BUILD_RESOLVER = os.getenv("UPSTREAM_BUILD_RESOLVER", "mapped-index")
+# a lineage still missing a later build this long after its merge will not get
+# one; before that the pull request is most likely on its way to production
+PIPELINE_SETTLE_SECONDS = int(os.getenv("PIPELINE_SETTLE_SECONDS", "86400"))
+# merged pull requests are read a page of this many at a time
+PULL_REQUEST_PAGE_LENGTH = 50
+PULL_REQUEST_FIELDS = "values.source.branch,values.id,values.title,values.state,values.merge_commit.hash,values.merge_commit.date,values.merge_commit.links.self.href,values.merge_commit.links.statuses.href,values.merge_commit.parents,values.merge_commit.parents.hash,values.merge_commit.parents.date,values.merge_commit.parents.links.self.href,values.merge_commit.parents.links.html.href,values.merge_commit.parents.links.statuses.href"
+from ..exceptions import FiveHundredError, JenkinsHistoryLimit, UnresolvableLineage
+from ..models import (
+    JenkinsBuild,
+    PipelineLineage,
+    PullRequest,
+    missing_key_error,
+    parse_pull_requests,
+)
+from .commit_build_index import resolve_first_st_build_from_index
+from .upstream_build_index import (
+    resolve_at_build_from_index,
+    resolve_pr_build_from_index,
+)
+from ..helpers.datetime import bitbucket_datetime_to_jenkins_timestamp
+from ..helpers.pagination import TimeWindow, is_windowed
+from ..stores.series import MERGE_SERIES, get_series_index
+from ..stores.unresolvable import (
+    MERGE_COMMIT_WITHOUT_PARENTS,
+    IN_FLIGHT_REASONS,
+    NO_GREEN_AT_BUILD,
+    PARENT_COMMIT_WITHOUT_STATUSES,
+    ST_BUILD_WITHOUT_NEXT_BUILD,
+    UNEXPECTED_AT_BUILD,
+    UNEXPECTED_PRODUCTION_BUILD,
+    get_unresolvable,
+    record_unresolvable,
+)
 
 
 def get_num_of_pull_requests(global_variables):
@@ -51,9 +75,56 @@ def get_num_of_pull_requests(global_variables):
     return num_of_bitbucket_pull_requests
 
 
-def get_all_pull_requests(global_variables, number_of_pull_requests):
-    pagelen = min(50, number_of_pull_requests)
-    all_pull_requests_url = f"/repositories/{BITBUCKET_WORKSPACE}/{global_variables['BITBUCKET_REPO_SLUG']}/pullrequests?state=MERGED&pagelen={pagelen}&fields=values.source.branch,values.id,values.title,values.state,values.merge_commit.hash,values.merge_commit.date,values.merge_commit.links.self.href,values.merge_commit.links.statuses.href,values.merge_commit.parents,values.merge_commit.parents.hash,values.merge_commit.parents.date,values.merge_commit.parents.links.self.href,values.merge_commit.parents.links.html.href,values.merge_commit.parents.links.statuses.href"
+def get_latest_pull_request_id(global_variables) -> Optional[int]:
+    # a single id, cheap enough to check before any metric is recomputed
+    latest_pull_request_url = f"/repositories/{BITBUCKET_WORKSPACE}/{global_variables['BITBUCKET_REPO_SLUG']}/pullrequests?state=MERGED&pagelen=1&fields=values.id"
+
+    latest_pull_request_response = make_request(APIS.BITBUCKET, latest_pull_request_url)
+
+    if not latest_pull_request_response["success"]:
+        logger.error(
+            "bitbucket request errored out",
+            url=latest_pull_request_url,
+            response=latest_pull_request_response,
+        )
+        raise FiveHundredError(response=latest_pull_request_response)
+
+    try:
+        values = latest_pull_request_response["data"]["values"]
+        return int(values[0]["id"]) if values else None
+    except KeyError as err:
+        raise missing_key_error(err)
+
+
+def get_last_completed_build_number(job_name: str) -> Optional[int]:
+    # builds only change until they complete, so the last completed number
+    # moves whenever anything read from the job's history could have changed
+    last_completed_build_url = f"{job_name}/api/json?tree=lastCompletedBuild[number]"
+
+    last_completed_build_response = make_request(APIS.JENKINS, last_completed_build_url)
+
+    if not last_completed_build_response["success"]:
+        logger.error(
+            "jenkins request errored out",
+            url=last_completed_build_url,
+            response=last_completed_build_response,
+        )
+        raise FiveHundredError(response=last_completed_build_response)
+
+    try:
+        last_completed_build = last_completed_build_response["data"][
+            "lastCompletedBuild"
+        ]
+        return int(last_completed_build["number"]) if last_completed_build else None
+    except KeyError as err:
+        raise missing_key_error(err)
+
+
+def get_all_pull_requests(
+    global_variables, number_of_pull_requests
+) -> List[PullRequest]:
+    pagelen = min(PULL_REQUEST_PAGE_LENGTH, number_of_pull_requests)
+    all_pull_requests_url = f"/repositories/{BITBUCKET_WORKSPACE}/{global_variables['BITBUCKET_REPO_SLUG']}/pullrequests?state=MERGED&pagelen={pagelen}&fields={PULL_REQUEST_FIELDS}"
 
     all_pull_request_response = make_request(APIS.BITBUCKET, all_pull_requests_url)
 
@@ -70,24 +141,142 @@ def get_all_pull_requests(global_variables, number_of_pull_requests):
         response=all_pull_request_response,
     )
 
-    return all_pull_request_response["data"]
+    return parse_pull_requests(all_pull_request_response["data"])
 
 
-def extract_parent_commits(global_variables, pull_request):
-    try:
-        (
-            parent_commit_hash,
-            parent_commit_hash_url,
-            statuses_of_parent_commit_url,
-        ) = extract_status_of_parent_commit_url(pull_request)
-    except KeyError as err:
-        raise FiveHundredError(message=f"Key {str(err)} cannot be found in the dict")
-    except IndexError as err:
-        raise FiveHundredError(
-            f"Unexpected number of merge commits parents for PR {pull_request.get('id', None)} in {global_variables['BITBUCKET_REPO_SLUG']}"
+def iter_merged_pull_request_pages(global_variables) -> Iterator[List[PullRequest]]:
+    # merged pull requests come newest merge first, a page per request until
+    # the caller stops asking or the history runs out
+    page = 1
+    while True:
+        pull_requests_page_url = f"/repositories/{BITBUCKET_WORKSPACE}/{global_variables['BITBUCKET_REPO_SLUG']}/pullrequests?state=MERGED&pagelen={PULL_REQUEST_PAGE_LENGTH}&page={page}&fields=next,{PULL_REQUEST_FIELDS}"
+
+        pull_requests_page_response = make_request(
+            APIS.BITBUCKET, pull_requests_page_url
         )
 
-    return parent_commit_hash, parent_commit_hash_url, statuses_of_parent_commit_url
+        if not pull_requests_page_response["success"]:
+            logger.error(
+                "bitbucket request errored out",
+                url=pull_requests_page_url,
+                response=pull_requests_page_response,
+            )
+            raise FiveHundredError(response=pull_requests_page_response)
+
+        yield parse_pull_requests(pull_requests_page_response["data"])
+
+        if "next" not in pull_requests_page_response["data"]:
+            return
+        page += 1
+
+
+def get_pull_requests_after(
+    global_variables, pull_request_id: int
+) -> Optional[List[PullRequest]]:
+    # merged pull requests come newest merge first, and an older id can merge
+    # after a newer one, so pages are read until the pull request itself comes
+    # up; None when it never does, and the caller starts over
+    pull_requests: List[PullRequest] = []
+    seen_ids = set()
+    for page in iter_merged_pull_request_pages(global_variables):
+        for pull_request in page:
+            if pull_request.id == pull_request_id:
+                return pull_requests
+            # a merge between two page requests shifts the later page by one
+            if pull_request.id not in seen_ids:
+                seen_ids.add(pull_request.id)
+                pull_requests.append(pull_request)
+    return None
+
+
+def merge_timestamp_of(pull_request: PullRequest) -> int:
+    return bitbucket_datetime_to_jenkins_timestamp(pull_request.merge_commit_date)
+
+
+def is_settled(pull_request: PullRequest) -> bool:
+    return merge_timestamp_of(pull_request) <= (
+        (time.time() - PIPELINE_SETTLE_SECONDS) * 1000
+    )
+
+
+def extend_pull_requests_back_to(
+    global_variables, pull_requests: List[PullRequest], since: Optional[int]
+) -> List[PullRequest]:
+    # the pull requests passed in are the newest few; when they do not reach
+    # back to since, older pages are read until one does
+    if since is not None and any(
+        merge_timestamp_of(pull_request) < since for pull_request in pull_requests
+    ):
+        return pull_requests
+
+    pull_requests = list(pull_requests)
+    seen_ids = {pull_request.id for pull_request in pull_requests}
+    for page in iter_merged_pull_request_pages(global_variables):
+        for pull_request in page:
+            if pull_request.id not in seen_ids:
+                seen_ids.add(pull_request.id)
+                pull_requests.append(pull_request)
+        if since is not None and any(
+            merge_timestamp_of(pull_request) < since for pull_request in page
+        ):
+            break
+    return pull_requests
+
+
+def get_merged_pull_requests_since(
+    global_variables, since: Optional[int]
+) -> List[PullRequest]:
+    # every page back to since, or the whole merged history without one
+    return extend_pull_requests_back_to(global_variables, [], since)
+
+
+def filter_pull_requests_to_window(
+    global_variables,
+    pull_requests: List[PullRequest],
+    time_window: Optional[TimeWindow],
+) -> List[PullRequest]:
+    if not is_windowed(time_window):
+        return pull_requests
+
+    pull_requests = extend_pull_requests_back_to(
+        global_variables, pull_requests, time_window["since"]
+    )
+    merge_index = get_series_index(
+        MERGE_SERIES, global_variables["BITBUCKET_REPO_SLUG"]
+    )
+    for pull_request in pull_requests:
+        if pull_request.id in merge_index:
+            continue
+        merge_timestamp = merge_timestamp_of(pull_request)
+        merge_index.add(
+            pull_request.id,
+            merge_timestamp,
+            {"pullRequestId": pull_request.id, "mergeTimestamp": merge_timestamp},
+        )
+
+    windowed_pull_request_ids = {
+        record["pullRequestId"]
+        for record in merge_index.window(time_window["since"], time_window["until"])
+    }
+    return [
+        pull_request
+        for pull_request in pull_requests
+        if pull_request.id in windowed_pull_request_ids
+    ]
+
+
+def extract_parent_commits(global_variables, pull_request: PullRequest):
+    if pull_request.parent_count == 0:
+        raise UnresolvableLineage(
+            MERGE_COMMIT_WITHOUT_PARENTS,
+            f"Unexpected number of merge commits parents for PR {pull_request.id} in {global_variables['BITBUCKET_REPO_SLUG']}",
+        )
+
+    return (
+        pull_request.parent_commit_hash,
+        pull_request.parent_commit_html_url,
+        pull_request.parent_commit_statuses_url,
+    )
 
 
 def fetch_last_build_of_parent_commit_display_url(
@@ -141,8 +330,9 @@ def fetch_parent_commit_statuses(
     except KeyError as err:
         raise FiveHundredError(message=f"Key {str(err)} cannot be found in the dict")
     except IndexError as err:
-        raise FiveHundredError(
-            f"Unexpected number of builds for for commit {parent_commit_hash} in {global_variables['BITBUCKET_REPO_SLUG']}. Visit {parent_commit_hash_url}"
+        raise UnresolvableLineage(
+            PARENT_COMMIT_WITHOUT_STATUSES,
+            f"Unexpected number of builds for for commit {parent_commit_hash} in {global_variables['BITBUCKET_REPO_SLUG']}. Visit {parent_commit_hash_url}",
         )
 
     return last_build_of_parent_commit_display_url
@@ -178,8 +368,10 @@ def fetch_first_jenkins_build_of_current_pull_request_url(
 
 def extract_first_jenkins_build_of_current_pull_request_url(
     last_build_of_parent_commit_response: RequestResponse,
-):
-    return last_build_of_parent_commit_response["data"]["nextBuild"]["url"]
+) -> Optional[str]:
+    return JenkinsBuild.from_jenkins(
+        last_build_of_parent_commit_response["data"]
+    ).next_build_url
 
 
 def get_last_build_of_parent_commit(
@@ -191,17 +383,15 @@ def get_last_build_of_parent_commit(
         )
     )
 
-    try:
-        first_jenkins_build_of_current_pull_request_url = (
-            extract_first_jenkins_build_of_current_pull_request_url(
-                last_build_of_parent_commit_response
-            )
+    first_jenkins_build_of_current_pull_request_url = (
+        extract_first_jenkins_build_of_current_pull_request_url(
+            last_build_of_parent_commit_response
         )
-    except KeyError as err:
-        raise FiveHundredError(message=f"Key {str(err)} cannot be found in the dict")
-    except IndexError as err:
-        raise FiveHundredError(
-            f"Unexpected data from {global_variables['BITBUCKET_REPO_SLUG']} staging job. Visit {last_build_of_parent_commit_display_url}"
+    )
+    if first_jenkins_build_of_current_pull_request_url is None:
+        raise UnresolvableLineage(
+            ST_BUILD_WITHOUT_NEXT_BUILD,
+            f"No st build followed {last_build_of_parent_commit_display_url} in {global_variables['BITBUCKET_REPO_SLUG']}",
         )
 
     return first_jenkins_build_of_current_pull_request_url
@@ -210,7 +400,7 @@ def get_last_build_of_parent_commit(
 def fetch_first_jenkins_build_of_current_pull_request(
     global_variables,
     first_jenkins_build_of_current_pull_request_url: str,
-):
+) -> JenkinsBuild:
     first_jenkins_build_of_current_pull_request_apis_url = f"{first_jenkins_build_of_current_pull_request_url}api/json?tree=displayName,result,number,id,fullDisplayName,duration,timestamp,url,inProgress,nextBuild[number,url]"
 
     logger.debug(
@@ -224,99 +414,95 @@ def fetch_first_jenkins_build_of_current_pull_request(
     if not first_jenkins_build_of_current_pull_request["success"]:
         raise FiveHundredError(response=first_jenkins_build_of_current_pull_request)
 
-    green_build = False
-
-    try:
-        build_result = first_jenkins_build_of_current_pull_request["data"]["result"]
-        build_number = first_jenkins_build_of_current_pull_request["data"]["number"]
-    except KeyError as err:
-        raise FiveHundredError(message=f"Key {str(err)} cannot be found in the dict")
-
-    if build_result != "SUCCESS":
-        while green_build != True:
-            jenkins_build_of_current_pull_request_apis_retry_url = f"{global_variables['JENKINS_ST_JOB_NAME']}/{str(int(build_number) + 1)}/api/json?tree=displayName,result,number,id,fullDisplayName,duration,timestamp,url,inProgress,nextBuild[number,url]"
+    first_jenkins_build = JenkinsBuild.from_jenkins(
+        first_jenkins_build_of_current_pull_request["data"], ("timestamp",)
+    )
 
-            first_jenkins_build_of_current_pull_request = make_request(
-                APIS.JENKINS, jenkins_build_of_current_pull_request_apis_retry_url
-            )
+    while first_jenkins_build.result != "SUCCESS":
+        jenkins_build_of_current_pull_request_apis_retry_url = f"{global_variables['JENKINS_ST_JOB_NAME']}/{str(first_jenkins_build.number + 1)}/api/json?tree=displayName,result,number,id,fullDisplayName,duration,timestamp,url,inProgress,nextBuild[number,url]"
 
-            if not first_jenkins_build_of_current_pull_request["success"]:
-                raise FiveHundredError(
-                    response=first_jenkins_build_of_current_pull_request
-                )
+        first_jenkins_build_of_current_pull_request = make_request(
+            APIS.JENKINS, jenkins_build_of_current_pull_request_apis_retry_url
+        )
 
-            try:
-                build_result = first_jenkins_build_of_current_pull_request["data"][
-                    "result"
-                ]
-                build_number = first_jenkins_build_of_current_pull_request["data"][
-                    "number"
-                ]
-            except KeyError as err:
-                raise FiveHundredError(
-                    message=f"Key {str(err)} cannot be found in the dict"
-                )
+        if not first_jenkins_build_of_current_pull_request["success"]:
+            raise FiveHundredError(response=first_jenkins_build_of_current_pull_request)
 
-            green_build = build_result == "SUCCESS"
+        first_jenkins_build = JenkinsBuild.from_jenkins(
+            first_jenkins_build_of_current_pull_request["data"], ("timestamp",)
+        )
 
     logger.debug(
         "successful request to jenkins to get the the id of the first st build of the commit from the most recent PR",
         url=first_jenkins_build_of_current_pull_request_apis_url,
         response=first_jenkins_build_of_current_pull_request,
     )
-    return (
-        first_jenkins_build_of_current_pull_request_apis_url,
-        first_jenkins_build_of_current_pull_request,
-    )
+    return first_jenkins_build
 
 
-def extract_first_jenkins_build_of_current_pull_request(
-    first_jenkins_build_of_current_pull_request: RequestResponse,
+def get_first_jenkins_build_of_current_pull_request(
+    global_variables,
+    first_jenkins_build_of_current_pull_request_url,
 ):
+    first_jenkins_build_of_current_pull_request = (
+        fetch_first_jenkins_build_of_current_pull_request(
+            global_variables, first_jenkins_build_of_current_pull_request_url
+        )
+    )
     first_jenkins_build_of_current_pull_request_id = (
-        first_jenkins_build_of_current_pull_request["data"]["id"]
+        first_jenkins_build_of_current_pull_request.number
     )
     first_jenkins_build_of_current_pull_request_timestamp = (
-        first_jenkins_build_of_current_pull_request["data"]["timestamp"]
+        first_jenkins_build_of_current_pull_request.timestamp
     )
+
+    if first_jenkins_build_of_current_pull_request_id == 1:
+        logger.info("line 320")
+        raise JenkinsHistoryLimit()
+
     return (
         first_jenkins_build_of_current_pull_request_id,
         first_jenkins_build_of_current_pull_request_timestamp,
     )
 
 
-def get_first_jenkins_build_of_current_pull_request(
-    global_variables,
-    first_jenkins_build_of_current_pull_request_url,
-):
+def resolve_first_st_build_of_pull_request(global_variables, pull_request: PullRequest):
     (
-        first_jenkins_build_of_current_pull_request_apis_url,
-        first_jenkins_build_of_current_pull_request,
-    ) = fetch_first_jenkins_build_of_current_pull_request(
-        global_variables, first_jenkins_build_of_current_pull_request_url
-    )
-
-    try:
-        (
-            first_jenkins_build_of_current_pull_request_id,
-            first_jenkins_build_of_current_pull_request_timestamp,
-        ) = extract_first_jenkins_build_of_current_pull_request(
-            first_jenkins_build_of_current_pull_request
+        parent_commit_hash,
+        parent_commit_hash_url,
+        statuses_of_parent_commit_url,
+    ) = extract_parent_commits(global_variables, pull_request)
+
+    if ST_BUILD_RESOLVER == "jenkins-index":
+        first_jenkins_build_of_current_pull_request = resolve_first_st_build_from_index(
+            global_variables,
+            pull_request.merge_commit_hash,
+            parent_commit_hash,
         )
-    except KeyError as err:
-        raise FiveHundredError(message=f"Key {str(err)} cannot be found in the dict")
-    except IndexError as err:
-        raise FiveHundredError(
-            message=f"Unexpected data from {first_jenkins_build_of_current_pull_request_apis_url} in {global_variables['BITBUCKET_REPO_SLUG']} staging job. Visit {first_jenkins_build_of_current_pull_request_apis_url}"
+        if first_jenkins_build_of_current_pull_request is not None:
+            return first_jenkins_build_of_current_pull_request
+
+        logger.debug(
+            "merge commit not found in the st build index, falling back to the commit statuses",
+            pullRequestId=pull_request.id,
         )
 
-    if first_jenkins_build_of_current_pull_request_id == 1:
-        logger.info("line 320")
+    last_build_of_parent_commit_display_url = fetch_parent_commit_statuses(
+        global_variables,
+        parent_commit_hash,
+        parent_commit_hash_url,
+        statuses_of_parent_commit_url,
+    )
+
+    if "master" in last_build_of_parent_commit_display_url:
         raise JenkinsHistoryLimit()
 
-    return (
-        first_jenkins_build_of_current_pull_request_id,
-        first_jenkins_build_of_current_pull_request_timestamp,
+    first_jenkins_build_of_current_pull_request_url = get_last_build_of_parent_commit(
+        global_variables, last_build_of_parent_commit_display_url
+    )
+
+    return get_first_jenkins_build_of_current_pull_request(
+        global_variables, first_jenkins_build_of_current_pull_request_url
     )
 
 
@@ -324,6 +510,18 @@ def get_at_jenkins_build_of_current_pull_request(
     global_variables,
     first_jenkins_build_of_current_pull_request_id,
 ):
+    if UPSTREAM_BUILD_RESOLVER == "mapped-index":
+        first_jenkins_at_build_of_current_pull_request_id = resolve_at_build_from_index(
+            global_variables, first_jenkins_build_of_current_pull_request_id
+        )
+        if first_jenkins_at_build_of_current_pull_request_id is not None:
+            return first_jenkins_at_build_of_current_pull_request_id
+
+        logger.debug(
+            "st build not found in the at build index, falling back to the xpath query",
+            stBuildNumber=first_jenkins_build_of_current_pull_request_id,
+        )
+
     first_jenkins_at_build_of_current_pull_request_path = f"{global_variables['JENKINS_AT_JOB_NAME']}/api/xml?tree=allBuilds[number,url,result,actions[causes[upstreamUrl,upstreamBuild]]]&xpath=/workflowJob/allBuild/action/cause[upstreamBuild={first_jenkins_build_of_current_pull_request_id}%20and%20contains(upstreamUrl,%20%27main%27)%20and%20contains(upstreamUrl,%20%27Beehive%2520Improvement%2520Program%27)]/../.."
 
     logger.debug(
@@ -351,56 +549,39 @@ def get_at_jenkins_build_of_current_pull_request(
         response=first_jenkins_at_build_of_current_pull_request,
     )
 
-    green_build = False
-
-    try:
-        build_result = first_jenkins_at_build_of_current_pull_request["data"][
-            "allBuild"
-        ]["result"]
-        build_number = first_jenkins_at_build_of_current_pull_request["data"][
-            "allBuild"
-        ]["number"]
-    except KeyError as err:
-        raise FiveHundredError(message=f"Key {str(err)} cannot be found in the dict")
+    first_jenkins_at_build = parse_xpath_build(
+        global_variables,
+        first_jenkins_at_build_of_current_pull_request,
+        first_jenkins_at_build_of_current_pull_request_path,
+        "acceptance",
+    )
 
-    if build_result != "SUCCESS":
-        while green_build != True:
-            jenkins_at_build_of_current_pull_request_path_retry_url = f"{global_variables['JENKINS_AT_JOB_NAME']}/api/xml?tree=allBuilds[number,url,result,actions[causes[upstreamUrl,upstreamBuild]]]&xpath=/workflowJob/allBuild[number={str(int(build_number) + 1)}]"
+    while first_jenkins_at_build.result != "SUCCESS":
+        jenkins_at_build_of_current_pull_request_path_retry_url = f"{global_variables['JENKINS_AT_JOB_NAME']}/api/xml?tree=allBuilds[number,url,result,actions[causes[upstreamUrl,upstreamBuild]]]&xpath=/workflowJob/allBuild[number={str(first_jenkins_at_build.number + 1)}]"
 
-            first_jenkins_at_build_of_current_pull_request = make_request(
-                APIS.JENKINS, jenkins_at_build_of_current_pull_request_path_retry_url
-            )
-
-            if not first_jenkins_at_build_of_current_pull_request["success"]:
-                raise FiveHundredError(
-                    response=first_jenkins_at_build_of_current_pull_request
-                )
+        first_jenkins_at_build_of_current_pull_request = make_request(
+            APIS.JENKINS, jenkins_at_build_of_current_pull_request_path_retry_url
+        )
 
-            try:
-                build_result = first_jenkins_at_build_of_current_pull_request["data"][
-                    "allBuild"
-                ]["result"]
-                build_number = first_jenkins_at_build_of_current_pull_request["data"][
-                    "allBuild"
-                ]["number"]
-            except KeyError as err:
-                raise FiveHundredError(
-                    message=f"Key {str(err)} cannot be found in the dict"
+        if not first_jenkins_at_build_of_current_pull_request["success"]:
+            if first_jenkins_at_build_of_current_pull_request["statusCode"] == 404:
+                raise UnresolvableLineage(
+                    NO_GREEN_AT_BUILD,
+                    f"No green at build followed {first_jenkins_at_build.number} in {global_variables['BITBUCKET_REPO_SLUG']}",
                 )
+            raise FiveHundredError(
+                response=first_jenkins_at_build_of_current_pull_request
+            )
 
-            green_build = build_result == "SUCCESS"
-
-    try:
-        first_jenkins_at_build_of_current_pull_request_id = (
-            first_jenkins_at_build_of_current_pull_request["data"]["allBuild"]["number"]
-        )
-    except KeyError as err:
-        raise FiveHundredError(message=f"Key {str(err)} cannot be found in the dict")
-    except IndexError as err:
-        raise FiveHundredError(
-            f"Unexpected data from {first_jenkins_at_build_of_current_pull_request_path} in {global_variables['BITBUCKET_REPO_SLUG']} acceptance job. Visit {first_jenkins_at_build_of_current_pull_request_path}"
+        first_jenkins_at_build = parse_xpath_build(
+            global_variables,
+            first_jenkins_at_build_of_current_pull_request,
+            jenkins_at_build_of_current_pull_request_path_retry_url,
+            "acceptance",
         )
 
+    first_jenkins_at_build_of_current_pull_request_id = first_jenkins_at_build.number
+
     if first_jenkins_at_build_of_current_pull_request_id == 1:
         raise JenkinsHistoryLimit()
 
@@ -411,6 +592,18 @@ def get_pr_jenkins_build_of_current_pull_request(
     global_variables,
     first_jenkins_at_build_of_current_pull_request_id,
 ):
+    if UPSTREAM_BUILD_RESOLVER == "mapped-index":
+        first_jenkins_pr_build_of_current_pull_request = resolve_pr_build_from_index(
+            global_variables, first_jenkins_at_build_of_current_pull_request_id
+        )
+        if first_jenkins_pr_build_of_current_pull_request is not None:
+            return first_jenkins_pr_build_of_current_pull_request
+
+        logger.debug(
+            "at build not found in the production build index, falling back to the xpath query",
+            atBuildNumber=first_jenkins_at_build_of_current_pull_request_id,
+        )
+
     first_jenkins_pr_build_of_current_pull_request_path = f"{global_variables['JENKINS_PR_JOB_NAME']}/api/xml?tree=allBuilds[duration,timestamp,number,url,actions[causes[upstreamUrl,upstreamBuild]]]&xpath=/workflowJob/allBuild/action/cause[upstreamBuild%20=%20%27{first_jenkins_at_build_of_current_pull_request_id}%27]/../.."
 
     logger.debug(
@@ -432,25 +625,91 @@ def get_pr_jenkins_build_of_current_pull_request(
         response=first_jenkins_pr_build_of_current_pull_request,
     )
 
+    first_jenkins_pr_build = parse_xpath_build(
+        global_variables,
+        first_jenkins_pr_build_of_current_pull_request,
+        first_jenkins_pr_build_of_current_pull_request_path,
+        "production",
+        ("duration", "timestamp"),
+    )
+
+    return first_jenkins_pr_build.duration, first_jenkins_pr_build.timestamp
+
+
+def parse_xpath_build(
+    global_variables,
+    xpath_response: RequestResponse,
+    path: str,
+    stage: str,
+    required: Tuple[str, ...] = (),
+) -> JenkinsBuild:
     try:
-        first_jenkins_pr_build_of_current_pull_request_duration_seconds = int(
-            first_jenkins_pr_build_of_current_pull_request["data"]["allBuild"][
-                "duration"
-            ]
+        all_build = xpath_response["data"]["allBuild"]
+    except KeyError as err:
+        raise missing_key_error(err)
+    if not isinstance(all_build, dict):
+        raise UnresolvableLineage(
+            UNEXPECTED_AT_BUILD
+            if stage == "acceptance"
+            else UNEXPECTED_PRODUCTION_BUILD,
+            f"Unexpected data from {path} in {global_variables['BITBUCKET_REPO_SLUG']} {stage} job. Visit {path}",
         )
-        first_jenkins_pr_build_of_current_pull_request_start_timestamp = int(
-            first_jenkins_pr_build_of_current_pull_request["data"]["allBuild"][
-                "timestamp"
-            ]
+    return JenkinsBuild.from_jenkins(all_build, required)
+
+
+def resolve_pipeline_lineage(
+    global_variables, pull_request: PullRequest
+) -> PipelineLineage:
+    repo_slug = global_variables["BITBUCKET_REPO_SLUG"]
+    unresolvable = get_unresolvable(repo_slug, pull_request.id)
+    if unresolvable is not None:
+        raise UnresolvableLineage(
+            unresolvable["reason"],
+            f"Lineage of PR {pull_request.id} in {repo_slug} is unresolvable: {unresolvable['reason']}",
         )
-    except KeyError as err:
-        raise FiveHundredError(message=f"Key {str(err)} cannot be found in the dict")
-    except IndexError as err:
-        raise FiveHundredError(
-            f"Unexpected data from {first_jenkins_pr_build_of_current_pull_request_path} in {global_variables['BITBUCKET_REPO_SLUG']} production job. Visit {first_jenkins_pr_build_of_current_pull_request_path}"
+
+    try:
+        return resolve_uncached_pipeline_lineage(global_variables, pull_request)
+    except UnresolvableLineage as err:
+        if err.reason in IN_FLIGHT_REASONS and not is_settled(pull_request):
+            # the next st build or the green at build may just not exist yet
+            logger.debug(
+                "pull request lineage is not resolvable yet",
+                pullRequestId=pull_request.id,
+                reason=err.reason,
+            )
+            raise
+        entry = record_unresolvable(repo_slug, pull_request.id, err.reason)
+        logger.info(
+            "recorded unresolvable pull request lineage",
+            pullRequestId=pull_request.id,
+            reason=err.reason,
+            failures=entry["failures"],
         )
+        raise
 
-    return (
-        first_jenkins_pr_build_of_current_pull_request_duration_seconds,
-        first_jenkins_pr_build_of_current_pull_request_start_timestamp,
+
+def resolve_uncached_pipeline_lineage(
+    global_variables, pull_request: PullRequest
+) -> PipelineLineage:
+    lineage = PipelineLineage(pull_request.id, pull_request.merge_commit_hash)
+
+    (
+        lineage.st_build_number,
+        lineage.st_start_timestamp,
+    ) = resolve_first_st_build_of_pull_request(global_variables, pull_request)
+
+    lineage.at_build_number = int(
+        get_at_jenkins_build_of_current_pull_request(
+            global_variables, lineage.st_build_number
+        )
     )
+
+    (
+        lineage.production_duration,
+        lineage.production_start_timestamp,
+    ) = get_pr_jenkins_build_of_current_pull_request(
+        global_variables, lineage.at_build_number
+    )
+
+    return lineage
@@ -0,0 +1,219 @@
+from __future__ import annotations
+import os
+import shutil
+import threading
+import time
+from hashlib import sha1
+from typing import Dict, List, Optional, Tuple
+from aws_lambda_powertools import Logger
+
+from ..helpers.network import APIS, make_request
+from ..helpers.scheduler import BACKGROUND, scheduled_as
+from ..exceptions import FiveHundredError, JenkinsHistoryLimit
+from ..models import JenkinsBuild, parse_jenkins_builds
+from ..stores.build_index import BuildRecord, MappedBuildIndex
+from .jenkins_folders import get_folder_builds
+
+logger = Logger(child=True)
+
+BUILD_INDEX_DIR = os.getenv("BUILD_INDEX_DIR", "/tmp/build-index")
+# read-only copies shipped in a lambda layer, used to seed BUILD_INDEX_DIR
+BUILD_INDEX_SEED_DIR = os.getenv("BUILD_INDEX_SEED_DIR", "")
+BUILD_INDEX_REFRESH_SECONDS = int(os.getenv("BUILD_INDEX_REFRESH_SECONDS", "60"))
+BUILD_INDEX_REFRESH_PAGE = int(os.getenv("BUILD_INDEX_REFRESH_PAGE", "200"))
+
+# the at job is also triggered by st builds of other branches, whose numbers
+# overlap with main's; the xpath resolver filters on the same parts
+AT_UPSTREAM_URL_PARTS = ("main", "Beehive%20Improvement%20Program")
+
+build_indexes: Dict[Tuple[str, Tuple[str, ...]], MappedBuildIndex] = {}
+build_indexes_lock = threading.Lock()
+
+
+def build_index_name(job_name: str, upstream_url_parts: Tuple[str, ...] = ()) -> str:
+    return sha1("\n".join((job_name,) + upstream_url_parts).encode("utf-8")).hexdigest()
+
+
+def open_build_index(
+    job_name: str, upstream_url_parts: Tuple[str, ...] = ()
+) -> MappedBuildIndex:
+    os.makedirs(BUILD_INDEX_DIR, exist_ok=True)
+    name = build_index_name(job_name, upstream_url_parts)
+    base_path = os.path.join(BUILD_INDEX_DIR, name)
+    if BUILD_INDEX_SEED_DIR and not os.path.exists(f"{base_path}.builds"):
+        seed_path = os.path.join(BUILD_INDEX_SEED_DIR, name)
+        if os.path.exists(f"{seed_path}.builds") and os.path.exists(
+            f"{seed_path}.upstream"
+        ):
+            shutil.copyfile(f"{seed_path}.builds", f"{base_path}.builds")
+            shutil.copyfile(f"{seed_path}.upstream", f"{base_path}.upstream")
+    return MappedBuildIndex(base_path)
+
+
+def to_build_record(
+    build: JenkinsBuild, upstream_url_parts: Tuple[str, ...] = ()
+) -> BuildRecord:
+    return BuildRecord(
+        build.number,
+        build.upstream_build_from(upstream_url_parts),
+        build.timestamp,
+        build.duration or 0,
+        build.result,
+    )
+
+
+def fetch_build_records(
+    job_name: str,
+    upstream_url_parts: Tuple[str, ...] = (),
+    page: Optional[int] = None,
+) -> List[BuildRecord]:
+    build_range = f"{{0,{page}}}" if page else ""
+    all_builds_path = f"{job_name}/api/json?tree=allBuilds[number,timestamp,duration,result,actions[causes[upstreamBuild,upstreamUrl]]]{build_range}"
+
+    logger.debug("making request to refresh the build index", path=all_builds_path)
+    all_builds_response = make_request(APIS.JENKINS, all_builds_path)
+
+    if not all_builds_response["success"]:
+        raise FiveHundredError(response=all_builds_response)
+
+    return [
+        to_build_record(build, upstream_url_parts)
+        for build in parse_jenkins_builds(all_builds_response["data"], ("timestamp",))
+    ]
+
+
+def finished_builds(build_records: List[BuildRecord]) -> List[BuildRecord]:
+    # records are immutable once written, so stop at the first running build
+    # and pick it up again on a later refresh
+    finished = []
+    for build in sorted(build_records, key=lambda build: build.number):
+        if build.result is None:
+            break
+        finished.append(build)
+    return finished
+
+
+def refresh_build_index(
+    job_name: str,
+    build_index: MappedBuildIndex,
+    upstream_url_parts: Tuple[str, ...] = (),
+):
+    last_number = build_index.last_number
+    folder_builds = get_folder_builds(job_name)
+    with scheduled_as(priority=BACKGROUND):
+        if folder_builds is not None:
+            build_records = [
+                to_build_record(build, upstream_url_parts) for build in folder_builds
+            ]
+        elif last_number == 0:
+            build_records = fetch_build_records(job_name, upstream_url_parts)
+        else:
+            build_records = fetch_build_records(
+                job_name, upstream_url_parts, BUILD_INDEX_REFRESH_PAGE
+            )
+            if (
+                build_records
+                and min(build.number for build in build_records) > last_number + 1
+            ):
+                # more new builds than one page holds
+                build_records = fetch_build_records(job_name, upstream_url_parts)
+
+    appended = build_index.append(finished_builds(build_records))
+    build_index.refreshed_at = time.monotonic()
+    logger.debug(
+        "refreshed the build index",
+        job=job_name,
+        appended=appended,
+        size=len(build_index),
+    )
+
+
+def is_stale(build_index: MappedBuildIndex) -> bool:
+    return (
+        build_index.refreshed_at is None
+        or time.monotonic() - build_index.refreshed_at > BUILD_INDEX_REFRESH_SECONDS
+    )
+
+
+def get_build_index(
+    job_name: str, upstream_url_parts: Tuple[str, ...] = ()
+) -> MappedBuildIndex:
+    with build_indexes_lock:
+        build_index = build_indexes.get((job_name, upstream_url_parts))
+        if build_index is None:
+            build_index = open_build_index(job_name, upstream_url_parts)
+            build_indexes[(job_name, upstream_url_parts)] = build_index
+
+    # refreshes run at background priority, so only this index is locked while
+    # they wait on jenkins, and readers of an index that has been refreshed
+    # before use it as it is rather than queue behind the refresh
+    if not is_stale(build_index):
+        return build_index
+    if not build_index.refresh_lock.acquire(blocking=build_index.refreshed_at is None):
+        return build_index
+    try:
+        if is_stale(build_index):
+            refresh_build_index(job_name, build_index, upstream_url_parts)
+    finally:
+        build_index.refresh_lock.release()
+    return build_index
+
+
+def matches_upstream_url(
+    upstream_url: Optional[str], upstream_url_parts: Tuple[str, ...]
+) -> bool:
+    return all(part in (upstream_url or "") for part in upstream_url_parts)
+
+
+def record_finished_build(
+    job_name: str, build: BuildRecord, upstream_url: Optional[str] = None
+) -> bool:
+    # only indexes already open in this container are touched; a gap means a
+    # notification went missing, so the next read refreshes from jenkins
+    with build_indexes_lock:
+        open_indexes = list(build_indexes.items())
+
+    appended = False
+    for (indexed_job_name, upstream_url_parts), build_index in open_indexes:
+        if indexed_job_name != job_name:
+            continue
+        if build.number > build_index.last_number + 1:
+            build_index.refreshed_at = None
+            continue
+        build_record = (
+            build
+            if matches_upstream_url(upstream_url, upstream_url_parts)
+            else build._replace(upstream_build=None)
+        )
+        appended = build_index.append([build_record]) > 0 or appended
+    return appended
+
+
+def resolve_at_build_from_index(global_variables, st_build_number) -> Optional[int]:
+    build_index = get_build_index(
+        global_variables["JENKINS_AT_JOB_NAME"], AT_UPSTREAM_URL_PARTS
+    )
+
+    build = build_index.first_by_upstream(int(st_build_number))
+    while build is not None and build.result != "SUCCESS":
+        build = build_index.next_build(build.number)
+
+    if build is None:
+        return None
+
+    if build.number == 1:
+        raise JenkinsHistoryLimit()
+
+    return build.number
+
+
+def resolve_pr_build_from_index(
+    global_variables, at_build_number
+) -> Optional[Tuple[int, int]]:
+    build_index = get_build_index(global_variables["JENKINS_PR_JOB_NAME"])
+
+    build = build_index.first_by_upstream(int(at_build_number))
+    if build is None:
+        return None
+
+    return build.duration, build.timestamp
@@ -23,3 +23,16 @@ class FiveHundredError(Exception):
 class JenkinsHistoryLimit(Exception):
     def __init__(self):
         super().__init__()
+
+
+class FourOhOneError(Exception):
+    def __init__(self, message=""):
+        self.message = message
+        super().__init__(self.message)
+
+
+class UnresolvableLineage(FiveHundredError):
+    # a pull request whose lineage fails the same way on every attempt
+    def __init__(self, reason, message=""):
+        self.reason = reason
+        super().__init__(message=message)
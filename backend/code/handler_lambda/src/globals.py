@@ -66,3 +66,11 @@ def validate_project_id_param(request_id):
         )
 
     return global_variables
+
+
+def get_all_project_global_variables():
+    validate_job_names()
+    return [
+        validate_project_id_param(project_id)
+        for project_id in range(MIN_PROJECT_ID, MAX_PROJECT_ID + 1)
+    ]
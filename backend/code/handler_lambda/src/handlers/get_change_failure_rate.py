@@ -1,50 +1,144 @@
 import json
+from typing import Optional, Tuple
 from aws_lambda_powertools import Logger
 from requests import status_codes
 from aws_lambda_powertools.event_handler import Response, content_types
 from aws_lambda_powertools.event_handler.api_gateway import APIGatewayProxyEvent
 
-from ..calculators.shared import get_all_pull_requests, get_num_of_pull_requests
-from ..exceptions import FiveHundredError
+from ..calculators.change_failure_rate import (
+    ChangeFailureAggregate,
+    add_merged_pull_requests,
+    build_change_failure_aggregate,
+    calculate_change_failure_rate,
+)
+from ..calculators.shared import (
+    filter_pull_requests_to_window,
+    get_all_pull_requests,
+    get_latest_pull_request_id,
+    get_merged_pull_requests_since,
+    get_num_of_pull_requests,
+    get_pull_requests_after,
+)
+from ..helpers.etag import matches_etag, metric_etag, not_modified_response, with_etag
+from ..helpers.pagination import TimeWindow, is_windowed
+from ..stores.aggregates import get_repo_aggregates, set_change_failure_ratio
+from ..stores.cache import RESULT_CACHE_TTL_SECONDS, result_cache
+from ..stores.running import (
+    CHANGE_FAILURE_AGGREGATE,
+    get_running_aggregate,
+    set_running_aggregate,
+)
 
 
 logger = Logger(child=True)
 
 
-def get_change_failure_rate_handler(global_variables):
-    num_of_bitbucket_pull_requests = get_num_of_pull_requests(global_variables)
+def refresh_change_failure_aggregate(
+    global_variables, latest_pull_request_id: Optional[int]
+) -> Tuple[ChangeFailureAggregate, bool]:
+    # merged pull requests are append only, so only the ones merged after the
+    # newest folded in are fetched; the first call folds in the whole merged
+    # history, so every container arrives at the same totals
+    repo_slug = global_variables["BITBUCKET_REPO_SLUG"]
+    change_failure_aggregate = get_running_aggregate(
+        CHANGE_FAILURE_AGGREGATE, repo_slug
+    )
+    pull_requests = None
+    if (
+        change_failure_aggregate is not None
+        and change_failure_aggregate["newestPullRequestId"] is not None
+    ):
+        if (
+            latest_pull_request_id is None
+            or latest_pull_request_id == change_failure_aggregate["newestPullRequestId"]
+        ):
+            return change_failure_aggregate, False
+        pull_requests = get_pull_requests_after(
+            global_variables, change_failure_aggregate["newestPullRequestId"]
+        )
+        if pull_requests == []:
+            # a webhook can arrive before bitbucket lists its merge
+            return change_failure_aggregate, False
+
+    if pull_requests is None:
+        change_failure_aggregate = build_change_failure_aggregate(
+            get_merged_pull_requests_since(global_variables, None)
+        )
+    else:
+        change_failure_aggregate = add_merged_pull_requests(
+            change_failure_aggregate, pull_requests
+        )
 
-    pull_requests_response = get_all_pull_requests(
-        global_variables, num_of_bitbucket_pull_requests
+    set_running_aggregate(CHANGE_FAILURE_AGGREGATE, repo_slug, change_failure_aggregate)
+    logger.debug(
+        "folded merged pull requests into the change failure aggregate",
+        repoSlug=repo_slug,
+        newestPullRequestId=change_failure_aggregate["newestPullRequestId"],
+        totalPullRequests=change_failure_aggregate["totalPullRequests"],
     )
+    return change_failure_aggregate, True
 
-    change_failure_count = 0
-    pull_requests = []
 
-    try:
-        pull_requests = pull_requests_response["values"]
-    except KeyError as err:
-        raise FiveHundredError(message=f"Key {str(err)} cannot be found in the dict")
+def get_change_failure_rate_handler(
+    global_variables,
+    time_window: Optional[TimeWindow] = None,
+    if_none_match: Optional[str] = None,
+):
+    # the rate only moves when another pull request is merged
+    latest_pull_request_id = get_latest_pull_request_id(global_variables)
 
-    for pull_request in pull_requests[:-1]:
-        try:
-            source_branch = pull_request["source"]["branch"]["name"]
-        except KeyError as err:
-            raise FiveHundredError(
-                message=f"Key {str(err)} cannot be found in the dict"
+    if is_windowed(time_window):
+        etag = metric_etag("change-failure-rate", [latest_pull_request_id], time_window)
+        if matches_etag(if_none_match, etag):
+            return not_modified_response(etag)
+
+        # a window is not append only, so it is rebuilt from bitbucket for
+        # every newly merged pull request
+        cache_key = f"change-failure-window:{global_variables['BITBUCKET_REPO_SLUG']}:{latest_pull_request_id}:{time_window['since']}:{time_window['until']}"
+        change_failure_aggregate = result_cache.get(cache_key)
+        if change_failure_aggregate is None:
+            num_of_bitbucket_pull_requests = get_num_of_pull_requests(global_variables)
+            change_failure_aggregate = build_change_failure_aggregate(
+                filter_pull_requests_to_window(
+                    global_variables,
+                    get_all_pull_requests(
+                        global_variables, num_of_bitbucket_pull_requests
+                    ),
+                    time_window,
+                )
             )
+            result_cache.set(
+                cache_key, change_failure_aggregate, RESULT_CACHE_TTL_SECONDS
+            )
+        change_failure_rate = calculate_change_failure_rate(change_failure_aggregate)
+    else:
+        change_failure_aggregate, updated = refresh_change_failure_aggregate(
+            global_variables, latest_pull_request_id
+        )
+        # tagged from the aggregate served, which can trail the latest merge
+        # while bitbucket catches up
+        etag = metric_etag("change-failure-rate", [change_failure_aggregate])
+        if matches_etag(if_none_match, etag):
+            return not_modified_response(etag)
 
-        if "hotfix" in source_branch:
-            change_failure_count += 1
+        change_failure_rate = calculate_change_failure_rate(change_failure_aggregate)
+        repo_aggregates = get_repo_aggregates(global_variables["BITBUCKET_REPO_SLUG"])
+        # a new process reads the aggregate back from disk without the ratio
+        if (
+            updated
+            or repo_aggregates is None
+            or repo_aggregates.change_failure_ratio is None
+        ):
+            set_change_failure_ratio(
+                global_variables["BITBUCKET_REPO_SLUG"],
+                change_failure_rate["percentageOfChangeFailures"],
+            )
 
-    return Response(
-        status_code=status_codes.codes.OK,
-        content_type=content_types.APPLICATION_JSON,
-        body=json.dumps(
-            {
-                "percentageOfChangeFailures": int(
-                    (change_failure_count / len(pull_requests)) * 100
-                )
-            }
+    return with_etag(
+        Response(
+            status_code=status_codes.codes.OK,
+            content_type=content_types.APPLICATION_JSON,
+            body=json.dumps(change_failure_rate),
         ),
+        etag,
     )
@@ -1,19 +1,85 @@
 import os
 import json
+from typing import List, Optional
 from aws_lambda_powertools import Logger
 from requests import status_codes
 from aws_lambda_powertools.event_handler import Response, content_types
 from aws_lambda_powertools.event_handler.api_gateway import APIGatewayProxyEvent
 
 from ..calculators.deployment_frequency import calculate_deployment_frequency
+from ..calculators.jenkins_folders import get_folder_builds
+from ..calculators.upstream_build_index import get_build_index
+from ..helpers.etag import body_etag, matches_etag, not_modified_response, with_etag
 from ..helpers.network import make_request, APIS
+from ..helpers.pagination import TimeWindow, is_windowed
+from ..models import JenkinsBuild, parse_jenkins_builds
+from ..stores.aggregates import set_deployment_frequency
+from ..stores.cache import RESULT_CACHE_TTL_SECONDS, result_cache
 
 from ..exceptions import FiveHundredError
 
 logger = Logger(child=True)
 
 
-def get_deployment_frequency_handler(global_variables):
+def deployment_frequency_cache_key(global_variables) -> str:
+    return f"deployment-frequency:{global_variables['JENKINS_JOB_NAME']}"
+
+
+def get_deployment_frequency_handler(
+    global_variables,
+    time_window: Optional[TimeWindow] = None,
+    if_none_match: Optional[str] = None,
+):
+    if is_windowed(time_window):
+        # only the builds inside the window are read from the build index
+        windowed_builds = get_build_index(global_variables["JENKINS_JOB_NAME"]).window(
+            time_window["since"], time_window["until"]
+        )
+        deployment_frequency = calculate_deployment_frequency(
+            [
+                JenkinsBuild(build.number, build.result, build.timestamp)
+                for build in reversed(windowed_builds)
+            ]
+        )
+    else:
+        cache_key = deployment_frequency_cache_key(global_variables)
+        deployment_frequency = result_cache.get(cache_key)
+        if deployment_frequency is None:
+            deployment_frequency = calculate_deployment_frequency(
+                fetch_deployment_builds(global_variables)
+            )
+
+            logger.debug(
+                "deployment frequency calculated",
+                deploymentFrequency=deployment_frequency,
+            )
+            result_cache.set(cache_key, deployment_frequency, RESULT_CACHE_TTL_SECONDS)
+            set_deployment_frequency(
+                global_variables["JENKINS_JOB_NAME"], deployment_frequency
+            )
+
+    # production webhooks add deployments to the cached result, so the tag is
+    # taken from the body served rather than from the last completed build
+    body = json.dumps(deployment_frequency)
+    etag = body_etag(body)
+    if matches_etag(if_none_match, etag):
+        return not_modified_response(etag)
+
+    return with_etag(
+        Response(
+            status_code=status_codes.codes.OK,
+            content_type=content_types.APPLICATION_JSON,
+            body=body,
+        ),
+        etag,
+    )
+
+
+def fetch_deployment_builds(global_variables) -> List[JenkinsBuild]:
+    folder_builds = get_folder_builds(global_variables["JENKINS_JOB_NAME"])
+    if folder_builds is not None:
+        return folder_builds
+
     # for multi branch pipelines
     # /api/json?tree=jobs[name,color,builds[url,result,timestamp]]
     # for single job pipelines
@@ -28,14 +94,4 @@ def get_deployment_frequency_handler(global_variables):
         raise FiveHundredError(response=response)
 
     logger.debug("jenkins request successfully made", response=response)
-    deployment_frequency = calculate_deployment_frequency(response["data"])
-
-    logger.debug(
-        "deployment frequency calculated",
-        deploymentFrequency=deployment_frequency,
-    )
-    return Response(
-        status_code=status_codes.codes.OK,
-        content_type=content_types.APPLICATION_JSON,
-        body=json.dumps(deployment_frequency),
-    )
+    return parse_jenkins_builds(response["data"])
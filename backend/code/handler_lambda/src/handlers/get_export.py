@@ -0,0 +1,216 @@
+from __future__ import annotations
+import os
+import io
+import heapq
+from typing import BinaryIO, Iterator, List, Tuple
+from aws_lambda_powertools import Logger
+from requests import status_codes
+from aws_lambda_powertools.event_handler import Response
+
+from ..calculators.jenkins_folders import get_folder_builds
+from ..exceptions import FiveHundredError, FourTwoTwoError
+from ..helpers.columnar import (
+    CONTENT_TYPES,
+    EXPORT_FORMATS,
+    Columns,
+    export_format_available,
+    resolve_export_format,
+    write_table,
+)
+from ..helpers.deadline import Deadline
+from ..helpers.network import APIS, make_request
+from ..models import JenkinsBuild, parse_jenkins_builds
+from ..stores.series import (
+    LEAD_TIME_SERIES,
+    PRODUCTION_FINISH_SERIES,
+    RECOVERY_SERIES,
+    get_series_index,
+)
+from .get_lead_time_for_changes_series import populate_lead_time_series
+from .get_mean_time_to_recovery_series import populate_recovery_series
+
+# lambda responses are capped at 6MB, and binary bodies grow by a third once
+# base64 encoded
+EXPORT_MAX_RESPONSE_BYTES = int(os.getenv("EXPORT_MAX_RESPONSE_BYTES", "4000000"))
+
+LEAD_TIMES_TABLE = "lead-times"
+RECOVERIES_TABLE = "recoveries"
+BUILDS_TABLE = "builds"
+
+# every table is sorted by its first timestamp column
+EXPORT_TABLES = {
+    LEAD_TIMES_TABLE: [
+        ("repoSlug", "string"),
+        ("productionFinishTimestamp", "int64"),
+        ("pullRequestId", "int64"),
+        ("mergeCommit", "string"),
+        ("stBuildNumber", "int64"),
+        ("atBuildNumber", "int64"),
+        ("stStartTimestamp", "int64"),
+        ("durationSeconds", "float64"),
+    ],
+    RECOVERIES_TABLE: [
+        ("repoSlug", "string"),
+        ("recoveryFinishTimestamp", "int64"),
+        ("pullRequestId", "int64"),
+        ("previousPullRequestId", "int64"),
+        ("incidentStartTimestamp", "int64"),
+        ("durationSeconds", "float64"),
+    ],
+    BUILDS_TABLE: [
+        ("repoSlug", "string"),
+        ("timestamp", "int64"),
+        ("stage", "string"),
+        ("job", "string"),
+        ("number", "int64"),
+        ("result", "string"),
+        ("durationMs", "int64"),
+        ("commit", "string"),
+        ("upstreamBuild", "int64"),
+    ],
+}
+
+logger = Logger(child=True)
+
+
+def iter_lead_time_rows(
+    global_variables, deadline: Deadline
+) -> Tuple[Iterator[dict], bool]:
+    repo_slug = global_variables["BITBUCKET_REPO_SLUG"]
+    series_index = get_series_index(LEAD_TIME_SERIES, repo_slug)
+    complete = populate_lead_time_series(global_variables, series_index, deadline)
+    rows = (
+        {"repoSlug": repo_slug, **record} for record in series_index.ordered_records()
+    )
+    return rows, complete
+
+
+def iter_recovery_rows(
+    global_variables, deadline: Deadline
+) -> Tuple[Iterator[dict], bool]:
+    repo_slug = global_variables["BITBUCKET_REPO_SLUG"]
+    recovery_index = get_series_index(RECOVERY_SERIES, repo_slug)
+    complete = populate_recovery_series(
+        global_variables,
+        get_series_index(PRODUCTION_FINISH_SERIES, repo_slug),
+        recovery_index,
+        deadline,
+    )
+    rows = (
+        {"repoSlug": repo_slug, **record} for record in recovery_index.ordered_records()
+    )
+    return rows, complete
+
+
+def fetch_export_builds(job_name: str) -> List[JenkinsBuild]:
+    folder_builds = get_folder_builds(job_name)
+    if folder_builds is not None:
+        return folder_builds
+
+    all_builds_path = f"{job_name}/api/json?tree=allBuilds[number,timestamp,duration,result,actions[lastBuiltRevision[SHA1],causes[upstreamBuild]]]"
+
+    logger.debug("making request to export the build table", path=all_builds_path)
+    all_builds_response = make_request(APIS.JENKINS, all_builds_path)
+
+    if not all_builds_response["success"]:
+        raise FiveHundredError(response=all_builds_response)
+
+    return parse_jenkins_builds(all_builds_response["data"], ("timestamp",))
+
+
+def fetch_build_rows(global_variables, stage: str, job_name: str) -> list:
+    rows = []
+    for build in fetch_export_builds(job_name):
+        rows.append(
+            {
+                "repoSlug": global_variables["BITBUCKET_REPO_SLUG"],
+                "timestamp": build.timestamp,
+                "stage": stage,
+                "job": job_name,
+                "number": build.number,
+                "result": build.result,
+                "durationMs": build.duration or 0,
+                "commit": build.revisions[0] if build.revisions else None,
+                "upstreamBuild": build.upstream_build,
+            }
+        )
+
+    rows.sort(key=lambda row: (row["timestamp"], row["number"]))
+    return rows
+
+
+def iter_build_rows(
+    global_variables, deadline: Deadline
+) -> Tuple[Iterator[dict], bool]:
+    stage_jobs = {
+        "st": global_variables["JENKINS_ST_JOB_NAME"],
+        "at": global_variables["JENKINS_AT_JOB_NAME"],
+        "production": global_variables["JENKINS_PR_JOB_NAME"],
+    }
+    if global_variables["JENKINS_JOB_NAME"] not in stage_jobs.values():
+        stage_jobs["deployment"] = global_variables["JENKINS_JOB_NAME"]
+
+    build_tables = [
+        fetch_build_rows(global_variables, stage, job_name)
+        for stage, job_name in stage_jobs.items()
+    ]
+    rows = heapq.merge(*build_tables, key=lambda row: row["timestamp"])
+    return rows, True
+
+
+EXPORT_ROW_SOURCES = {
+    LEAD_TIMES_TABLE: iter_lead_time_rows,
+    RECOVERIES_TABLE: iter_recovery_rows,
+    BUILDS_TABLE: iter_build_rows,
+}
+
+
+def write_export(
+    global_variables, table: str, export_format: str, sink: BinaryIO, deadline: Deadline
+) -> Tuple[str, int, bool]:
+    if table not in EXPORT_TABLES:
+        raise FourTwoTwoError(
+            f"Unknown export table: {table}, expected one of {', '.join(EXPORT_TABLES)}"
+        )
+    if export_format not in EXPORT_FORMATS:
+        raise FourTwoTwoError(
+            f"Query parameter format must be one of {', '.join(EXPORT_FORMATS)}"
+        )
+
+    export_format = resolve_export_format(export_format)
+    columns: Columns = EXPORT_TABLES[table]
+    rows, complete = EXPORT_ROW_SOURCES[table](global_variables, deadline)
+    row_count = write_table(sink, columns, rows, export_format)
+    return export_format, row_count, complete
+
+
+def get_export_handler(
+    global_variables, deadline: Deadline, table: str, export_format: str
+):
+    # the snapshot tool falls back to csv, but a client asking for a columnar
+    # format over http would otherwise get csv under the wrong file extension
+    if export_format in EXPORT_FORMATS and not export_format_available(export_format):
+        raise FourTwoTwoError(
+            f"Export format {export_format} is not available on this deployment, use format=csv"
+        )
+
+    sink = io.BytesIO()
+    export_format, row_count, complete = write_export(
+        global_variables, table, export_format, sink, deadline
+    )
+    body = sink.getvalue()
+
+    if len(body) > EXPORT_MAX_RESPONSE_BYTES:
+        raise FiveHundredError(
+            message=f"The {table} export is {len(body)} bytes, too large for one response. Use tools.export_snapshot instead."
+        )
+
+    return Response(
+        status_code=status_codes.codes.OK,
+        content_type=CONTENT_TYPES[export_format],
+        body=body.decode("utf-8") if export_format == "csv" else body,
+        headers={
+            "X-Export-Rows": str(row_count),
+            "X-Export-Complete": str(complete).lower(),
+        },
+    )
@@ -1,23 +1,46 @@
+from __future__ import annotations
 import os
 import json
 from datetime import timedelta
+from typing import List
 from aws_lambda_powertools import Logger
 from requests import status_codes
 from aws_lambda_powertools.event_handler import Response, content_types
 from aws_lambda_powertools.event_handler.api_gateway import APIGatewayProxyEvent
 
-from ..calculators.lead_time_for_changes import calculate_lead_time_for_changes
-from ..calculators.shared import FiveHundredError, JenkinsHistoryLimit
+from ..calculators.lead_time_for_changes import resolve_lead_time_record
+from ..calculators.retention import drop_pull_requests_before_retention
+from ..calculators.shared import (
+    FiveHundredError,
+    JenkinsHistoryLimit,
+    filter_pull_requests_to_window,
+    get_last_completed_build_number,
+    get_latest_pull_request_id,
+)
+from ..exceptions import FourTwoTwoError, UnresolvableLineage
 from ..helpers.network import make_request, APIS
 from ..helpers.datetime import timedelta_to_string
+from ..helpers.deadline import Deadline
+from ..helpers.etag import matches_etag, metric_etag, not_modified_response, with_etag
+from ..helpers.pagination import TimeWindow, is_windowed
+from ..models import PullRequest, parse_pull_requests
+from ..helpers.continuation import (
+    already_processed,
+    encode_continuation_token,
+    decode_continuation_token,
+    merge_position,
+)
+from ..stores.series import LEAD_TIME_SERIES, get_series_index
 
 BITBUCKET_WORKSPACE = os.getenv("BITBUCKET_WORKSPACE", "workspace")
 
 
 logger = Logger(child=True)
 
+CONTINUATION_METRIC = "lead-time-for-changes"
 
-def get_lead_time_for_changes_handler(global_variables):
+
+def fetch_lead_time_pull_requests(global_variables) -> List[PullRequest]:
     pull_requests_request_url = f"""/repositories/{BITBUCKET_WORKSPACE}/{global_variables["BITBUCKET_REPO_SLUG"]}/pullrequests?state=MERGED&fields=values.id,values.title,values.state,values.merge_commit.hash,values.merge_commit.date,values.merge_commit.links.self.href,values.merge_commit.links.statuses.href,values.merge_commit.parents,values.merge_commit.parents.hash,values.merge_commit.parents.date,values.merge_commit.parents.links.self.href,values.merge_commit.parents.links.html.href,values.merge_commit.parents.links.statuses.href"""
 
     bitbucket_pull_requests_response = make_request(
@@ -37,25 +60,126 @@ def get_lead_time_for_changes_handler(global_variables):
         response=bitbucket_pull_requests_response,
     )
 
-    try:
-        pull_requests = bitbucket_pull_requests_response["data"]["values"]
-    except KeyError as err:
-        raise FiveHundredError(message=f"Key {str(err)} cannot be found in the dict")
+    return parse_pull_requests(bitbucket_pull_requests_response["data"])
 
-    lead_time_for_changes = []
-    for pull_request in pull_requests:
-        try:
-            lead_time_for_changes.append(
-                calculate_lead_time_for_changes(global_variables, pull_request)
+
+def get_lead_time_for_changes_handler(
+    global_variables,
+    deadline: Deadline,
+    continuation_token: str | None = None,
+    time_window: TimeWindow | None = None,
+    if_none_match: str | None = None,
+):
+    window = {
+        "since": time_window["since"] if time_window else None,
+        "until": time_window["until"] if time_window else None,
+    }
+    state = {"position": None, "sum": 0.0, "count": 0, "skipped": 0, **window}
+    if continuation_token:
+        state = decode_continuation_token(
+            continuation_token,
+            CONTINUATION_METRIC,
+            global_variables["BITBUCKET_REPO_SLUG"],
+        )
+        if (state.get("since"), state.get("until")) != (
+            window["since"],
+            window["until"],
+        ):
+            raise FourTwoTwoError(
+                "Continuation token was issued for a different from/to window"
             )
-        except JenkinsHistoryLimit:
+
+    # a lead time is settled once its production build finishes
+    etag = metric_etag(
+        CONTINUATION_METRIC,
+        [
+            get_latest_pull_request_id(global_variables),
+            get_last_completed_build_number(global_variables["JENKINS_PR_JOB_NAME"]),
+        ],
+        {**window, "continuationToken": continuation_token},
+    )
+    if matches_etag(if_none_match, etag):
+        return not_modified_response(etag)
+
+    pull_requests = filter_pull_requests_to_window(
+        global_variables,
+        fetch_lead_time_pull_requests(global_variables),
+        time_window,
+    )
+    pull_requests = drop_pull_requests_before_retention(global_variables, pull_requests)
+
+    series_index = get_series_index(
+        LEAD_TIME_SERIES, global_variables["BITBUCKET_REPO_SLUG"]
+    )
+
+    lead_time_sum = state["sum"]
+    lead_time_count = state["count"]
+    skipped_count = state["skipped"]
+    last_processed_position = state["position"]
+    partial = False
+
+    for pull_request in pull_requests:
+        pull_request_id = pull_request.id
+        if already_processed(pull_request, state["position"]):
+            continue
+        if deadline.expired():
+            partial = True
             break
+        lead_time_record = series_index.get(pull_request_id)
+        if lead_time_record is None:
+            try:
+                lead_time_record = resolve_lead_time_record(
+                    global_variables, pull_request
+                )
+            except UnresolvableLineage:
+                skipped_count += 1
+                last_processed_position = merge_position(pull_request)
+                continue
+            except JenkinsHistoryLimit:
+                break
+            except FiveHundredError:
+                if not deadline.expired():
+                    raise
+                partial = True
+                break
+            series_index.add(
+                pull_request_id,
+                lead_time_record["productionFinishTimestamp"],
+                lead_time_record,
+            )
+        lead_time_sum += lead_time_record["durationSeconds"]
+        lead_time_count += 1
+        last_processed_position = merge_position(pull_request)
+
+    # an empty window is a valid answer, an empty history is not
+    if lead_time_count == 0 and not partial and not is_windowed(time_window):
+        raise FiveHundredError(
+            message=f"No pull requests could be resolved for {global_variables['BITBUCKET_REPO_SLUG']}"
+        )
 
-    average_lead_time_for_changes = sum(lead_time_for_changes) / len(
-        lead_time_for_changes
+    average_lead_time_for_changes = (
+        lead_time_sum / lead_time_count if lead_time_count else None
     )
 
-    return Response(
+    next_continuation_token = None
+    if partial:
+        logger.info(
+            "deadline reached, returning partial lead time for changes",
+            sampleSize=lead_time_count,
+        )
+        next_continuation_token = encode_continuation_token(
+            CONTINUATION_METRIC,
+            global_variables["BITBUCKET_REPO_SLUG"],
+            {
+                "position": last_processed_position,
+                "sum": lead_time_sum,
+                "count": lead_time_count,
+                "skipped": skipped_count,
+                **window,
+            },
+        )
+
+    response = Response(
         status_code=status_codes.codes.OK,
         content_type=content_types.APPLICATION_JSON,
         body=json.dumps(
@@ -63,7 +187,14 @@ def get_lead_time_for_changes_handler(global_variables):
                 "meanDurationInSeconds": average_lead_time_for_changes,
                 "meanDurationInDuration": timedelta_to_string(
                     timedelta(seconds=average_lead_time_for_changes)
-                ),
+                )
+                if average_lead_time_for_changes is not None
+                else None,
+                "sampleSize": lead_time_count,
+                "skipped": skipped_count,
+                "complete": not partial,
+                "continuationToken": next_continuation_token,
             }
         ),
     )
+    return with_etag(response, etag, complete=not partial)
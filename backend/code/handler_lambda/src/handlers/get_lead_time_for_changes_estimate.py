@@ -0,0 +1,194 @@
+from __future__ import annotations
+import json
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+from aws_lambda_powertools import Logger
+from requests import status_codes
+from aws_lambda_powertools.event_handler import Response, content_types
+
+from ..calculators.estimation import (
+    Estimate,
+    StratifiedSampler,
+    refine_estimate,
+    time_stratum,
+    time_stratum_bounds,
+)
+from ..calculators.lead_time_for_changes import resolve_lead_time_record
+from ..calculators.retention import drop_pull_requests_before_retention
+from ..calculators.shared import (
+    filter_pull_requests_to_window,
+    get_merged_pull_requests_since,
+)
+from ..exceptions import FiveHundredError, JenkinsHistoryLimit, UnresolvableLineage
+from ..helpers.datetime import (
+    bitbucket_datetime_to_jenkins_timestamp,
+    timedelta_to_string,
+)
+from ..helpers.deadline import Deadline
+from ..helpers.pagination import EstimateQuery, TimeWindow
+from ..models import PullRequest
+from ..stores.series import LEAD_TIME_SERIES, get_series_index
+
+logger = Logger(child=True)
+
+
+def merge_timestamps_of(pull_requests: List[PullRequest]) -> Dict[int, Optional[int]]:
+    return {
+        pull_request.id: bitbucket_datetime_to_jenkins_timestamp(
+            pull_request.merge_commit_date
+        )
+        if pull_request.merge_commit_date
+        else None
+        for pull_request in pull_requests
+    }
+
+
+def merge_timestamp_range(
+    merge_timestamps: Dict[int, Optional[int]]
+) -> Tuple[int, int]:
+    known = [timestamp for timestamp in merge_timestamps.values() if timestamp]
+    return min(known, default=0), max(known, default=0)
+
+
+def estimate_fields(
+    estimate: Estimate,
+    stopped_by: str,
+    estimate_query: EstimateQuery,
+    merge_range: Tuple[int, int],
+    skipped: int,
+    resolutions: int,
+) -> dict:
+    strata = []
+    for summary in estimate["strata"]:
+        time_bucket, hotfix = summary["stratum"]
+        since, until = time_stratum_bounds(time_bucket, *merge_range)
+        strata.append(
+            {
+                "since": since,
+                "until": until,
+                "hotfix": hotfix,
+                "populationSize": summary["populationSize"],
+                "sampleSize": summary["sampleSize"],
+                "meanSeconds": summary["meanSeconds"],
+            }
+        )
+    strata.sort(key=lambda stratum: (stratum["since"] or 0, stratum["hotfix"]))
+
+    return {
+        "confidenceInterval": {
+            "confidence": estimate_query["confidence"],
+            "lowerSeconds": estimate["lowerSeconds"],
+            "upperSeconds": estimate["upperSeconds"],
+            "widthSeconds": estimate["widthSeconds"],
+        },
+        "sampleSize": estimate["sampleSize"],
+        "populationSize": estimate["populationSize"],
+        "skipped": skipped,
+        "resolutions": resolutions,
+        "stoppedBy": stopped_by,
+        "strata": strata,
+    }
+
+
+def get_lead_time_for_changes_estimate_handler(
+    global_variables,
+    deadline: Deadline,
+    time_window: Optional[TimeWindow],
+    estimate_query: EstimateQuery,
+):
+    # every page of the merged history, or of it back to the window, rather
+    # than the newest page the exact route reads; sampling is what makes
+    # resolving that many lineages affordable
+    pull_requests = filter_pull_requests_to_window(
+        global_variables,
+        get_merged_pull_requests_since(
+            global_variables, time_window["since"] if time_window else None
+        ),
+        time_window,
+    )
+    pull_requests = drop_pull_requests_before_retention(global_variables, pull_requests)
+
+    # strata are the merge time buckets crossed with hotfix or not
+    merge_timestamps = merge_timestamps_of(pull_requests)
+    merge_range = merge_timestamp_range(merge_timestamps)
+    sampler = StratifiedSampler(
+        [
+            (
+                (
+                    time_stratum(merge_timestamps[pull_request.id], *merge_range),
+                    pull_request.is_hotfix,
+                ),
+                pull_request,
+            )
+            for pull_request in pull_requests
+        ],
+        estimate_query["seed"],
+    )
+
+    series_index = get_series_index(
+        LEAD_TIME_SERIES, global_variables["BITBUCKET_REPO_SLUG"]
+    )
+    resolutions = 0
+    skipped = 0
+
+    def measure(pull_request: PullRequest) -> Optional[float]:
+        nonlocal resolutions, skipped
+        lead_time_record = series_index.get(pull_request.id)
+        if lead_time_record is None:
+            resolutions += 1
+            try:
+                lead_time_record = resolve_lead_time_record(
+                    global_variables, pull_request
+                )
+            except (UnresolvableLineage, JenkinsHistoryLimit):
+                skipped += 1
+                return None
+            except FiveHundredError:
+                if not deadline.expired():
+                    raise
+                return None
+            series_index.add(
+                pull_request.id,
+                lead_time_record["productionFinishTimestamp"],
+                lead_time_record,
+            )
+        return lead_time_record["durationSeconds"]
+
+    estimate, stopped_by = refine_estimate(
+        sampler,
+        measure,
+        lambda: resolutions,
+        deadline,
+        estimate_query["confidence"],
+        estimate_query["targetWidth"],
+        estimate_query["budget"],
+    )
+    logger.info(
+        "estimated lead time for changes",
+        sampleSize=estimate["sampleSize"],
+        populationSize=estimate["populationSize"],
+        stoppedBy=stopped_by,
+    )
+
+    return Response(
+        status_code=status_codes.codes.OK,
+        content_type=content_types.APPLICATION_JSON,
+        body=json.dumps(
+            {
+                "meanDurationInSeconds": estimate["meanSeconds"],
+                "meanDurationInDuration": timedelta_to_string(
+                    timedelta(seconds=estimate["meanSeconds"])
+                )
+                if estimate["meanSeconds"] is not None
+                else None,
+                **estimate_fields(
+                    estimate,
+                    stopped_by,
+                    estimate_query,
+                    merge_range,
+                    skipped,
+                    resolutions,
+                ),
+            }
+        ),
+    )
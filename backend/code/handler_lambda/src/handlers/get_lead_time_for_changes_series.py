@@ -0,0 +1,109 @@
+import json
+from typing import Optional
+from aws_lambda_powertools import Logger
+from requests import status_codes
+from aws_lambda_powertools.event_handler import Response, content_types
+
+from ..calculators.lead_time_for_changes import resolve_lead_time_record
+from ..calculators.retention import get_retained_pull_requests_since
+from ..exceptions import (
+    FiveHundredError,
+    FourTwoTwoError,
+    JenkinsHistoryLimit,
+    UnresolvableLineage,
+)
+from ..helpers.continuation import merge_position
+from ..helpers.deadline import Deadline
+from ..helpers.encoding import records_to_columns
+from ..helpers.pagination import SeriesQuery
+from ..stores.series import (
+    LEAD_TIME_SERIES,
+    SeriesIndex,
+    get_series_index,
+)
+
+logger = Logger(child=True)
+
+
+def populate_lead_time_series(
+    global_variables,
+    series_index: SeriesIndex,
+    deadline: Deadline,
+    since: Optional[int] = None,
+) -> bool:
+    # pull requests merged before since are read back to one page past it,
+    # which covers the ones whose pipelines finished after it
+    pull_requests = get_retained_pull_requests_since(global_variables, since)
+
+    for pull_request in pull_requests:
+        pull_request_id = pull_request.id
+        if pull_request_id in series_index:
+            continue
+        # newest merge first, so everything from here on is out of reach
+        if (
+            series_index.history_limit_position is not None
+            and merge_position(pull_request) <= series_index.history_limit_position
+        ):
+            break
+        if deadline.expired():
+            return False
+        try:
+            lead_time_record = resolve_lead_time_record(global_variables, pull_request)
+        except UnresolvableLineage:
+            continue
+        except JenkinsHistoryLimit:
+            series_index.history_limit_position = merge_position(pull_request)
+            break
+        except FiveHundredError:
+            if not deadline.expired():
+                raise
+            return False
+        series_index.add(
+            pull_request_id,
+            lead_time_record["productionFinishTimestamp"],
+            lead_time_record,
+        )
+
+    return True
+
+
+def get_lead_time_for_changes_series_handler(
+    global_variables, deadline: Deadline, series_query: SeriesQuery
+):
+    series_index = get_series_index(
+        LEAD_TIME_SERIES, global_variables["BITBUCKET_REPO_SLUG"]
+    )
+
+    complete = populate_lead_time_series(
+        global_variables, series_index, deadline, series_query["since"]
+    )
+
+    if (
+        series_query["cursor"] is not None
+        and series_query["cursor"] not in series_index
+    ):
+        raise FourTwoTwoError(f"Unknown cursor: {series_query['cursor']}")
+
+    records, next_cursor = series_index.page(
+        series_query["since"],
+        series_query["until"],
+        series_query["cursor"],
+        series_query["limit"],
+    )
+
+    if series_query["format"] == "columnar":
+        series_body = {"columns": records_to_columns(records)}
+    else:
+        series_body = {"records": records}
+
+    return Response(
+        status_code=status_codes.codes.OK,
+        content_type=content_types.APPLICATION_JSON,
+        body=json.dumps(
+            {
+                **series_body,
+                "nextCursor": str(next_cursor) if next_cursor is not None else None,
+                "complete": complete,
+            }
+        ),
+    )
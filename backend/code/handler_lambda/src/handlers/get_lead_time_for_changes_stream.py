@@ -0,0 +1,114 @@
+from __future__ import annotations
+from datetime import timedelta
+from typing import Iterator, Optional
+from aws_lambda_powertools import Logger
+from requests import status_codes
+from aws_lambda_powertools.event_handler import Response
+
+from ..calculators.lead_time_for_changes import resolve_lead_time_record
+from ..calculators.retention import drop_pull_requests_before_retention
+from ..calculators.shared import filter_pull_requests_to_window
+from ..exceptions import FiveHundredError, JenkinsHistoryLimit, UnresolvableLineage
+from ..helpers.datetime import timedelta_to_string
+from ..helpers.deadline import Deadline
+from ..helpers.encoding import NDJSON_CONTENT_TYPE, to_ndjson
+from ..helpers.pagination import TimeWindow
+from ..stores.series import LEAD_TIME_SERIES, get_series_index
+from .get_lead_time_for_changes import fetch_lead_time_pull_requests
+
+logger = Logger(child=True)
+
+
+def stream_lead_time_for_changes(
+    global_variables, deadline: Deadline, time_window: Optional[TimeWindow] = None
+) -> Iterator[dict]:
+    # the pull requests are fetched before the first line, so a failure there
+    # can still be answered with an error status
+    pull_requests = filter_pull_requests_to_window(
+        global_variables,
+        fetch_lead_time_pull_requests(global_variables),
+        time_window,
+    )
+    pull_requests = drop_pull_requests_before_retention(global_variables, pull_requests)
+    return stream_lead_time_lines(global_variables, deadline, pull_requests)
+
+
+def stream_lead_time_lines(
+    global_variables, deadline: Deadline, pull_requests
+) -> Iterator[dict]:
+    series_index = get_series_index(
+        LEAD_TIME_SERIES, global_variables["BITBUCKET_REPO_SLUG"]
+    )
+
+    lead_time_sum = 0.0
+    lead_time_count = 0
+    skipped_count = 0
+    complete = True
+
+    for pull_request in pull_requests:
+        if deadline.expired():
+            complete = False
+            break
+        lead_time_record = series_index.get(pull_request.id)
+        if lead_time_record is None:
+            try:
+                lead_time_record = resolve_lead_time_record(
+                    global_variables, pull_request
+                )
+            except UnresolvableLineage:
+                skipped_count += 1
+                continue
+            except JenkinsHistoryLimit:
+                break
+            except FiveHundredError as err:
+                # the status line has already gone, so the failure is a line
+                yield {
+                    "type": "error",
+                    "pullRequestId": pull_request.id,
+                    "message": err.message,
+                }
+                complete = False
+                break
+            series_index.add(
+                pull_request.id,
+                lead_time_record["productionFinishTimestamp"],
+                lead_time_record,
+            )
+        lead_time_sum += lead_time_record["durationSeconds"]
+        lead_time_count += 1
+        yield {
+            "type": "record",
+            "record": lead_time_record,
+            "sampleSize": lead_time_count,
+            "meanDurationInSeconds": lead_time_sum / lead_time_count,
+        }
+
+    average_lead_time_for_changes = (
+        lead_time_sum / lead_time_count if lead_time_count else None
+    )
+    yield {
+        "type": "summary",
+        "meanDurationInSeconds": average_lead_time_for_changes,
+        "meanDurationInDuration": timedelta_to_string(
+            timedelta(seconds=average_lead_time_for_changes)
+        )
+        if average_lead_time_for_changes is not None
+        else None,
+        "sampleSize": lead_time_count,
+        "skipped": skipped_count,
+        "complete": complete,
+    }
+
+
+def get_lead_time_for_changes_stream_handler(
+    global_variables, deadline: Deadline, time_window: Optional[TimeWindow] = None
+):
+    # api gateway and the python runtime cannot stream a lambda response, so
+    # here the lines are buffered into one body; tools.serve streams them
+    return Response(
+        status_code=status_codes.codes.OK,
+        content_type=NDJSON_CONTENT_TYPE,
+        body=to_ndjson(
+            stream_lead_time_for_changes(global_variables, deadline, time_window)
+        ),
+    )
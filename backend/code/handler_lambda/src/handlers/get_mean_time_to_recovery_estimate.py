@@ -0,0 +1,176 @@
+from __future__ import annotations
+import json
+from datetime import timedelta
+from typing import Optional, Set, Tuple
+from aws_lambda_powertools import Logger
+from requests import status_codes
+from aws_lambda_powertools.event_handler import Response, content_types
+
+from ..calculators.estimation import StratifiedSampler, refine_estimate, time_stratum
+from ..calculators.mean_time_to_recovery import (
+    build_recovery_record,
+    filter_out_hotfix_pull_requests,
+    get_timestamp_of_pr_build_of_pull_request,
+)
+from ..calculators.retention import drop_pull_requests_before_retention
+from ..calculators.shared import (
+    filter_pull_requests_to_window,
+    get_merged_pull_requests_since,
+)
+from ..exceptions import FiveHundredError, JenkinsHistoryLimit, UnresolvableLineage
+from ..helpers.datetime import timedelta_to_string
+from ..helpers.deadline import Deadline
+from ..helpers.pagination import EstimateQuery, TimeWindow
+from ..models import PullRequest
+from ..stores.series import (
+    PRODUCTION_FINISH_SERIES,
+    RECOVERY_SERIES,
+    get_series_index,
+)
+from .get_lead_time_for_changes_estimate import (
+    estimate_fields,
+    merge_timestamp_range,
+    merge_timestamps_of,
+)
+
+logger = Logger(child=True)
+
+
+def get_mean_time_to_recovery_estimate_handler(
+    global_variables,
+    deadline: Deadline,
+    time_window: Optional[TimeWindow],
+    estimate_query: EstimateQuery,
+):
+    # every page of the merged history, as for the lead time estimate
+    pull_requests = filter_pull_requests_to_window(
+        global_variables,
+        get_merged_pull_requests_since(
+            global_variables, time_window["since"] if time_window else None
+        ),
+        time_window,
+    )
+    pull_requests = drop_pull_requests_before_retention(global_variables, pull_requests)
+    pull_requests = filter_out_hotfix_pull_requests(pull_requests)
+
+    # a recovery is a pair of neighbouring pull requests, newest first, and is
+    # stratified by when the recovering one merged and whether it was a hotfix
+    merge_timestamps = merge_timestamps_of(pull_requests)
+    merge_range = merge_timestamp_range(merge_timestamps)
+    sampler = StratifiedSampler(
+        [
+            (
+                (
+                    time_stratum(merge_timestamps[recovering.id], *merge_range),
+                    recovering.is_hotfix,
+                ),
+                (recovering, incident),
+            )
+            for recovering, incident in zip(pull_requests, pull_requests[1:])
+        ],
+        estimate_query["seed"],
+    )
+
+    finish_index = get_series_index(
+        PRODUCTION_FINISH_SERIES, global_variables["BITBUCKET_REPO_SLUG"]
+    )
+    recovery_index = get_series_index(
+        RECOVERY_SERIES, global_variables["BITBUCKET_REPO_SLUG"]
+    )
+    unresolved: Set[int] = set()
+    resolutions = 0
+    skipped = 0
+
+    def finish_timestamp_of(pull_request: PullRequest) -> Optional[int]:
+        nonlocal resolutions, skipped
+        finish_record = finish_index.get(pull_request.id)
+        if finish_record is not None:
+            return finish_record["productionFinishTimestamp"]
+        if pull_request.id in unresolved:
+            return None
+
+        resolutions += 1
+        try:
+            finish_timestamp = get_timestamp_of_pr_build_of_pull_request(
+                global_variables, pull_request
+            )
+        except (UnresolvableLineage, JenkinsHistoryLimit):
+            # neighbouring recoveries share the pull request, so it is only
+            # attempted once
+            unresolved.add(pull_request.id)
+            skipped += 1
+            return None
+        except FiveHundredError:
+            if not deadline.expired():
+                raise
+            return None
+        finish_index.add(
+            pull_request.id,
+            finish_timestamp,
+            {
+                "pullRequestId": pull_request.id,
+                "productionFinishTimestamp": finish_timestamp,
+            },
+        )
+        return finish_timestamp
+
+    def measure(pair: Tuple[PullRequest, PullRequest]) -> Optional[float]:
+        recovering, incident = pair
+        recovery_finish_timestamp = finish_timestamp_of(recovering)
+        if recovery_finish_timestamp is None:
+            return None
+        incident_finish_timestamp = finish_timestamp_of(incident)
+        if incident_finish_timestamp is None:
+            return None
+
+        recovery_record = build_recovery_record(
+            incident.id,
+            incident_finish_timestamp,
+            recovering.id,
+            recovery_finish_timestamp,
+        )
+        recovery_index.add(
+            recovering.id,
+            recovery_record["recoveryFinishTimestamp"],
+            recovery_record,
+        )
+        return recovery_record["durationSeconds"]
+
+    estimate, stopped_by = refine_estimate(
+        sampler,
+        measure,
+        lambda: resolutions,
+        deadline,
+        estimate_query["confidence"],
+        estimate_query["targetWidth"],
+        estimate_query["budget"],
+    )
+    logger.info(
+        "estimated mean time to recovery",
+        sampleSize=estimate["sampleSize"],
+        populationSize=estimate["populationSize"],
+        stoppedBy=stopped_by,
+    )
+
+    return Response(
+        status_code=status_codes.codes.OK,
+        content_type=content_types.APPLICATION_JSON,
+        body=json.dumps(
+            {
+                "meanTimeToRecoverySeconds": estimate["meanSeconds"],
+                "meanTimeToRecoveryDuration": timedelta_to_string(
+                    timedelta(seconds=estimate["meanSeconds"])
+                )
+                if estimate["meanSeconds"] is not None
+                else None,
+                **estimate_fields(
+                    estimate,
+                    stopped_by,
+                    estimate_query,
+                    merge_range,
+                    skipped,
+                    resolutions,
+                ),
+            }
+        ),
+    )
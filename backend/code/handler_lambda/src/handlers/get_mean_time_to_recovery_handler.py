@@ -1,6 +1,8 @@
+from __future__ import annotations
 import os
 import json
 from datetime import timedelta
+from typing import List, Tuple
 from aws_lambda_powertools import Logger
 from aws_lambda_powertools.event_handler import Response, content_types
 from aws_lambda_powertools.event_handler.api_gateway import APIGatewayProxyEvent
@@ -10,83 +12,441 @@ from ..helpers.datetime import (
     jenkins_build_datetime,
     timedelta_to_string,
 )
+from ..helpers.deadline import Deadline
+from ..helpers.etag import matches_etag, metric_etag, not_modified_response, with_etag
+from ..helpers.pagination import TimeWindow, is_windowed
+from ..helpers.continuation import (
+    already_processed,
+    encode_continuation_token,
+    decode_continuation_token,
+    merge_position,
+)
 from ..exceptions import (
     FiveHundredError,
+    FourTwoTwoError,
     JenkinsHistoryLimit,
+    UnresolvableLineage,
 )
 
 from ..calculators.mean_time_to_recovery import (
+    RecoveryAggregate,
+    add_finished_pull_request,
+    build_recovery_record,
+    calculate_mean_time_to_recovery_seconds,
+    empty_recovery_aggregate,
     filter_out_hotfix_pull_requests,
     get_timestamp_of_pr_build_of_pull_request,
+    is_recovery_candidate,
+    pass_over_pull_request,
+)
+from ..calculators.retention import drop_pull_requests_before_retention
+from ..calculators.shared import (
+    filter_pull_requests_to_window,
+    get_num_of_pull_requests,
+    get_all_pull_requests,
+    get_last_completed_build_number,
+    get_latest_pull_request_id,
+    get_merged_pull_requests_since,
+    get_pull_requests_after,
+    is_settled,
+)
+from ..models import PullRequest
+from ..stores.running import (
+    RECOVERY_AGGREGATE,
+    get_running_aggregate,
+    set_running_aggregate,
+)
+from ..stores.series import (
+    PRODUCTION_FINISH_SERIES,
+    RECOVERY_SERIES,
+    get_series_index,
 )
-from ..calculators.shared import get_num_of_pull_requests, get_all_pull_requests
 
 logger = Logger(child=True)
 
+CONTINUATION_METRIC = "mean-time-to-recovery"
 
-def get_mean_time_to_recovery_handler(global_variables):
-    num_of_bitbucket_pull_requests = get_num_of_pull_requests(global_variables)
 
-    pull_requests_response = get_all_pull_requests(
-        global_variables, num_of_bitbucket_pull_requests
+def fold_recoveries(
+    global_variables,
+    deadline: Deadline,
+    recovery_aggregate: RecoveryAggregate,
+    pull_requests: List[PullRequest],
+) -> Tuple[RecoveryAggregate, bool]:
+    # pull requests arrive newest first and all newer than the aggregate; they
+    # are folded oldest first, so every step leaves an aggregate worth keeping
+    # when the deadline or an upstream error cuts the fold short
+    repo_slug = global_variables["BITBUCKET_REPO_SLUG"]
+    finish_index = get_series_index(PRODUCTION_FINISH_SERIES, repo_slug)
+    recovery_index = get_series_index(RECOVERY_SERIES, repo_slug)
+    oldest_first = pull_requests[::-1]
+    initial_aggregate = recovery_aggregate
+    partial = False
+
+    try:
+        for position, pull_request in enumerate(oldest_first):
+            newer_pull_request = (
+                oldest_first[position + 1] if position + 1 < len(oldest_first) else None
+            )
+            if newer_pull_request is None and not pull_request.is_hotfix:
+                # whether it ends an incident depends on the next merge, so it
+                # is fetched again and decided then
+                break
+            if not is_recovery_candidate(pull_request, newer_pull_request):
+                recovery_aggregate = pass_over_pull_request(
+                    recovery_aggregate, pull_request.id, skipped=False
+                )
+                continue
+            if deadline.expired():
+                partial = True
+                break
+
+            finish_record = finish_index.get(pull_request.id)
+            if finish_record is None:
+                try:
+                    finish_timestamp = get_timestamp_of_pr_build_of_pull_request(
+                        global_variables, pull_request
+                    )
+                except (UnresolvableLineage, JenkinsHistoryLimit) as err:
+                    # a settled pull request whose lineage still fails is
+                    # skipped for good; a newer one is most likely on its way
+                    # to production, so folding stops and retries next time
+                    if not is_settled(pull_request):
+                        break
+                    # like the retention boundary, a pull request past the
+                    # jenkins history is dropped rather than counted
+                    recovery_aggregate = pass_over_pull_request(
+                        recovery_aggregate,
+                        pull_request.id,
+                        skipped=isinstance(err, UnresolvableLineage),
+                    )
+                    continue
+                except FiveHundredError:
+                    if not deadline.expired():
+                        raise
+                    partial = True
+                    break
+                finish_record = {
+                    "pullRequestId": pull_request.id,
+                    "productionFinishTimestamp": finish_timestamp,
+                }
+                finish_index.add(pull_request.id, finish_timestamp, finish_record)
+
+            recovery_aggregate, recovery_record = add_finished_pull_request(
+                recovery_aggregate,
+                pull_request.id,
+                finish_record["productionFinishTimestamp"],
+            )
+            if recovery_record is not None:
+                recovery_index.add(
+                    recovery_record["pullRequestId"],
+                    recovery_record["recoveryFinishTimestamp"],
+                    recovery_record,
+                )
+    finally:
+        if recovery_aggregate is not initial_aggregate:
+            set_running_aggregate(RECOVERY_AGGREGATE, repo_slug, recovery_aggregate)
+
+    return recovery_aggregate, partial
+
+
+def refresh_recovery_aggregate(
+    global_variables, deadline: Deadline, latest_pull_request_id: int | None
+) -> Tuple[RecoveryAggregate, bool]:
+    # merged pull requests are append only, so only the ones merged after the
+    # newest folded in are fetched; the first call folds in the whole retained
+    # history, so every container arrives at the same totals
+    recovery_aggregate = get_running_aggregate(
+        RECOVERY_AGGREGATE, global_variables["BITBUCKET_REPO_SLUG"]
     )
+    pull_requests = None
+    if (
+        recovery_aggregate is not None
+        and recovery_aggregate["newestPullRequestId"] is not None
+    ):
+        if (
+            latest_pull_request_id is None
+            or latest_pull_request_id == recovery_aggregate["newestPullRequestId"]
+        ):
+            return recovery_aggregate, False
+        pull_requests = get_pull_requests_after(
+            global_variables, recovery_aggregate["newestPullRequestId"]
+        )
 
-    pull_requests = []
+    if pull_requests is None:
+        pull_requests = drop_pull_requests_before_retention(
+            global_variables, get_merged_pull_requests_since(global_variables, None)
+        )
+        recovery_aggregate = empty_recovery_aggregate()
 
-    try:
-        pull_requests = pull_requests_response["values"]
-    except KeyError as err:
-        raise FiveHundredError(message=f"Key {str(err)} cannot be found in the dict")
+    return fold_recoveries(
+        global_variables, deadline, recovery_aggregate, pull_requests
+    )
+
+
+def get_running_mean_time_to_recovery(
+    global_variables,
+    deadline: Deadline,
+    latest_pull_request_id: int | None,
+    if_none_match: str | None,
+):
+    recovery_aggregate, partial = refresh_recovery_aggregate(
+        global_variables, deadline, latest_pull_request_id
+    )
+    # tagged from the aggregate served, which can trail the latest merge
+    # while bitbucket catches up
+    etag = metric_etag(CONTINUATION_METRIC, [recovery_aggregate])
+    if not partial and matches_etag(if_none_match, etag):
+        return not_modified_response(etag)
+
+    if recovery_aggregate["recoveryCount"] == 0 and not partial:
+        raise FiveHundredError(
+            message=f"No recoveries could be resolved for {global_variables['BITBUCKET_REPO_SLUG']}"
+        )
+
+    mean_time_to_recovery_seconds = calculate_mean_time_to_recovery_seconds(
+        recovery_aggregate
+    )
+
+    # the progress is already kept in the aggregate, so the token only asks
+    # for the fold to go on
+    next_continuation_token = None
+    if partial:
+        logger.info(
+            "deadline reached, returning partial mean time to recovery",
+            sampleSize=recovery_aggregate["recoveryCount"],
+        )
+        next_continuation_token = encode_continuation_token(
+            CONTINUATION_METRIC,
+            global_variables["BITBUCKET_REPO_SLUG"],
+            {"running": True, "since": None, "until": None},
+        )
+
+    response = Response(
+        status_code=status_codes.codes.OK,
+        content_type=content_types.APPLICATION_JSON,
+        body=json.dumps(
+            {
+                "meanTimeToRecoverySeconds": mean_time_to_recovery_seconds,
+                "meanTimeToRecoveryDuration": timedelta_to_string(
+                    timedelta(seconds=mean_time_to_recovery_seconds)
+                )
+                if mean_time_to_recovery_seconds is not None
+                else None,
+                "sampleSize": recovery_aggregate["recoveryCount"],
+                "skipped": recovery_aggregate["skipped"],
+                "complete": not partial,
+                "continuationToken": next_continuation_token,
+            }
+        ),
+    )
+    return with_etag(response, etag, complete=not partial)
+
+
+def get_mean_time_to_recovery_handler(
+    global_variables,
+    deadline: Deadline,
+    continuation_token: str | None = None,
+    time_window: TimeWindow | None = None,
+    if_none_match: str | None = None,
+):
+    window = {
+        "since": time_window["since"] if time_window else None,
+        "until": time_window["until"] if time_window else None,
+    }
+    state = {
+        "position": None,
+        "previousFinish": None,
+        "sum": 0.0,
+        "count": 0,
+        "skipped": 0,
+        **window,
+    }
+    if continuation_token:
+        state = decode_continuation_token(
+            continuation_token,
+            CONTINUATION_METRIC,
+            global_variables["BITBUCKET_REPO_SLUG"],
+        )
+        if (state.get("since"), state.get("until")) != (
+            window["since"],
+            window["until"],
+        ):
+            raise FourTwoTwoError(
+                "Continuation token was issued for a different from/to window"
+            )
+
+    latest_pull_request_id = get_latest_pull_request_id(global_variables)
+
+    # the whole history is append only and folded into a running aggregate; a
+    # window, or a token issued for a single pass, reads the pull requests again
+    if not is_windowed(time_window) and (
+        continuation_token is None or state.get("running")
+    ):
+        return get_running_mean_time_to_recovery(
+            global_variables, deadline, latest_pull_request_id, if_none_match
+        )
+
+    # recoveries are measured between finished production builds
+    etag = metric_etag(
+        CONTINUATION_METRIC,
+        [
+            latest_pull_request_id,
+            get_last_completed_build_number(global_variables["JENKINS_PR_JOB_NAME"]),
+        ],
+        {**window, "continuationToken": continuation_token},
+    )
+    if matches_etag(if_none_match, etag):
+        return not_modified_response(etag)
+
+    num_of_bitbucket_pull_requests = get_num_of_pull_requests(global_variables)
+
+    pull_requests = filter_pull_requests_to_window(
+        global_variables,
+        get_all_pull_requests(global_variables, num_of_bitbucket_pull_requests),
+        time_window,
+    )
+    pull_requests = drop_pull_requests_before_retention(global_variables, pull_requests)
 
     filtered_pull_request_with_non_hotfixes = filter_out_hotfix_pull_requests(
         pull_requests
     )
 
-    time_to_recoverys = []
+    finish_index = get_series_index(
+        PRODUCTION_FINISH_SERIES, global_variables["BITBUCKET_REPO_SLUG"]
+    )
+    recovery_index = get_series_index(
+        RECOVERY_SERIES, global_variables["BITBUCKET_REPO_SLUG"]
+    )
+
+    time_to_recovery_sum = state["sum"]
+    time_to_recovery_count = state["count"]
+    skipped_count = state["skipped"]
+    previous_finish_timestamp = state["previousFinish"]
+    last_processed_position = state["position"]
+    partial = False
 
     for pull_request in filtered_pull_request_with_non_hotfixes:
-        try:
-            jenkins_pr_build_of_current_pull_request_finish_timestamp = (
-                get_timestamp_of_pr_build_of_pull_request(
-                    global_variables, pull_request
-                )
-            )
-        except JenkinsHistoryLimit:
+        pull_request_id = pull_request.id
+        if already_processed(pull_request, state["position"]):
+            continue
+        if deadline.expired():
+            partial = True
             break
-
-        jenkins_pr_build_of_current_pull_request_finish_datetime = (
-            jenkins_build_datetime(
-                {"timestamp": jenkins_pr_build_of_current_pull_request_finish_timestamp}
+        finish_record = finish_index.get(pull_request_id)
+        if finish_record is None:
+            try:
+                finish_record = {
+                    "pullRequestId": pull_request_id,
+                    "productionFinishTimestamp": get_timestamp_of_pr_build_of_pull_request(
+                        global_variables, pull_request
+                    ),
+                }
+            except UnresolvableLineage:
+                skipped_count += 1
+                continue
+            except JenkinsHistoryLimit:
+                break
+            except FiveHundredError:
+                if not deadline.expired():
+                    raise
+                partial = True
+                break
+            finish_index.add(
+                pull_request_id,
+                finish_record["productionFinishTimestamp"],
+                finish_record,
             )
+        jenkins_pr_build_of_current_pull_request_finish_timestamp = finish_record[
+            "productionFinishTimestamp"
+        ]
+
+        previous_pull_request_id = (
+            last_processed_position[1] if last_processed_position else None
         )
+        last_processed_position = merge_position(pull_request)
 
-        if pull_request == filtered_pull_request_with_non_hotfixes[0]:
-            finish_datetime_one = (
-                jenkins_pr_build_of_current_pull_request_finish_datetime
+        if previous_finish_timestamp is None:
+            previous_finish_timestamp = (
+                jenkins_pr_build_of_current_pull_request_finish_timestamp
             )
             continue
 
-        finish_datetime_two = jenkins_pr_build_of_current_pull_request_finish_datetime
+        finish_datetime_one = jenkins_build_datetime(
+            {"timestamp": previous_finish_timestamp}
+        )
+        finish_datetime_two = jenkins_build_datetime(
+            {"timestamp": jenkins_pr_build_of_current_pull_request_finish_timestamp}
+        )
 
         duration: timedelta = finish_datetime_one - finish_datetime_two
 
-        time_to_recoverys.append(duration.total_seconds())
+        time_to_recovery_sum += duration.total_seconds()
+        time_to_recovery_count += 1
+
+        recovery_record = build_recovery_record(
+            pull_request_id,
+            jenkins_pr_build_of_current_pull_request_finish_timestamp,
+            previous_pull_request_id,
+            previous_finish_timestamp,
+        )
+        recovery_index.add(
+            previous_pull_request_id,
+            recovery_record["recoveryFinishTimestamp"],
+            recovery_record,
+        )
+
+        previous_finish_timestamp = (
+            jenkins_pr_build_of_current_pull_request_finish_timestamp
+        )
 
-        finish_datetime_one = finish_datetime_two
+    # an empty window is a valid answer, an empty history is not
+    if time_to_recovery_count == 0 and not partial and not is_windowed(time_window):
+        raise FiveHundredError(
+            message=f"No recoveries could be resolved for {global_variables['BITBUCKET_REPO_SLUG']}"
+        )
 
-    mean_time_to_recovery_seconds = sum(time_to_recoverys) / len(time_to_recoverys)
+    mean_time_to_recovery_seconds = (
+        time_to_recovery_sum / time_to_recovery_count
+        if time_to_recovery_count
+        else None
+    )
 
-    mean_time_to_recovery_timedelta = timedelta(seconds=mean_time_to_recovery_seconds)
+    next_continuation_token = None
+    if partial:
+        logger.info(
+            "deadline reached, returning partial mean time to recovery",
+            sampleSize=time_to_recovery_count,
+        )
+        next_continuation_token = encode_continuation_token(
+            CONTINUATION_METRIC,
+            global_variables["BITBUCKET_REPO_SLUG"],
+            {
+                "position": last_processed_position,
+                "previousFinish": previous_finish_timestamp,
+                "sum": time_to_recovery_sum,
+                "count": time_to_recovery_count,
+                "skipped": skipped_count,
+                **window,
+            },
+        )
 
-    return Response(
+    response = Response(
         status_code=status_codes.codes.OK,
         content_type=content_types.APPLICATION_JSON,
         body=json.dumps(
             {
                 "meanTimeToRecoverySeconds": mean_time_to_recovery_seconds,
                 "meanTimeToRecoveryDuration": timedelta_to_string(
-                    mean_time_to_recovery_timedelta
-                ),
+                    timedelta(seconds=mean_time_to_recovery_seconds)
+                )
+                if mean_time_to_recovery_seconds is not None
+                else None,
+                "sampleSize": time_to_recovery_count,
+                "skipped": skipped_count,
+                "complete": not partial,
+                "continuationToken": next_continuation_token,
             }
         ),
     )
+    return with_etag(response, etag, complete=not partial)
@@ -0,0 +1,143 @@
+import json
+from typing import Optional
+from aws_lambda_powertools import Logger
+from requests import status_codes
+from aws_lambda_powertools.event_handler import Response, content_types
+
+from ..calculators.mean_time_to_recovery import (
+    build_recovery_record,
+    filter_out_hotfix_pull_requests,
+    get_timestamp_of_pr_build_of_pull_request,
+)
+from ..calculators.retention import get_retained_pull_requests_since
+from ..exceptions import (
+    FiveHundredError,
+    FourTwoTwoError,
+    JenkinsHistoryLimit,
+    UnresolvableLineage,
+)
+from ..helpers.continuation import merge_position
+from ..helpers.deadline import Deadline
+from ..helpers.encoding import records_to_columns
+from ..helpers.pagination import SeriesQuery
+from ..stores.series import (
+    PRODUCTION_FINISH_SERIES,
+    RECOVERY_SERIES,
+    SeriesIndex,
+    get_series_index,
+)
+
+logger = Logger(child=True)
+
+
+def populate_recovery_series(
+    global_variables,
+    finish_index: SeriesIndex,
+    recovery_index: SeriesIndex,
+    deadline: Deadline,
+    since: Optional[int] = None,
+) -> bool:
+    # pull requests merged before since are read back to one page past it,
+    # which covers the deployments that recoveries after it started from
+    pull_requests = get_retained_pull_requests_since(global_variables, since)
+
+    complete = True
+    previous_pull_request_id = None
+    previous_finish_timestamp = None
+
+    for pull_request in filter_out_hotfix_pull_requests(pull_requests):
+        pull_request_id = pull_request.id
+        finish_record = finish_index.get(pull_request_id)
+
+        if finish_record is None:
+            # newest merge first, so everything from here on is out of reach
+            if (
+                finish_index.history_limit_position is not None
+                and merge_position(pull_request) <= finish_index.history_limit_position
+            ):
+                break
+            if deadline.expired():
+                complete = False
+                break
+            try:
+                finish_timestamp = get_timestamp_of_pr_build_of_pull_request(
+                    global_variables, pull_request
+                )
+            except UnresolvableLineage:
+                continue
+            except JenkinsHistoryLimit:
+                finish_index.history_limit_position = merge_position(pull_request)
+                break
+            except FiveHundredError:
+                if not deadline.expired():
+                    raise
+                complete = False
+                break
+            finish_record = {
+                "pullRequestId": pull_request_id,
+                "productionFinishTimestamp": finish_timestamp,
+            }
+            finish_index.add(pull_request_id, finish_timestamp, finish_record)
+
+        if previous_pull_request_id is not None:
+            recovery_record = build_recovery_record(
+                pull_request_id,
+                finish_record["productionFinishTimestamp"],
+                previous_pull_request_id,
+                previous_finish_timestamp,
+            )
+            recovery_index.add(
+                previous_pull_request_id,
+                recovery_record["recoveryFinishTimestamp"],
+                recovery_record,
+            )
+
+        previous_pull_request_id = pull_request_id
+        previous_finish_timestamp = finish_record["productionFinishTimestamp"]
+
+    return complete
+
+
+def get_mean_time_to_recovery_series_handler(
+    global_variables, deadline: Deadline, series_query: SeriesQuery
+):
+    finish_index = get_series_index(
+        PRODUCTION_FINISH_SERIES, global_variables["BITBUCKET_REPO_SLUG"]
+    )
+    recovery_index = get_series_index(
+        RECOVERY_SERIES, global_variables["BITBUCKET_REPO_SLUG"]
+    )
+
+    complete = populate_recovery_series(
+        global_variables, finish_index, recovery_index, deadline, series_query["since"]
+    )
+
+    if (
+        series_query["cursor"] is not None
+        and series_query["cursor"] not in recovery_index
+    ):
+        raise FourTwoTwoError(f"Unknown cursor: {series_query['cursor']}")
+
+    records, next_cursor = recovery_index.page(
+        series_query["since"],
+        series_query["until"],
+        series_query["cursor"],
+        series_query["limit"],
+    )
+
+    if series_query["format"] == "columnar":
+        series_body = {"columns": records_to_columns(records)}
+    else:
+        series_body = {"records": records}
+
+    return Response(
+        status_code=status_codes.codes.OK,
+        content_type=content_types.APPLICATION_JSON,
+        body=json.dumps(
+            {
+                **series_body,
+                "nextCursor": str(next_cursor) if next_cursor is not None else None,
+                "complete": complete,
+            }
+        ),
+    )
@@ -0,0 +1,155 @@
+from __future__ import annotations
+from datetime import timedelta
+from typing import Iterator, Optional
+from aws_lambda_powertools import Logger
+from requests import status_codes
+from aws_lambda_powertools.event_handler import Response
+
+from ..calculators.mean_time_to_recovery import (
+    build_recovery_record,
+    filter_out_hotfix_pull_requests,
+    get_timestamp_of_pr_build_of_pull_request,
+)
+from ..calculators.retention import drop_pull_requests_before_retention
+from ..calculators.shared import (
+    filter_pull_requests_to_window,
+    get_all_pull_requests,
+    get_num_of_pull_requests,
+)
+from ..exceptions import FiveHundredError, JenkinsHistoryLimit, UnresolvableLineage
+from ..helpers.datetime import timedelta_to_string
+from ..helpers.deadline import Deadline
+from ..helpers.encoding import NDJSON_CONTENT_TYPE, to_ndjson
+from ..helpers.pagination import TimeWindow
+from ..stores.series import (
+    PRODUCTION_FINISH_SERIES,
+    RECOVERY_SERIES,
+    get_series_index,
+)
+
+logger = Logger(child=True)
+
+
+def stream_mean_time_to_recovery(
+    global_variables, deadline: Deadline, time_window: Optional[TimeWindow] = None
+) -> Iterator[dict]:
+    # the pull requests are fetched before the first line, so a failure there
+    # can still be answered with an error status
+    num_of_bitbucket_pull_requests = get_num_of_pull_requests(global_variables)
+    pull_requests = filter_pull_requests_to_window(
+        global_variables,
+        get_all_pull_requests(global_variables, num_of_bitbucket_pull_requests),
+        time_window,
+    )
+    pull_requests = drop_pull_requests_before_retention(global_variables, pull_requests)
+    return stream_recovery_lines(
+        global_variables, deadline, filter_out_hotfix_pull_requests(pull_requests)
+    )
+
+
+def stream_recovery_lines(
+    global_variables, deadline: Deadline, pull_requests
+) -> Iterator[dict]:
+    finish_index = get_series_index(
+        PRODUCTION_FINISH_SERIES, global_variables["BITBUCKET_REPO_SLUG"]
+    )
+    recovery_index = get_series_index(
+        RECOVERY_SERIES, global_variables["BITBUCKET_REPO_SLUG"]
+    )
+
+    time_to_recovery_sum = 0.0
+    time_to_recovery_count = 0
+    skipped_count = 0
+    previous_pull_request_id = None
+    previous_finish_timestamp = None
+    complete = True
+
+    for pull_request in pull_requests:
+        if deadline.expired():
+            complete = False
+            break
+        finish_record = finish_index.get(pull_request.id)
+        if finish_record is None:
+            try:
+                finish_record = {
+                    "pullRequestId": pull_request.id,
+                    "productionFinishTimestamp": get_timestamp_of_pr_build_of_pull_request(
+                        global_variables, pull_request
+                    ),
+                }
+            except UnresolvableLineage:
+                skipped_count += 1
+                continue
+            except JenkinsHistoryLimit:
+                break
+            except FiveHundredError as err:
+                # the status line has already gone, so the failure is a line
+                yield {
+                    "type": "error",
+                    "pullRequestId": pull_request.id,
+                    "message": err.message,
+                }
+                complete = False
+                break
+            finish_index.add(
+                pull_request.id,
+                finish_record["productionFinishTimestamp"],
+                finish_record,
+            )
+
+        if previous_pull_request_id is not None:
+            recovery_record = build_recovery_record(
+                pull_request.id,
+                finish_record["productionFinishTimestamp"],
+                previous_pull_request_id,
+                previous_finish_timestamp,
+            )
+            recovery_index.add(
+                previous_pull_request_id,
+                recovery_record["recoveryFinishTimestamp"],
+                recovery_record,
+            )
+            time_to_recovery_sum += recovery_record["durationSeconds"]
+            time_to_recovery_count += 1
+            yield {
+                "type": "record",
+                "record": recovery_record,
+                "sampleSize": time_to_recovery_count,
+                "meanTimeToRecoverySeconds": time_to_recovery_sum
+                / time_to_recovery_count,
+            }
+
+        previous_pull_request_id = pull_request.id
+        previous_finish_timestamp = finish_record["productionFinishTimestamp"]
+
+    mean_time_to_recovery_seconds = (
+        time_to_recovery_sum / time_to_recovery_count
+        if time_to_recovery_count
+        else None
+    )
+    yield {
+        "type": "summary",
+        "meanTimeToRecoverySeconds": mean_time_to_recovery_seconds,
+        "meanTimeToRecoveryDuration": timedelta_to_string(
+            timedelta(seconds=mean_time_to_recovery_seconds)
+        )
+        if mean_time_to_recovery_seconds is not None
+        else None,
+        "sampleSize": time_to_recovery_count,
+        "skipped": skipped_count,
+        "complete": complete,
+    }
+
+
+def get_mean_time_to_recovery_stream_handler(
+    global_variables, deadline: Deadline, time_window: Optional[TimeWindow] = None
+):
+    # api gateway and the python runtime cannot stream a lambda response, so
+    # here the lines are buffered into one body; tools.serve streams them
+    return Response(
+        status_code=status_codes.codes.OK,
+        content_type=NDJSON_CONTENT_TYPE,
+        body=to_ndjson(
+            stream_mean_time_to_recovery(global_variables, deadline, time_window)
+        ),
+    )
@@ -0,0 +1,161 @@
+from __future__ import annotations
+from typing import Dict, List, Optional, Tuple
+from aws_lambda_powertools import Logger
+from requests import status_codes
+from aws_lambda_powertools.event_handler import Response
+
+from ..globals import get_all_project_global_variables
+from ..stores.aggregates import (
+    DURATION_BUCKETS_SECONDS,
+    DurationHistogram,
+    aggregates_generation,
+    aggregates_lock,
+    get_deployment_aggregates,
+    get_repo_aggregates,
+)
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+logger = Logger(child=True)
+
+# format -> (aggregates generation, rendered text)
+rendered_metrics: Dict[str, Tuple[int, str]] = {}
+
+
+def wants_openmetrics(accept: Optional[str]) -> bool:
+    return accept is not None and "application/openmetrics-text" in accept
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_value(value: float) -> str:
+    return repr(float(value))
+
+
+def histogram_samples(
+    name: str, labels: str, histogram: DurationHistogram
+) -> List[str]:
+    samples = []
+    cumulative_count = 0
+    for upper_bound, bucket_count in zip(
+        DURATION_BUCKETS_SECONDS + ("+Inf",), histogram.bucket_counts
+    ):
+        cumulative_count += bucket_count
+        le = "+Inf" if upper_bound == "+Inf" else format_value(upper_bound)
+        samples.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative_count}')
+    samples.append(f"{name}_sum{{{labels}}} {format_value(histogram.sum)}")
+    samples.append(f"{name}_count{{{labels}}} {histogram.count}")
+    return samples
+
+
+def render_metrics(openmetrics: bool) -> str:
+    # one pass over the projects and their fixed size aggregates, so the cost
+    # does not grow with the length of any project's history
+    families = {
+        "dora_deployments": ("gauge", "Successful production deployments", []),
+        "dora_last_deployment_timestamp_seconds": (
+            "gauge",
+            "Start time of the latest successful production deployment",
+            [],
+        ),
+        "dora_change_failure_ratio": (
+            "gauge",
+            "Share of recent merged pull requests that were hotfixes",
+            [],
+        ),
+        "dora_lead_time_seconds": (
+            "histogram",
+            "Time from the first green st build to the end of the production deployment",
+            [],
+        ),
+        "dora_time_to_recovery_seconds": (
+            "histogram",
+            "Time between consecutive production deployments",
+            [],
+        ),
+    }
+
+    with aggregates_lock:
+        for project_id, global_variables in enumerate(
+            get_all_project_global_variables(), start=1
+        ):
+            labels = (
+                f'project="{project_id}",'
+                f'repo="{escape_label_value(global_variables["BITBUCKET_REPO_SLUG"])}"'
+            )
+
+            deployment_aggregates = get_deployment_aggregates(
+                global_variables["JENKINS_JOB_NAME"]
+            )
+            if (
+                deployment_aggregates is not None
+                and deployment_aggregates.deployments is not None
+            ):
+                families["dora_deployments"][2].append(
+                    f"dora_deployments{{{labels}}} {deployment_aggregates.deployments}"
+                )
+                if deployment_aggregates.last_deployment_timestamp is not None:
+                    families["dora_last_deployment_timestamp_seconds"][2].append(
+                        f"dora_last_deployment_timestamp_seconds{{{labels}}} "
+                        f"{format_value(deployment_aggregates.last_deployment_timestamp)}"
+                    )
+
+            repo_aggregates = get_repo_aggregates(
+                global_variables["BITBUCKET_REPO_SLUG"]
+            )
+            if repo_aggregates is None:
+                continue
+            if repo_aggregates.change_failure_ratio is not None:
+                families["dora_change_failure_ratio"][2].append(
+                    f"dora_change_failure_ratio{{{labels}}} "
+                    f"{format_value(repo_aggregates.change_failure_ratio)}"
+                )
+            if repo_aggregates.lead_time.count:
+                families["dora_lead_time_seconds"][2].extend(
+                    histogram_samples(
+                        "dora_lead_time_seconds", labels, repo_aggregates.lead_time
+                    )
+                )
+            if repo_aggregates.time_to_recovery.count:
+                families["dora_time_to_recovery_seconds"][2].extend(
+                    histogram_samples(
+                        "dora_time_to_recovery_seconds",
+                        labels,
+                        repo_aggregates.time_to_recovery,
+                    )
+                )
+
+    lines = []
+    for name, (metric_type, help_text, samples) in families.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.extend(samples)
+    if openmetrics:
+        lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def get_metrics_handler(accept: Optional[str]):
+    # reports what this container has resolved so far, see stores.aggregates
+    openmetrics = wants_openmetrics(accept)
+    metrics_format = "openmetrics" if openmetrics else "prometheus"
+
+    # read before rendering, so a change made mid-render leaves a stale
+    # generation behind and the next scrape renders again
+    generation = aggregates_generation()
+    rendered = rendered_metrics.get(metrics_format)
+    if rendered is None or rendered[0] != generation:
+        logger.debug("rendering metrics", format=metrics_format, generation=generation)
+        rendered = (generation, render_metrics(openmetrics))
+        rendered_metrics[metrics_format] = rendered
+
+    return Response(
+        status_code=status_codes.codes.OK,
+        content_type=OPENMETRICS_CONTENT_TYPE
+        if openmetrics
+        else PROMETHEUS_CONTENT_TYPE,
+        body=rendered[1],
+    )
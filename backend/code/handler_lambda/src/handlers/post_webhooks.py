@@ -0,0 +1,257 @@
+from __future__ import annotations
+import os
+import json
+import time
+from typing import List, Optional
+from aws_lambda_powertools import Logger
+from requests import status_codes
+from aws_lambda_powertools.event_handler import Response, content_types
+
+from ..calculators.change_failure_rate import calculate_change_failure_rate
+from ..calculators.commit_build_index import record_finished_commit_build
+from ..calculators.deployment_frequency import add_deployment
+from ..calculators.upstream_build_index import (
+    AT_UPSTREAM_URL_PARTS,
+    matches_upstream_url,
+    record_finished_build,
+)
+from ..exceptions import FourTwoTwoError
+from ..globals import get_all_project_global_variables
+from ..helpers.webhooks import (
+    BITBUCKET_MERGED_EVENT,
+    FinishedBuildEvent,
+    MergedPullRequestEvent,
+    is_finished_build_payload,
+    load_webhook_body,
+    matches_job,
+    parse_finished_build_event,
+    parse_merged_pull_request_event,
+    verify_bitbucket_signature,
+    verify_webhook_token,
+)
+from ..stores.aggregates import set_change_failure_ratio, set_deployment_frequency
+from ..stores.build_index import BuildRecord
+from ..stores.cache import RESULT_CACHE_TTL_SECONDS, MemoryCache, result_cache
+from ..stores.lineage import get_pending_lineages
+from ..stores.running import CHANGE_FAILURE_AGGREGATE, get_running_aggregate
+from ..stores.series import (
+    LEAD_TIME_SERIES,
+    MERGE_SERIES,
+    PRODUCTION_FINISH_SERIES,
+    get_series_index,
+)
+from .get_change_failure_rate import refresh_change_failure_aggregate
+from .get_deployment_frequency import deployment_frequency_cache_key
+
+# bitbucket and the notification plugin both retry deliveries
+WEBHOOK_DELIVERY_TTL_SECONDS = int(os.getenv("WEBHOOK_DELIVERY_TTL_SECONDS", "3600"))
+
+logger = Logger(child=True)
+
+seen_deliveries = MemoryCache()
+
+
+def first_delivery(delivery_key: str) -> bool:
+    if seen_deliveries.get(delivery_key) is not None:
+        return False
+    seen_deliveries.set(delivery_key, True, time.time() + WEBHOOK_DELIVERY_TTL_SECONDS)
+    return True
+
+
+def accepted_response(event: str, updated: List[str]):
+    return Response(
+        status_code=status_codes.codes.ACCEPTED,
+        content_type=content_types.APPLICATION_JSON,
+        body=json.dumps({"event": event, "updated": updated}),
+    )
+
+
+def apply_merged_pull_request(global_variables, merged: MergedPullRequestEvent):
+    repo_slug = global_variables["BITBUCKET_REPO_SLUG"]
+
+    get_series_index(MERGE_SERIES, repo_slug).add(
+        merged["pullRequestId"],
+        merged["mergeTimestamp"],
+        {
+            "pullRequestId": merged["pullRequestId"],
+            "mergeTimestamp": merged["mergeTimestamp"],
+        },
+    )
+    get_pending_lineages(repo_slug).add_merge(
+        merged["pullRequestId"], merged["mergeCommit"], merged["mergeTimestamp"]
+    )
+    updated = ["merge-index", "lineage"]
+
+    # only an aggregate some request already seeded is caught up; the merged
+    # pull request is fetched with any merges whose webhooks went missing, so
+    # none of them is ever skipped
+    if get_running_aggregate(CHANGE_FAILURE_AGGREGATE, repo_slug) is not None:
+        change_failure_aggregate, folded = refresh_change_failure_aggregate(
+            global_variables, merged["pullRequestId"]
+        )
+        if folded:
+            set_change_failure_ratio(
+                repo_slug,
+                calculate_change_failure_rate(change_failure_aggregate)[
+                    "percentageOfChangeFailures"
+                ],
+            )
+            updated.append("change-failure-rate")
+
+    return updated
+
+
+def post_bitbucket_webhook_handler(
+    body: Optional[str], event_key: Optional[str], signature: Optional[str]
+):
+    verify_bitbucket_signature((body or "").encode("utf-8"), signature)
+    if event_key != BITBUCKET_MERGED_EVENT:
+        return accepted_response(event_key or "", [])
+
+    merged = parse_merged_pull_request_event(load_webhook_body(body))
+    projects = [
+        global_variables
+        for global_variables in get_all_project_global_variables()
+        if global_variables["BITBUCKET_REPO_SLUG"] == merged["repoSlug"]
+    ]
+    if not projects:
+        raise FourTwoTwoError(f"Unknown repository: {merged['repoSlug']}")
+
+    updated = []
+    if first_delivery(f"bitbucket:{merged['repoSlug']}:{merged['pullRequestId']}"):
+        # projects sharing a repository share its stores, so one is enough
+        updated = apply_merged_pull_request(projects[0], merged)
+
+    logger.info(
+        "applied bitbucket webhook",
+        repoSlug=merged["repoSlug"],
+        pullRequestId=merged["pullRequestId"],
+        updated=updated,
+    )
+    return accepted_response(event_key, updated)
+
+
+def apply_finished_build(global_variables, finished: FinishedBuildEvent) -> List[str]:
+    repo_slug = global_variables["BITBUCKET_REPO_SLUG"]
+    pending_lineages = get_pending_lineages(repo_slug)
+    updated = []
+
+    if matches_job(global_variables["JENKINS_ST_JOB_NAME"], finished):
+        if record_finished_commit_build(
+            global_variables["JENKINS_ST_JOB_NAME"],
+            finished["number"],
+            finished["timestamp"],
+            finished["result"],
+            finished["commits"],
+        ):
+            updated.append("commit-index")
+        pending_lineages.st_build_finished(
+            finished["number"],
+            finished["timestamp"],
+            finished["result"],
+            finished["commits"],
+        )
+        updated.append("lineage")
+
+    if matches_job(global_variables["JENKINS_AT_JOB_NAME"], finished):
+        # only st builds of main trigger the at builds a lineage waits on, as
+        # in the xpath resolver and the at build index
+        upstream_build = (
+            finished["upstreamBuild"]
+            if matches_upstream_url(finished["upstreamUrl"], AT_UPSTREAM_URL_PARTS)
+            else None
+        )
+        pending_lineages.at_build_finished(
+            finished["number"], upstream_build, finished["result"]
+        )
+        updated.append("lineage")
+
+    if matches_job(global_variables["JENKINS_PR_JOB_NAME"], finished):
+        lead_time_index = get_series_index(LEAD_TIME_SERIES, repo_slug)
+        finish_index = get_series_index(PRODUCTION_FINISH_SERIES, repo_slug)
+        for lineage in pending_lineages.production_build_finished(
+            finished["upstreamBuild"], finished["timestamp"], finished["duration"]
+        ):
+            lead_time_record = lineage.to_lead_time_record()
+            lead_time_index.add(
+                lead_time_record["pullRequestId"],
+                lead_time_record["productionFinishTimestamp"],
+                lead_time_record,
+            )
+            finish_index.add(
+                lead_time_record["pullRequestId"],
+                lead_time_record["productionFinishTimestamp"],
+                {
+                    "pullRequestId": lead_time_record["pullRequestId"],
+                    "productionFinishTimestamp": lead_time_record[
+                        "productionFinishTimestamp"
+                    ],
+                },
+            )
+            updated.append("lead-time-series")
+
+    if (
+        matches_job(global_variables["JENKINS_JOB_NAME"], finished)
+        and finished["result"] == "SUCCESS"
+    ):
+        cache_key = deployment_frequency_cache_key(global_variables)
+        deployment_frequency = result_cache.get(cache_key)
+        if deployment_frequency is not None:
+            deployment_frequency = add_deployment(
+                deployment_frequency, finished["timestamp"]
+            )
+            result_cache.set(cache_key, deployment_frequency, RESULT_CACHE_TTL_SECONDS)
+            set_deployment_frequency(
+                global_variables["JENKINS_JOB_NAME"], deployment_frequency
+            )
+            updated.append("deployment-frequency")
+
+    return updated
+
+
+def post_jenkins_webhook_handler(body: Optional[str], token: Optional[str]):
+    verify_webhook_token(token)
+    payload = load_webhook_body(body)
+    if not is_finished_build_payload(payload):
+        return accepted_response("jenkins:build", [])
+
+    finished = parse_finished_build_event(payload)
+    projects = get_all_project_global_variables()
+    job_names = {
+        global_variables[key]
+        for global_variables in projects
+        for key in (
+            "JENKINS_ST_JOB_NAME",
+            "JENKINS_AT_JOB_NAME",
+            "JENKINS_PR_JOB_NAME",
+            "JENKINS_JOB_NAME",
+        )
+        if matches_job(global_variables[key], finished)
+    }
+    if not job_names:
+        raise FourTwoTwoError(
+            f"Unknown job: {finished['jobUrl'] or finished['jobName']}"
+        )
+
+    updated = set()
+    if first_delivery(f"jenkins:{min(job_names)}:{finished['number']}"):
+        build_record = BuildRecord(
+            finished["number"],
+            finished["upstreamBuild"],
+            finished["timestamp"],
+            finished["duration"],
+            finished["result"],
+        )
+        for job_name in job_names:
+            if record_finished_build(job_name, build_record, finished["upstreamUrl"]):
+                updated.add("build-index")
+        for global_variables in projects:
+            updated.update(apply_finished_build(global_variables, finished))
+
+    logger.info(
+        "applied jenkins webhook",
+        jobs=sorted(job_names),
+        number=finished["number"],
+        updated=sorted(updated),
+    )
+    return accepted_response("jenkins:build", sorted(updated))
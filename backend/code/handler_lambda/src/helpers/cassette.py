@@ -0,0 +1,143 @@
+from __future__ import annotations
+import os
+import gzip
+import json
+import time
+import threading
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from aws_lambda_powertools import Logger
+
+# "record" appends every upstream exchange to the cassette, "replay" serves
+# responses from it without touching the network
+UPSTREAM_CASSETTE_MODE = os.getenv("UPSTREAM_CASSETTE_MODE", "")
+UPSTREAM_CASSETTE_PATH = os.getenv(
+    "UPSTREAM_CASSETTE_PATH", "/tmp/upstream-cassette.jsonl.gz"
+)
+# 0 replays instantly, 1 sleeps for the recorded latency of every response
+UPSTREAM_CASSETTE_LATENCY_SCALE = float(
+    os.getenv("UPSTREAM_CASSETTE_LATENCY_SCALE", "0")
+)
+
+RECORDED_HEADERS = ("Content-Type", "Retry-After", "ETag", "Last-Modified")
+CREDENTIAL_QUERY_PARAMETERS = ("token", "access_token", "api_key", "apikey")
+CASSETTE_MISS_STATUS = 599
+
+logger = Logger(child=True)
+
+
+def sanitize_url(url: str) -> str:
+    # drop userinfo and credential query parameters so cassettes can be shared
+    parts = urlsplit(url)
+    netloc = parts.netloc.rpartition("@")[2]
+    query = urlencode(
+        [
+            (key, value)
+            for key, value in parse_qsl(parts.query, keep_blank_values=True)
+            if key.lower() not in CREDENTIAL_QUERY_PARAMETERS
+        ],
+        safe="/[],=()':*",
+    )
+    return urlunsplit((parts.scheme, netloc, parts.path, query, parts.fragment))
+
+
+class Cassette:
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.pending = []
+        self.interactions = None
+        self.replay_positions = {}
+
+    def record(self, url: str, response: Optional[Response], latency_seconds: float):
+        interaction = {
+            "url": sanitize_url(url),
+            "latencyMs": round(latency_seconds * 1000, 1),
+        }
+        if response is None:
+            interaction["status"] = None
+        else:
+            interaction["status"] = response.status_code
+            interaction["headers"] = {
+                header: response.headers[header]
+                for header in RECORDED_HEADERS
+                if header in response.headers
+            }
+            interaction["body"] = response.text
+        with self.lock:
+            self.pending.append(interaction)
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, []
+        if not pending:
+            return
+        # one gzip member per flush; gzip readers concatenate members
+        with gzip.open(self.path, "at", encoding="utf-8") as cassette_file:
+            for interaction in pending:
+                cassette_file.write(json.dumps(interaction, separators=(",", ":")))
+                cassette_file.write("\n")
+
+    def load(self):
+        interactions = {}
+        if os.path.exists(self.path):
+            with gzip.open(self.path, "rt", encoding="utf-8") as cassette_file:
+                for line in cassette_file:
+                    interaction = json.loads(line)
+                    interactions.setdefault(interaction["url"], []).append(interaction)
+        logger.info(
+            "loaded upstream cassette",
+            path=self.path,
+            urls=len(interactions),
+        )
+        return interactions
+
+    def replay(self, url: str) -> Optional[Response]:
+        with self.lock:
+            if self.interactions is None:
+                self.interactions = self.load()
+            key = sanitize_url(url)
+            recorded = self.interactions.get(key)
+            if not recorded:
+                interaction = None
+            else:
+                # repeated calls walk the recording in order, then stay on the last
+                position = self.replay_positions.get(key, 0)
+                self.replay_positions[key] = position + 1
+                interaction = recorded[min(position, len(recorded) - 1)]
+
+        if interaction is None:
+            logger.warning("no recorded upstream response", url=key)
+            return replayed_response(
+                url, CASSETTE_MISS_STATUS, {}, "no recorded response"
+            )
+
+        if UPSTREAM_CASSETTE_LATENCY_SCALE > 0:
+            time.sleep(
+                interaction["latencyMs"] / 1000.0 * UPSTREAM_CASSETTE_LATENCY_SCALE
+            )
+        if interaction["status"] is None:
+            return None
+        return replayed_response(
+            url, interaction["status"], interaction["headers"], interaction["body"]
+        )
+
+
+def replayed_response(url: str, status: int, headers: dict, body: str) -> Response:
+    response = Response()
+    response.url = url
+    response.status_code = status
+    response.headers = CaseInsensitiveDict(headers)
+    response.encoding = "utf-8"
+    response._content = body.encode("utf-8")
+    return response
+
+
+cassette = Cassette(UPSTREAM_CASSETTE_PATH) if UPSTREAM_CASSETTE_MODE else None
+
+
+def flush_cassette():
+    if cassette is not None and UPSTREAM_CASSETTE_MODE == "record":
+        cassette.flush()
@@ -0,0 +1,122 @@
+from __future__ import annotations
+import os
+import io
+import csv
+from itertools import islice
+from typing import BinaryIO, Iterable, Iterator, List, Tuple
+from aws_lambda_powertools import Logger
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    # optional: without pyarrow every export is written as csv
+    pyarrow = None
+
+EXPORT_ROW_GROUP_SIZE = int(os.getenv("EXPORT_ROW_GROUP_SIZE", "10000"))
+EXPORT_PARQUET_COMPRESSION = os.getenv("EXPORT_PARQUET_COMPRESSION", "zstd")
+
+EXPORT_FORMATS = ("parquet", "arrow", "csv")
+CONTENT_TYPES = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+    "csv": "text/csv",
+}
+FILE_EXTENSIONS = {"parquet": "parquet", "arrow": "arrow", "csv": "csv"}
+
+# (column name, "int64" | "float64" | "string")
+Columns = List[Tuple[str, str]]
+
+logger = Logger(child=True)
+
+
+def batched(rows: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def export_format_available(export_format: str) -> bool:
+    return export_format == "csv" or pyarrow is not None
+
+
+def resolve_export_format(export_format: str) -> str:
+    if not export_format_available(export_format):
+        logger.warning(
+            "pyarrow is not installed, falling back to csv",
+            requestedFormat=export_format,
+        )
+        return "csv"
+    return export_format
+
+
+class CsvTableWriter:
+    def __init__(self, sink: BinaryIO, columns: Columns):
+        self.columns = [name for name, _ in columns]
+        self.text = io.TextIOWrapper(sink, encoding="utf-8", newline="")
+        self.writer = csv.writer(self.text)
+        self.writer.writerow(self.columns)
+
+    def write_batch(self, rows: List[dict]):
+        self.writer.writerows(
+            [[row.get(name) for name in self.columns] for row in rows]
+        )
+
+    def close(self):
+        self.text.flush()
+        # leave the sink open for the caller
+        self.text.detach()
+
+
+class ArrowTableWriter:
+    def __init__(self, sink: BinaryIO, columns: Columns, export_format: str):
+        self.schema = pyarrow.schema(
+            [(name, getattr(pyarrow, column_type)()) for name, column_type in columns]
+        )
+        self.export_format = export_format
+        if export_format == "parquet":
+            self.writer = pyarrow.parquet.ParquetWriter(
+                sink, self.schema, compression=EXPORT_PARQUET_COMPRESSION
+            )
+        else:
+            self.writer = pyarrow.ipc.new_file(sink, self.schema)
+
+    def write_batch(self, rows: List[dict]):
+        batch = pyarrow.RecordBatch.from_pylist(rows, schema=self.schema)
+        if self.export_format == "parquet":
+            # one row group per batch keeps row group statistics useful for
+            # timestamp predicates
+            self.writer.write_table(
+                pyarrow.Table.from_batches([batch]), row_group_size=len(rows)
+            )
+        else:
+            self.writer.write_batch(batch)
+
+    def close(self):
+        self.writer.close()
+
+
+def write_table(
+    sink: BinaryIO,
+    columns: Columns,
+    rows: Iterable[dict],
+    export_format: str,
+    row_group_size: int = EXPORT_ROW_GROUP_SIZE,
+) -> int:
+    if export_format == "csv":
+        writer = CsvTableWriter(sink, columns)
+    else:
+        writer = ArrowTableWriter(sink, columns, export_format)
+
+    row_count = 0
+    try:
+        for batch in batched(rows, row_group_size):
+            writer.write_batch(batch)
+            row_count += len(batch)
+    finally:
+        writer.close()
+    return row_count
@@ -0,0 +1,71 @@
+from __future__ import annotations
+import os
+import json
+import hmac
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from hashlib import sha256
+from typing import List, Optional
+from aws_lambda_powertools import Logger
+
+from .datetime import bitbucket_datetime_to_jenkins_timestamp
+from ..exceptions import FourTwoTwoError
+from ..models import PullRequest
+
+# tokens carry partial sums, so they are only issued and accepted while a
+# secret is configured; a public default would let anyone forge them
+CONTINUATION_TOKEN_SECRET = os.getenv("CONTINUATION_TOKEN_SECRET", "").encode("utf-8")
+
+logger = Logger(child=True)
+
+
+def _sign(payload: bytes) -> bytes:
+    return hmac.new(CONTINUATION_TOKEN_SECRET, payload, sha256).digest()[:16]
+
+
+def merge_position(pull_request: PullRequest) -> List[int]:
+    # bitbucket lists merged pull requests by merge, not by id, so a pass
+    # resumes from the merge timestamp of the last pull request it processed,
+    # with the id only breaking ties
+    merge_timestamp = (
+        bitbucket_datetime_to_jenkins_timestamp(pull_request.merge_commit_date)
+        if pull_request.merge_commit_date
+        else 0
+    )
+    return [merge_timestamp, pull_request.id]
+
+
+def already_processed(pull_request: PullRequest, position: Optional[List[int]]) -> bool:
+    # newest merge first, so everything at or after the position was processed
+    return position is not None and merge_position(pull_request) >= position
+
+
+def encode_continuation_token(
+    metric: str, repo_slug: str, state: dict
+) -> Optional[str]:
+    if not CONTINUATION_TOKEN_SECRET:
+        logger.warning(
+            "CONTINUATION_TOKEN_SECRET is unset, returning a partial result without a continuation token"
+        )
+        return None
+    payload = json.dumps(
+        {"m": metric, "r": repo_slug, "s": state}, separators=(",", ":")
+    ).encode("utf-8")
+    return urlsafe_b64encode(_sign(payload) + payload).decode("ascii").rstrip("=")
+
+
+def decode_continuation_token(token: str, metric: str, repo_slug: str) -> dict:
+    if not CONTINUATION_TOKEN_SECRET:
+        raise FourTwoTwoError("Continuation tokens are not configured")
+    try:
+        raw = urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        signature, payload = raw[:16], raw[16:]
+        if not hmac.compare_digest(signature, _sign(payload)):
+            raise ValueError("signature mismatch")
+        decoded = json.loads(payload)
+    except ValueError:
+        raise FourTwoTwoError("Invalid continuation token")
+
+    if decoded.get("m") != metric or decoded.get("r") != repo_slug:
+        raise FourTwoTwoError("Continuation token does not belong to this request")
+
+    return decoded["s"]
@@ -1,9 +1,34 @@
+from __future__ import annotations
 from datetime import datetime, timezone, timedelta
 
+from ..exceptions import FourTwoTwoError
+
 
 def jenkins_build_datetime(jenkins_build) -> datetime:
     return datetime.fromtimestamp(jenkins_build["timestamp"] / 1000.0, timezone.utc)
 
 
 def timedelta_to_string(duration: timedelta):
-    return str(duration).split('.')[0].replace(':', ' hr(s), ', 1).replace(':', ' min(s), ', 1) + ' sec(s)'
+    return (
+        str(duration)
+        .split(".")[0]
+        .replace(":", " hr(s), ", 1)
+        .replace(":", " min(s), ", 1)
+        + " sec(s)"
+    )
+
+
+def iso_param_to_jenkins_timestamp(value: str | None, name: str) -> int | None:
+    if value is None:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise FourTwoTwoError(f"Query parameter {name} is not an ISO 8601 datetime")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
+def bitbucket_datetime_to_jenkins_timestamp(value: str) -> int:
+    return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() * 1000)
@@ -0,0 +1,51 @@
+from __future__ import annotations
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+LAMBDA_DEADLINE_SAFETY_MARGIN_MS = int(
+    os.getenv("LAMBDA_DEADLINE_SAFETY_MARGIN_MS", "8000")
+)
+
+
+class Deadline:
+    def __init__(
+        self,
+        context: Optional[LambdaContext],
+        safety_margin_ms: int = LAMBDA_DEADLINE_SAFETY_MARGIN_MS,
+    ):
+        self.hard_deadline: Optional[float] = None
+        if context is not None:
+            self.hard_deadline = (
+                time.monotonic() + context.get_remaining_time_in_millis() / 1000.0
+            )
+        self.safety_margin_seconds = safety_margin_ms / 1000.0
+
+    def remaining_seconds(self) -> Optional[float]:
+        if self.hard_deadline is None:
+            return None
+        return self.hard_deadline - time.monotonic()
+
+    def expired(self) -> bool:
+        remaining_seconds = self.remaining_seconds()
+        return (
+            remaining_seconds is not None
+            and remaining_seconds <= self.safety_margin_seconds
+        )
+
+
+invocation_deadline: ContextVar[Optional[Deadline]] = ContextVar(
+    "invocation_deadline", default=None
+)
+
+
+def current_hard_deadline() -> Optional[float]:
+    deadline = invocation_deadline.get()
+    return deadline.hard_deadline if deadline is not None else None
+
+
+def current_deadline() -> Deadline:
+    deadline = invocation_deadline.get()
+    return deadline if deadline is not None else Deadline(None)
@@ -0,0 +1,72 @@
+from __future__ import annotations
+import os
+import gzip
+import json
+from base64 import b64encode
+from typing import Dict, Iterable, List
+
+from .etag import gzip_etag
+
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", "6"))
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+
+def accepts_gzip(accept_encoding: str | None) -> bool:
+    for coding in (accept_encoding or "").split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() not in ("gzip", "*"):
+            continue
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                return float(params[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
+def request_header(event: dict, name: str) -> str | None:
+    for key, value in (event.get("headers") or {}).items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+
+def compress_response(event: dict, response: dict) -> dict:
+    body = response.get("body")
+    headers = response.setdefault("multiValueHeaders", {})
+    if (
+        response.get("isBase64Encoded")
+        or not isinstance(body, str)
+        or "Content-Encoding" in headers
+    ):
+        return response
+
+    headers.setdefault("Vary", []).append("Accept-Encoding")
+
+    encoded_body = body.encode("utf-8")
+    if len(encoded_body) < COMPRESSION_MIN_BYTES or not accepts_gzip(
+        request_header(event, "Accept-Encoding")
+    ):
+        return response
+
+    response["body"] = b64encode(
+        gzip.compress(encoded_body, compresslevel=COMPRESSION_LEVEL, mtime=0)
+    ).decode("ascii")
+    response["isBase64Encoded"] = True
+    headers["Content-Encoding"] = ["gzip"]
+    if "ETag" in headers:
+        headers["ETag"] = [gzip_etag(etag) for etag in headers["ETag"]]
+    return response
+
+
+def to_ndjson(lines: Iterable[dict]) -> str:
+    return "".join(json.dumps(line) + "\n" for line in lines)
+
+
+def records_to_columns(records: List[dict]) -> Dict[str, list]:
+    if not records:
+        return {}
+    return {field: [record[field] for record in records] for field in records[0]}
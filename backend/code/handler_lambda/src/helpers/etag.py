@@ -0,0 +1,60 @@
+from __future__ import annotations
+import json
+from hashlib import sha1
+from typing import Optional
+from aws_lambda_powertools.event_handler import Response
+from requests import status_codes
+
+# gzip keeps a strong etag strong by giving the encoded body its own tag
+GZIP_ETAG_SUFFIX = "-gzip"
+
+
+def metric_etag(metric: str, inputs: list, query: Optional[dict] = None) -> str:
+    # derived from what the result was calculated from, not from the body, so
+    # it can be compared before anything is calculated
+    digest = sha1(
+        json.dumps([metric, inputs, query or {}], sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    return f'"{digest}"'
+
+
+def body_etag(body: str) -> str:
+    # for results that webhooks fold into a cached body between recalculations,
+    # where no upstream input says which version of the body is served
+    return f'"{sha1(body.encode("utf-8")).hexdigest()}"'
+
+
+def gzip_etag(etag: str) -> str:
+    return f'{etag[:-1]}{GZIP_ETAG_SUFFIX}"'
+
+
+def matches_etag(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        # if-none-match uses the weak comparison
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate in (etag, gzip_etag(etag)):
+            return True
+    return False
+
+
+def not_modified_response(etag: str) -> Response:
+    return Response(
+        status_code=status_codes.codes.NOT_MODIFIED,
+        headers={"ETag": etag, "Cache-Control": "no-cache"},
+    )
+
+
+def with_etag(response: Response, etag: str, complete: bool = True) -> Response:
+    # a partial result depends on the deadline as well as the inputs, so it is
+    # never tagged and can never be answered with a 304
+    if response.status_code != status_codes.codes.OK or not complete:
+        return response
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return response
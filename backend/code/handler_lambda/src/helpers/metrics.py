@@ -0,0 +1,129 @@
+from __future__ import annotations
+import os
+import json
+import threading
+from typing import Dict, List, Tuple
+from aws_lambda_powertools.metrics import MetricUnit
+from aws_lambda_powertools.metrics.base import MetricManager
+
+from .rate_limit import host_limiters_snapshot
+from .scheduler import upstream_scheduler
+from ..stores.cache import disk_cache, result_cache, upstream_cache
+
+METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "DoraMetrics")
+METRICS_SERVICE = os.getenv("METRICS_SERVICE", "handler-lambda")
+
+UPSTREAM_LIMITER_METRICS = [
+    ("concurrencyLimit", "UpstreamConcurrencyLimit", MetricUnit.Count),
+    ("inFlight", "UpstreamInFlight", MetricUnit.Count),
+    ("tokensAvailable", "UpstreamTokensAvailable", MetricUnit.Count),
+    ("requests", "UpstreamRequests", MetricUnit.Count),
+    ("throttled", "UpstreamThrottled", MetricUnit.Count),
+    ("retries", "UpstreamRetries", MetricUnit.Count),
+    ("deadlineExceeded", "UpstreamDeadlineExceeded", MetricUnit.Count),
+]
+
+DISK_CACHE_METRICS = [
+    ("hits", "DiskCacheHits", MetricUnit.Count),
+    ("misses", "DiskCacheMisses", MetricUnit.Count),
+    ("writes", "DiskCacheWrites", MetricUnit.Count),
+    ("evictions", "DiskCacheEvictions", MetricUnit.Count),
+    ("errors", "DiskCacheErrors", MetricUnit.Count),
+    ("bytes", "DiskCacheBytes", MetricUnit.Bytes),
+    ("entries", "DiskCacheEntries", MetricUnit.Count),
+]
+UPSTREAM_SCHEDULER_METRICS = [
+    ("queueDepth", "UpstreamQueueDepth", MetricUnit.Count),
+    ("maxQueueDepth", "UpstreamMaxQueueDepth", MetricUnit.Count),
+    ("inFlight", "UpstreamProjectInFlight", MetricUnit.Count),
+    ("scheduled", "UpstreamScheduled", MetricUnit.Count),
+    ("averageWaitMs", "UpstreamAverageWait", MetricUnit.Milliseconds),
+    ("maxWaitMs", "UpstreamMaxWait", MetricUnit.Milliseconds),
+    ("deadlineExceeded", "UpstreamQueueDeadlineExceeded", MetricUnit.Count),
+]
+
+MEMORY_CACHE_METRICS = [
+    ("memoryHits", "MemoryCacheHits", MetricUnit.Count),
+    ("memoryMisses", "MemoryCacheMisses", MetricUnit.Count),
+]
+
+
+# these only ever grow over a container's life, and cloudwatch sums emf values,
+# so each is published as its change since the last publish
+CUMULATIVE_KEYS = {
+    "requests",
+    "throttled",
+    "retries",
+    "deadlineExceeded",
+    "scheduled",
+    "hits",
+    "misses",
+    "writes",
+    "evictions",
+    "errors",
+    "memoryHits",
+    "memoryMisses",
+}
+
+published_totals: Dict[Tuple, float] = {}
+published_totals_lock = threading.Lock()
+
+
+def metric_values(
+    dimensions: Dict[str, str],
+    metrics: List[Tuple[str, str, MetricUnit]],
+    state: dict,
+) -> List[Tuple[str, MetricUnit, float]]:
+    values = []
+    with published_totals_lock:
+        for key, metric_name, unit in metrics:
+            value = state[key]
+            if key in CUMULATIVE_KEYS:
+                total_key = (metric_name, *sorted(dimensions.items()))
+                previous_total = published_totals.get(total_key, 0)
+                published_totals[total_key] = value
+                value = value - previous_total
+            values.append((metric_name, unit, value))
+    return values
+
+
+def publish_metric_set(
+    dimensions: Dict[str, str], values: List[Tuple[str, MetricUnit, float]]
+):
+    metric_set = MetricManager(namespace=METRICS_NAMESPACE, service=METRICS_SERVICE)
+    for name, value in dimensions.items():
+        metric_set.add_dimension(name=name, value=value)
+    for name, unit, value in values:
+        metric_set.add_metric(name=name, unit=unit, value=value)
+    print(json.dumps(metric_set.serialize_metric_set(), separators=(",", ":")))
+
+
+def publish_upstream_limiter_metrics():
+    for host, state in host_limiters_snapshot().items():
+        dimensions = {"host": host}
+        publish_metric_set(
+            dimensions, metric_values(dimensions, UPSTREAM_LIMITER_METRICS, state)
+        )
+
+
+def publish_upstream_scheduler_metrics():
+    for project, state in upstream_scheduler.snapshot().items():
+        dimensions = {"project": project}
+        publish_metric_set(
+            dimensions, metric_values(dimensions, UPSTREAM_SCHEDULER_METRICS, state)
+        )
+
+
+def publish_cache_metrics():
+    for tiered_cache in (upstream_cache, result_cache):
+        state = tiered_cache.snapshot()
+        dimensions = {"cache": tiered_cache.namespace}
+        publish_metric_set(
+            dimensions, metric_values(dimensions, MEMORY_CACHE_METRICS, state)
+        )
+    if disk_cache is not None:
+        state = disk_cache.snapshot()
+        dimensions = {"cache": "disk"}
+        publish_metric_set(
+            dimensions, metric_values(dimensions, DISK_CACHE_METRICS, state)
+        )
@@ -1,5 +1,7 @@
 from __future__ import annotations
 import os
+import time
+from urllib.parse import urlparse
 from typing_extensions import TypedDict, NotRequired
 from enum import Enum
 import xmltodict
@@ -9,10 +11,31 @@ from requests.auth import HTTPBasicAuth
 from requests.exceptions import JSONDecodeError, RequestException
 from aws_lambda_powertools import Logger
 
+from .cassette import UPSTREAM_CASSETTE_MODE, cassette
+from .deadline import current_hard_deadline
+from .rate_limit import backoff_delay, get_host_limiter
+from .scheduler import upstream_scheduler
+from ..stores.cache import upstream_cache
+
 JENKINS_API_URL = os.getenv("JENKINS_API_URL", "url")
 BITBUCKET_API_URL = os.getenv("BITBUCKET_API_URL", "url")
 BITBUCKET_API_USER_NAME = os.getenv("BITBUCKET_API_USER_NAME", "username")
 BITBUCKET_API_APP_PASSWORD = os.getenv("BITBUCKET_API_APP_PASSWORD", "password")
+UPSTREAM_REQUEST_DEADLINE_SECONDS = float(
+    os.getenv("UPSTREAM_REQUEST_DEADLINE_SECONDS", "20")
+)
+UPSTREAM_ATTEMPT_TIMEOUT_SECONDS = float(
+    os.getenv("UPSTREAM_ATTEMPT_TIMEOUT_SECONDS", "10")
+)
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "3"))
+# successful responses are reused for this long across invocations; off by
+# default, since the cheap freshness checks behind the etags go through here
+# too, and recording and replaying cassettes always go upstream
+UPSTREAM_CACHE_TTL_SECONDS = (
+    0 if UPSTREAM_CASSETTE_MODE else float(os.getenv("UPSTREAM_CACHE_TTL_SECONDS", "0"))
+)
+
+RETRYABLE_STATUS_CODES = (429, 502, 503, 504)
 
 bitbucket_auth = HTTPBasicAuth(BITBUCKET_API_USER_NAME, BITBUCKET_API_APP_PASSWORD)
 
@@ -33,34 +56,134 @@ class RequestResponse(TypedDict):
     data: NotRequired[dict | None]
 
 
+def fetch(url: str, auth, timeout: float) -> Response | None:
+    if UPSTREAM_CASSETTE_MODE == "replay":
+        return cassette.replay(url)
+
+    started_at = time.monotonic()
+    try:
+        response = requests.get(url, auth=auth, timeout=timeout)
+    except RequestException:
+        if UPSTREAM_CASSETTE_MODE == "record":
+            cassette.record(url, None, time.monotonic() - started_at)
+        raise
+    if UPSTREAM_CASSETTE_MODE == "record":
+        cassette.record(url, response, time.monotonic() - started_at)
+    return response
+
+
+def send_request(url: str, auth, deadline: float) -> Response | None:
+    limiter = get_host_limiter(urlparse(url).netloc)
+    attempt = 0
+    while True:
+        if not limiter.acquire(deadline):
+            limiter.record_deadline_exceeded()
+            logger.error("upstream request deadline exceeded", url=url)
+            return None
+
+        timeout = min(UPSTREAM_ATTEMPT_TIMEOUT_SECONDS, deadline - time.monotonic())
+        started_at = time.monotonic()
+        response = None
+        try:
+            response = fetch(url, auth, max(timeout, 0.001))
+            if response is None:
+                raise RequestException("recorded upstream request failed")
+        except RequestException as err:
+            logger.warning(
+                "upstream request failed", url=url, attempt=attempt, error=str(err)
+            )
+        finally:
+            limiter.release(
+                time.monotonic() - started_at,
+                response.status_code if response is not None else None,
+            )
+
+        if response is not None and response.status_code not in RETRYABLE_STATUS_CODES:
+            return response
+        if attempt >= UPSTREAM_MAX_RETRIES:
+            return response
+
+        delay = backoff_delay(
+            attempt,
+            response.headers.get("Retry-After") if response is not None else None,
+        )
+        if time.monotonic() + delay >= deadline:
+            limiter.record_deadline_exceeded()
+            logger.error("upstream request deadline exceeded", url=url, attempt=attempt)
+            return response
+
+        limiter.record_retry()
+        time.sleep(delay)
+        attempt += 1
+
+
 def make_request(api: APIS, path: str) -> RequestResponse:
     return_value: RequestResponse
-    if (api != APIS.DIRECT_BITBUCKET and api != APIS.DIRECT_JENKINS ) and path[0] != "/":
+    if (api != APIS.DIRECT_BITBUCKET and api != APIS.DIRECT_JENKINS) and path[0] != "/":
         logger.info(f"API: {api} path {path}")
         raise ValueError("invalid path")
+
+    auth = None
+    if api == APIS.JENKINS:
+        url = f"{JENKINS_API_URL}{path}"
+    elif api == APIS.DIRECT_JENKINS:
+        url = path
+    elif api == APIS.BITBUCKET:
+        url = f"{BITBUCKET_API_URL}{path}"
+        auth = bitbucket_auth
+    elif api == APIS.DIRECT_BITBUCKET:
+        url = path
+        auth = bitbucket_auth
+
+    if UPSTREAM_CACHE_TTL_SECONDS > 0:
+        cached_response = upstream_cache.get(url)
+        if cached_response is not None:
+            return cached_response
+
+    deadline = time.monotonic() + UPSTREAM_REQUEST_DEADLINE_SECONDS
+    hard_deadline = current_hard_deadline()
+    if hard_deadline is not None:
+        deadline = min(deadline, hard_deadline)
+
+    # fair share across projects first, then the per-host limits
+    ticket = upstream_scheduler.acquire(deadline)
+    if ticket is None:
+        logger.error("upstream request was not scheduled before its deadline", url=url)
+        return_value = {"success": False}
+        return return_value
     try:
-        if api == APIS.JENKINS:
-            response = requests.get(f"{JENKINS_API_URL}{path}")
-        elif api == APIS.DIRECT_JENKINS:
-            response = requests.get(path)
-        elif api == APIS.BITBUCKET:
-            response = requests.get(f"{BITBUCKET_API_URL}{path}", auth=bitbucket_auth)
-        elif api == APIS.DIRECT_BITBUCKET:
-            response = requests.get(path, auth=bitbucket_auth)
-    except RequestException as err:
-        logger.error(err)
+        response = send_request(url, auth, deadline)
+    finally:
+        upstream_scheduler.release(ticket)
+    if response is None:
         return_value = {"success": False}
         return return_value
 
+    return_value = parse_response(response)
+    if return_value["success"]:
+        upstream_cache.set(url, return_value, UPSTREAM_CACHE_TTL_SECONDS)
+    return return_value
+
+
+def parse_response(response: Response) -> RequestResponse:
+    return_value: RequestResponse
     try:
-        if response.ok and 'Content-Type' in response.headers and 'application/json' in response.headers['Content-Type']:
+        if (
+            response.ok
+            and "Content-Type" in response.headers
+            and "application/json" in response.headers["Content-Type"]
+        ):
             return_value = {
                 "statusCode": response.status_code,
                 "success": True,
                 "data": response.json(),
             }
             return return_value
-        elif response.ok and 'Content-Type' in response.headers and 'application/xml' in response.headers['Content-Type']:
+        elif (
+            response.ok
+            and "Content-Type" in response.headers
+            and "application/xml" in response.headers["Content-Type"]
+        ):
             return_value = {
                 "statusCode": response.status_code,
                 "success": True,
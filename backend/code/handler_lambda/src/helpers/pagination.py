@@ -0,0 +1,113 @@
+from __future__ import annotations
+from typing_extensions import TypedDict
+from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
+
+from .datetime import iso_param_to_jenkins_timestamp
+from ..exceptions import FourTwoTwoError
+
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 500
+SERIES_FORMATS = ("rows", "columnar")
+# lineage resolutions one estimate may spend
+DEFAULT_ESTIMATE_BUDGET = 40
+MAX_ESTIMATE_BUDGET = 500
+ESTIMATE_CONFIDENCE_LEVELS = ("0.8", "0.9", "0.95", "0.99")
+
+
+class TimeWindow(TypedDict):
+    since: int | None
+    until: int | None
+
+
+class SeriesQuery(TypedDict):
+    since: int | None
+    until: int | None
+    cursor: int | None
+    limit: int
+    format: str
+
+
+class EstimateQuery(TypedDict):
+    confidence: float
+    targetWidth: float | None
+    budget: int
+    seed: int | None
+
+
+def parse_series_query(event: APIGatewayProxyEvent) -> SeriesQuery:
+    cursor = event.get_query_string_value("cursor")
+    limit = event.get_query_string_value("limit", str(DEFAULT_PAGE_LIMIT))
+    try:
+        cursor = int(cursor) if cursor is not None else None
+        limit = int(limit)
+    except ValueError:
+        raise FourTwoTwoError("Query parameters cursor and limit must be integers")
+    if limit < 1 or limit > MAX_PAGE_LIMIT:
+        raise FourTwoTwoError(
+            f"Query parameter limit must be between 1 and {MAX_PAGE_LIMIT}"
+        )
+
+    series_format = event.get_query_string_value("format", "rows")
+    if series_format not in SERIES_FORMATS:
+        raise FourTwoTwoError(
+            f"Query parameter format must be one of {', '.join(SERIES_FORMATS)}"
+        )
+
+    return {
+        "since": iso_param_to_jenkins_timestamp(
+            event.get_query_string_value("since"), "since"
+        ),
+        "until": iso_param_to_jenkins_timestamp(
+            event.get_query_string_value("until"), "until"
+        ),
+        "cursor": cursor,
+        "limit": limit,
+        "format": series_format,
+    }
+
+
+def parse_time_window(event: APIGatewayProxyEvent) -> TimeWindow:
+    since = iso_param_to_jenkins_timestamp(event.get_query_string_value("from"), "from")
+    until = iso_param_to_jenkins_timestamp(event.get_query_string_value("to"), "to")
+    if since is not None and until is not None and since > until:
+        raise FourTwoTwoError("Query parameter from must not be after to")
+    return {"since": since, "until": until}
+
+
+def is_windowed(time_window: TimeWindow | None) -> bool:
+    return time_window is not None and (
+        time_window["since"] is not None or time_window["until"] is not None
+    )
+
+
+def parse_estimate_query(event: APIGatewayProxyEvent) -> EstimateQuery:
+    confidence = event.get_query_string_value("confidence", "0.95")
+    if confidence not in ESTIMATE_CONFIDENCE_LEVELS:
+        raise FourTwoTwoError(
+            f"Query parameter confidence must be one of {', '.join(ESTIMATE_CONFIDENCE_LEVELS)}"
+        )
+
+    target_width = event.get_query_string_value("targetWidth")
+    budget = event.get_query_string_value("budget", str(DEFAULT_ESTIMATE_BUDGET))
+    seed = event.get_query_string_value("seed")
+    try:
+        target_width = float(target_width) if target_width is not None else None
+        budget = int(budget)
+        seed = int(seed) if seed is not None else None
+    except ValueError:
+        raise FourTwoTwoError(
+            "Query parameter targetWidth must be a number and budget and seed integers"
+        )
+    if target_width is not None and target_width <= 0:
+        raise FourTwoTwoError("Query parameter targetWidth must be positive")
+    if budget < 1 or budget > MAX_ESTIMATE_BUDGET:
+        raise FourTwoTwoError(
+            f"Query parameter budget must be between 1 and {MAX_ESTIMATE_BUDGET}"
+        )
+
+    return {
+        "confidence": float(confidence),
+        "targetWidth": target_width,
+        "budget": budget,
+        "seed": seed,
+    }
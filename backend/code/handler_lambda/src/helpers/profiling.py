@@ -0,0 +1,144 @@
+from __future__ import annotations
+import os
+import io
+import json
+import hmac
+import time
+import cProfile
+import pstats
+import tracemalloc
+from hashlib import sha256
+from typing import Callable, Optional
+from aws_lambda_powertools import Logger
+
+from .encoding import request_header
+
+# "cprofile", "tracemalloc" or "all" profiles every invocation; leave unset and
+# set PROFILING_SECRET to only profile requests carrying a signed header
+PROFILING_MODE = os.getenv("PROFILING_MODE", "")
+PROFILING_SECRET = os.getenv("PROFILING_SECRET", "")
+PROFILING_TOP_N = int(os.getenv("PROFILING_TOP_N", "25"))
+PROFILING_SORT = os.getenv("PROFILING_SORT", "cumulative")
+PROFILING_OUTPUT = os.getenv("PROFILING_OUTPUT", "log")
+PROFILING_OUTPUT_DIR = os.getenv("PROFILING_OUTPUT_DIR", "/tmp/profiles")
+
+PROFILE_HEADER = "X-Profile"
+PROFILING_MODES = ("cprofile", "tracemalloc", "all")
+
+logger = Logger(child=True)
+
+if PROFILING_MODE and PROFILING_MODE not in PROFILING_MODES:
+    # like an unknown mode in a signed header, ignore it rather than log a
+    # profile with neither profiler running for every invocation
+    logger.warning(
+        "ignoring unknown PROFILING_MODE",
+        mode=PROFILING_MODE,
+        expected=PROFILING_MODES,
+    )
+    PROFILING_MODE = ""
+
+
+def sign_profile_header(mode: str, expires_at: int, secret: str) -> str:
+    signature = hmac.new(
+        secret.encode("utf-8"), f"{mode}.{expires_at}".encode("utf-8"), sha256
+    ).hexdigest()
+    return f"{mode}.{expires_at}.{signature}"
+
+
+def requested_profiling_mode(event: dict) -> Optional[str]:
+    if PROFILING_MODE:
+        return PROFILING_MODE
+    if not PROFILING_SECRET:
+        return None
+
+    header = request_header(event, PROFILE_HEADER)
+    if not header:
+        return None
+    try:
+        mode, expires_at, _ = header.split(".")
+        expires_at = int(expires_at)
+    except ValueError:
+        return None
+    if mode not in PROFILING_MODES or expires_at < time.time():
+        return None
+    if not hmac.compare_digest(
+        header, sign_profile_header(mode, expires_at, PROFILING_SECRET)
+    ):
+        return None
+    return mode
+
+
+def hot_functions(profiler: cProfile.Profile) -> list:
+    stats = pstats.Stats(profiler, stream=io.StringIO()).sort_stats(PROFILING_SORT)
+    functions = []
+    for function in stats.fcn_list[:PROFILING_TOP_N]:
+        primitive_calls, _, total_time, cumulative_time, _ = stats.stats[function]
+        filename, line, name = function
+        functions.append(
+            {
+                "function": f"{filename}:{line}({name})",
+                "calls": primitive_calls,
+                "totalTimeMs": round(total_time * 1000, 3),
+                "cumulativeTimeMs": round(cumulative_time * 1000, 3),
+            }
+        )
+    return functions
+
+
+def allocation_sites(snapshot: tracemalloc.Snapshot) -> list:
+    return [
+        {
+            "site": str(statistic.traceback),
+            "sizeKiB": round(statistic.size / 1024, 1),
+            "count": statistic.count,
+        }
+        for statistic in snapshot.filter_traces(
+            [tracemalloc.Filter(False, cProfile.__file__)]
+        ).statistics("lineno")[:PROFILING_TOP_N]
+    ]
+
+
+def write_profile(profile: dict, profiler: Optional[cProfile.Profile]):
+    if PROFILING_OUTPUT != "file":
+        logger.info("request profile", profile=profile)
+        return
+
+    os.makedirs(PROFILING_OUTPUT_DIR, exist_ok=True)
+    artifact_path = os.path.join(
+        PROFILING_OUTPUT_DIR, f"{int(time.time() * 1000)}-{os.getpid()}"
+    )
+    with open(f"{artifact_path}.json", "w") as artifact:
+        json.dump(profile, artifact, indent=2)
+    if profiler is not None:
+        profiler.dump_stats(f"{artifact_path}.pstats")
+    logger.info("request profile written", path=f"{artifact_path}.json")
+
+
+def profile_call(mode: str, path: str, call: Callable[[], dict]) -> dict:
+    profiler = cProfile.Profile() if mode in ("cprofile", "all") else None
+    trace_memory = mode in ("tracemalloc", "all") and not tracemalloc.is_tracing()
+
+    if trace_memory:
+        tracemalloc.start()
+    started_at = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        return call()
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        profile = {
+            "path": path,
+            "mode": mode,
+            "wallTimeMs": round((time.perf_counter() - started_at) * 1000, 3),
+        }
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            profile["peakMemoryKiB"] = round(peak / 1024, 1)
+            profile["allocationSites"] = allocation_sites(snapshot)
+        if profiler is not None:
+            profile["hotFunctions"] = hot_functions(profiler)
+        write_profile(profile, profiler)
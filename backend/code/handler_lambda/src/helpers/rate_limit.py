@@ -0,0 +1,187 @@
+from __future__ import annotations
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+UPSTREAM_RATE_PER_SECOND = float(os.getenv("UPSTREAM_RATE_PER_SECOND", "10"))
+UPSTREAM_BURST = int(os.getenv("UPSTREAM_BURST", "20"))
+UPSTREAM_MIN_CONCURRENCY = int(os.getenv("UPSTREAM_MIN_CONCURRENCY", "1"))
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "16"))
+UPSTREAM_INITIAL_CONCURRENCY = int(os.getenv("UPSTREAM_INITIAL_CONCURRENCY", "4"))
+UPSTREAM_TARGET_LATENCY_SECONDS = float(
+    os.getenv("UPSTREAM_TARGET_LATENCY_SECONDS", "2")
+)
+UPSTREAM_BACKOFF_BASE_SECONDS = float(os.getenv("UPSTREAM_BACKOFF_BASE_SECONDS", "0.2"))
+UPSTREAM_BACKOFF_CAP_SECONDS = float(os.getenv("UPSTREAM_BACKOFF_CAP_SECONDS", "10"))
+
+THROTTLING_STATUS_CODES = (429, 503)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def acquire(self, deadline: float) -> bool:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def available(self) -> float:
+        with self.lock:
+            self._refill(time.monotonic())
+            return self.tokens
+
+
+class AdaptiveConcurrencyLimit:
+    # additive increase while latency stays under target, multiplicative
+    # decrease on throttling responses or slow upstream answers
+    def __init__(
+        self,
+        initial: int,
+        minimum: int,
+        maximum: int,
+        target_latency_seconds: float,
+    ):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency_seconds = target_latency_seconds
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, deadline: float) -> bool:
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def release(self, latency_seconds: float, status_code: Optional[int]):
+        with self.condition:
+            self.in_flight -= 1
+            if (
+                status_code in THROTTLING_STATUS_CODES
+                or latency_seconds > self.target_latency_seconds
+            ):
+                self.limit = max(self.minimum, self.limit / 2)
+            elif status_code is not None:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+
+class HostLimiter:
+    def __init__(self, host: str):
+        self.host = host
+        self.bucket = TokenBucket(UPSTREAM_RATE_PER_SECOND, UPSTREAM_BURST)
+        self.concurrency = AdaptiveConcurrencyLimit(
+            UPSTREAM_INITIAL_CONCURRENCY,
+            UPSTREAM_MIN_CONCURRENCY,
+            UPSTREAM_MAX_CONCURRENCY,
+            UPSTREAM_TARGET_LATENCY_SECONDS,
+        )
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+        self.deadline_exceeded = 0
+        self.counter_lock = threading.Lock()
+
+    def acquire(self, deadline: float) -> bool:
+        if not self.bucket.acquire(deadline):
+            return False
+        return self.concurrency.acquire(deadline)
+
+    def release(self, latency_seconds: float, status_code: Optional[int]):
+        self.concurrency.release(latency_seconds, status_code)
+        with self.counter_lock:
+            self.requests += 1
+            if status_code in THROTTLING_STATUS_CODES:
+                self.throttled += 1
+
+    def record_retry(self):
+        with self.counter_lock:
+            self.retries += 1
+
+    def record_deadline_exceeded(self):
+        with self.counter_lock:
+            self.deadline_exceeded += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "concurrencyLimit": int(self.concurrency.limit),
+            "inFlight": self.concurrency.in_flight,
+            "tokensAvailable": round(self.bucket.available(), 2),
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "deadlineExceeded": self.deadline_exceeded,
+        }
+
+
+host_limiters: Dict[str, HostLimiter] = {}
+host_limiters_lock = threading.Lock()
+
+
+def get_host_limiter(host: str) -> HostLimiter:
+    with host_limiters_lock:
+        if host not in host_limiters:
+            host_limiters[host] = HostLimiter(host)
+        return host_limiters[host]
+
+
+def host_limiters_snapshot() -> Dict[str, dict]:
+    with host_limiters_lock:
+        limiters = list(host_limiters.values())
+    return {limiter.host: limiter.snapshot() for limiter in limiters}
+
+
+def parse_retry_after(retry_after: Optional[str]) -> Optional[float]:
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    # full jitter, but never sooner than the upstream asked us to wait
+    delay = random.uniform(
+        0,
+        min(UPSTREAM_BACKOFF_CAP_SECONDS, UPSTREAM_BACKOFF_BASE_SECONDS * 2**attempt),
+    )
+    retry_after_seconds = parse_retry_after(retry_after)
+    if retry_after_seconds is not None:
+        delay = max(delay, retry_after_seconds)
+    return delay
@@ -0,0 +1,182 @@
+from __future__ import annotations
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, NamedTuple, Optional
+
+# upstream requests allowed in flight across every project, and for any one
+UPSTREAM_SCHEDULER_SLOTS = int(os.getenv("UPSTREAM_SCHEDULER_SLOTS", "8"))
+UPSTREAM_PROJECT_QUOTA = int(os.getenv("UPSTREAM_PROJECT_QUOTA", "4"))
+
+# lower values are served first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+UNSCOPED_PROJECT = "unscoped"
+
+
+class UpstreamScope(NamedTuple):
+    project: str
+    priority: int
+
+
+upstream_scope: ContextVar[UpstreamScope] = ContextVar(
+    "upstream_scope", default=UpstreamScope(UNSCOPED_PROJECT, INTERACTIVE)
+)
+
+
+def project_of_path(path: str) -> str:
+    # project routes are /<metric>/<project id>[/...]
+    segments = path.strip("/").split("/")
+    if len(segments) > 1 and segments[1].isdigit():
+        return segments[1]
+    return UNSCOPED_PROJECT
+
+
+@contextmanager
+def scheduled_as(project: Optional[str] = None, priority: Optional[int] = None):
+    current = upstream_scope.get()
+    token = upstream_scope.set(
+        UpstreamScope(
+            current.project if project is None else project,
+            current.priority if priority is None else priority,
+        )
+    )
+    try:
+        yield
+    finally:
+        upstream_scope.reset(token)
+
+
+class Ticket:
+    __slots__ = ("project", "priority", "enqueued_at", "granted")
+
+    def __init__(self, scope: UpstreamScope):
+        self.project = scope.project
+        self.priority = scope.priority
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class ProjectQueueStats:
+    def __init__(self):
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.in_flight = 0
+        self.scheduled = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.deadline_exceeded = 0
+
+
+class FairScheduler:
+    # a bulkhead per project on top of a shared pool of slots: free slots go
+    # to the highest priority with a waiter, and within a priority round robin
+    # across the projects that are still under their quota
+    def __init__(self, slots: int, project_quota: int):
+        self.slots = slots
+        self.project_quota = project_quota
+        self.in_flight = 0
+        self.queues: Dict[int, OrderedDict[str, Deque[Ticket]]] = {}
+        self.stats: Dict[str, ProjectQueueStats] = {}
+        self.condition = threading.Condition()
+
+    def project_stats(self, project: str) -> ProjectQueueStats:
+        if project not in self.stats:
+            self.stats[project] = ProjectQueueStats()
+        return self.stats[project]
+
+    def acquire(self, deadline: float) -> Optional[Ticket]:
+        ticket = Ticket(upstream_scope.get())
+        with self.condition:
+            stats = self.project_stats(ticket.project)
+            self.queues.setdefault(ticket.priority, OrderedDict()).setdefault(
+                ticket.project, deque()
+            ).append(ticket)
+            stats.queue_depth += 1
+            stats.max_queue_depth = max(stats.max_queue_depth, stats.queue_depth)
+            self.dispatch()
+
+            while not ticket.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.dequeue(ticket)
+                    stats.deadline_exceeded += 1
+                    return None
+                self.condition.wait(remaining)
+
+            waited = time.monotonic() - ticket.enqueued_at
+            stats.scheduled += 1
+            stats.wait_seconds += waited
+            stats.max_wait_seconds = max(stats.max_wait_seconds, waited)
+            return ticket
+
+    def release(self, ticket: Ticket):
+        with self.condition:
+            self.in_flight -= 1
+            self.stats[ticket.project].in_flight -= 1
+            self.dispatch()
+
+    def dispatch(self):
+        granted = False
+        while self.in_flight < self.slots:
+            ticket = self.next_ticket()
+            if ticket is None:
+                break
+            ticket.granted = True
+            self.in_flight += 1
+            stats = self.stats[ticket.project]
+            stats.queue_depth -= 1
+            stats.in_flight += 1
+            granted = True
+        if granted:
+            self.condition.notify_all()
+
+    def next_ticket(self) -> Optional[Ticket]:
+        for priority in sorted(self.queues):
+            projects = self.queues[priority]
+            for project in list(projects):
+                if self.stats[project].in_flight >= self.project_quota:
+                    continue
+                tickets = projects[project]
+                ticket = tickets.popleft()
+                if tickets:
+                    projects.move_to_end(project)
+                else:
+                    del projects[project]
+                return ticket
+        return None
+
+    def dequeue(self, ticket: Ticket):
+        projects = self.queues.get(ticket.priority, {})
+        tickets = projects.get(ticket.project)
+        if tickets is not None and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del projects[ticket.project]
+            self.stats[ticket.project].queue_depth -= 1
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self.condition:
+            return {
+                project: {
+                    "queueDepth": stats.queue_depth,
+                    "maxQueueDepth": stats.max_queue_depth,
+                    "inFlight": stats.in_flight,
+                    "scheduled": stats.scheduled,
+                    "averageWaitMs": round(
+                        stats.wait_seconds / stats.scheduled * 1000, 2
+                    )
+                    if stats.scheduled
+                    else 0.0,
+                    "maxWaitMs": round(stats.max_wait_seconds * 1000, 2),
+                    "deadlineExceeded": stats.deadline_exceeded,
+                }
+                for project, stats in self.stats.items()
+            }
+
+
+upstream_scheduler = FairScheduler(UPSTREAM_SCHEDULER_SLOTS, UPSTREAM_PROJECT_QUOTA)
@@ -0,0 +1,126 @@
+from __future__ import annotations
+import os
+import hmac
+import json
+from hashlib import sha256
+from typing import List, Optional
+from typing_extensions import TypedDict
+
+from .datetime import bitbucket_datetime_to_jenkins_timestamp
+from ..exceptions import FourOhOneError, FourTwoTwoError
+
+# shared with the bitbucket webhook secret and the jenkins notification token;
+# webhooks are rejected while it is unset
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+
+BITBUCKET_MERGED_EVENT = "pullrequest:fulfilled"
+# the notification plugin reports QUEUED, STARTED, COMPLETED and FINALIZED,
+# and only the last one carries the final duration
+JENKINS_FINISHED_PHASES = ("FINALIZED", None)
+
+
+class MergedPullRequestEvent(TypedDict):
+    repoSlug: str
+    pullRequestId: int
+    sourceBranch: str
+    mergeCommit: str
+    mergeTimestamp: int
+
+
+class FinishedBuildEvent(TypedDict):
+    jobUrl: str
+    jobName: str
+    number: int
+    result: str
+    timestamp: int
+    duration: int
+    upstreamBuild: Optional[int]
+    upstreamUrl: Optional[str]
+    commits: List[str]
+
+
+def verify_bitbucket_signature(body: bytes, signature: Optional[str]):
+    # bitbucket signs the raw body as "sha256=<hex hmac>" in X-Hub-Signature
+    if not WEBHOOK_SECRET:
+        raise FourOhOneError("Webhooks are not configured")
+    expected = hmac.new(WEBHOOK_SECRET.encode("utf-8"), body, sha256).hexdigest()
+    if signature is None or not hmac.compare_digest(signature, f"sha256={expected}"):
+        raise FourOhOneError("Webhook signature does not match")
+
+
+def verify_webhook_token(token: Optional[str]):
+    # jenkins notifications cannot sign their body, so they carry the secret in
+    # the X-Webhook-Token header; never the query string, which access logs keep
+    if not WEBHOOK_SECRET:
+        raise FourOhOneError("Webhooks are not configured")
+    if token is None or not hmac.compare_digest(token, WEBHOOK_SECRET):
+        raise FourOhOneError("Webhook token does not match")
+
+
+def load_webhook_body(body: Optional[str]) -> dict:
+    try:
+        payload = json.loads(body or "")
+    except ValueError:
+        raise FourTwoTwoError("Webhook body is not JSON")
+    if not isinstance(payload, dict):
+        raise FourTwoTwoError("Webhook body is not a JSON object")
+    return payload
+
+
+def parse_merged_pull_request_event(payload: dict) -> MergedPullRequestEvent:
+    try:
+        pull_request = payload["pullrequest"]
+        return {
+            "repoSlug": payload["repository"]["full_name"].split("/")[-1],
+            "pullRequestId": int(pull_request["id"]),
+            "sourceBranch": pull_request["source"]["branch"]["name"],
+            "mergeCommit": pull_request["merge_commit"]["hash"],
+            # the webhook has no merge commit date, but a fulfilled pull
+            # request was last updated by its merge
+            "mergeTimestamp": bitbucket_datetime_to_jenkins_timestamp(
+                pull_request["updated_on"]
+            ),
+        }
+    except (KeyError, TypeError) as err:
+        raise FourTwoTwoError(f"Key {str(err)} cannot be found in the webhook body")
+    except ValueError:
+        raise FourTwoTwoError("Webhook body has a malformed pull request")
+
+
+def parse_finished_build_event(payload: dict) -> FinishedBuildEvent:
+    # the notification plugin's json format, plus the upstream build number
+    # and url that pipeline jobs add themselves
+    try:
+        build = payload["build"]
+        upstream_build = build.get("upstreamBuild")
+        scm = build.get("scm") or {}
+        return {
+            "jobUrl": payload.get("url") or "",
+            "jobName": payload["name"],
+            "number": int(build["number"]),
+            "result": build["status"],
+            "timestamp": int(build["timestamp"]),
+            "duration": int(build["duration"]),
+            "upstreamBuild": int(upstream_build) if upstream_build else None,
+            "upstreamUrl": build.get("upstreamUrl"),
+            "commits": [scm["commit"]] if scm.get("commit") else [],
+        }
+    except (KeyError, TypeError) as err:
+        raise FourTwoTwoError(f"Key {str(err)} cannot be found in the webhook body")
+    except ValueError:
+        raise FourTwoTwoError("Webhook body has a malformed build")
+
+
+def is_finished_build_payload(payload: dict) -> bool:
+    build = payload.get("build")
+    return isinstance(build, dict) and build.get("phase") in JENKINS_FINISHED_PHASES
+
+
+def job_path(job_name: str) -> str:
+    return job_name.strip("/")
+
+
+def matches_job(job_name: str, event: FinishedBuildEvent) -> bool:
+    if event["jobUrl"]:
+        return job_path(job_name) == job_path(event["jobUrl"])
+    return job_path(job_name).split("/")[-1] == event["jobName"]
@@ -0,0 +1,238 @@
+from __future__ import annotations
+from typing import List, Optional, Tuple
+
+from .exceptions import FiveHundredError
+
+# parsed once where a response comes off the network, keeping only the fields
+# the calculators read; a field every request asks for, or one the caller
+# names as required, is rejected there when missing, and the rest stay None
+
+
+def missing_key_error(err: KeyError) -> FiveHundredError:
+    return FiveHundredError(message=f"Key {str(err)} cannot be found in the dict")
+
+
+def is_hotfix_branch(branch_name: str) -> bool:
+    return "hotfix" in branch_name
+
+
+class PullRequest:
+    __slots__ = (
+        "id",
+        "source_branch",
+        "merge_commit_hash",
+        "merge_commit_date",
+        "parent_count",
+        "parent_commit_hash",
+        "parent_commit_html_url",
+        "parent_commit_statuses_url",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        source_branch: Optional[str] = None,
+        merge_commit_hash: Optional[str] = None,
+        merge_commit_date: Optional[str] = None,
+        parent_count: int = 0,
+        parent_commit_hash: Optional[str] = None,
+        parent_commit_html_url: Optional[str] = None,
+        parent_commit_statuses_url: Optional[str] = None,
+    ):
+        self.id = id
+        self.source_branch = source_branch
+        self.merge_commit_hash = merge_commit_hash
+        self.merge_commit_date = merge_commit_date
+        self.parent_count = parent_count
+        self.parent_commit_hash = parent_commit_hash
+        self.parent_commit_html_url = parent_commit_html_url
+        self.parent_commit_statuses_url = parent_commit_statuses_url
+
+    @classmethod
+    def from_bitbucket(cls, pull_request: dict) -> PullRequest:
+        # every request for merged pull requests asks for the merge commit and
+        # its parents; a merge commit without parents is left to the lineage
+        try:
+            merge_commit = pull_request["merge_commit"]
+            parents = merge_commit.get("parents") or []
+            parent = parents[0] if parents else None
+            return cls(
+                int(pull_request["id"]),
+                ((pull_request.get("source") or {}).get("branch") or {}).get("name"),
+                merge_commit["hash"],
+                merge_commit["date"],
+                len(parents),
+                parent["hash"] if parent else None,
+                parent["links"]["html"]["href"] if parent else None,
+                parent["links"]["statuses"]["href"] if parent else None,
+            )
+        except KeyError as err:
+            raise missing_key_error(err)
+        except (TypeError, ValueError, AttributeError):
+            raise FiveHundredError(
+                message=f"Unexpected pull request data for PR {pull_request.get('id')}"
+            )
+
+    @property
+    def is_hotfix(self) -> bool:
+        if self.source_branch is None:
+            raise missing_key_error(KeyError("source"))
+        return is_hotfix_branch(self.source_branch)
+
+
+def parse_pull_requests(pull_requests_data: dict) -> List[PullRequest]:
+    try:
+        values = pull_requests_data["values"]
+    except KeyError as err:
+        raise missing_key_error(err)
+    return [PullRequest.from_bitbucket(pull_request) for pull_request in values]
+
+
+class JenkinsBuild:
+    # one build from the json api, or an allBuild element from the xml api,
+    # where xmltodict leaves every value a string
+    __slots__ = (
+        "number",
+        "result",
+        "timestamp",
+        "duration",
+        "next_build_url",
+        "upstream_build",
+        "upstream_causes",
+        "revisions",
+    )
+
+    def __init__(
+        self,
+        number: int,
+        result: Optional[str] = None,
+        timestamp: Optional[int] = None,
+        duration: Optional[int] = None,
+        next_build_url: Optional[str] = None,
+        upstream_build: Optional[int] = None,
+        revisions: Tuple[str, ...] = (),
+        upstream_causes: Tuple[Tuple[int, str], ...] = (),
+    ):
+        self.number = number
+        self.result = result
+        self.timestamp = timestamp
+        self.duration = duration
+        self.next_build_url = next_build_url
+        self.upstream_build = upstream_build
+        self.revisions = revisions
+        # every (upstream build, upstream url) pair, for jobs triggered from
+        # more than one upstream job
+        self.upstream_causes = upstream_causes
+
+    @classmethod
+    def from_jenkins(cls, build: dict, required: Tuple[str, ...] = ()) -> JenkinsBuild:
+        # required names the fields the request's tree asked for
+        try:
+            for key in required:
+                if build.get(key) is None:
+                    raise KeyError(key)
+            actions = build.get("actions") or build.get("action") or []
+            if isinstance(actions, dict):
+                actions = [actions]
+            upstream_builds = []
+            revisions = []
+            for action in actions:
+                if not action:
+                    continue
+                causes = action.get("causes") or action.get("cause") or []
+                if isinstance(causes, dict):
+                    causes = [causes]
+                upstream_builds.extend(
+                    (int(cause["upstreamBuild"]), cause.get("upstreamUrl") or "")
+                    for cause in causes
+                    if "upstreamBuild" in cause
+                )
+                revision = action.get("lastBuiltRevision")
+                if revision and "SHA1" in revision:
+                    revisions.append(revision["SHA1"])
+            next_build = build.get("nextBuild") or {}
+            return cls(
+                int(build["number"]),
+                build.get("result"),
+                int(build["timestamp"]) if "timestamp" in build else None,
+                int(build.get("duration") or 0) if "duration" in build else None,
+                next_build.get("url"),
+                upstream_builds[0][0] if upstream_builds else None,
+                tuple(revisions),
+                tuple(upstream_builds),
+            )
+        except KeyError as err:
+            raise missing_key_error(err)
+        except (TypeError, ValueError, AttributeError):
+            raise FiveHundredError(
+                message=f"Unexpected build data for build {build.get('number')}"
+            )
+
+    def upstream_build_from(
+        self, upstream_url_parts: Tuple[str, ...] = ()
+    ) -> Optional[int]:
+        # the first upstream build whose url contains every part, like the
+        # contains(upstreamUrl, ...) filters of the xpath queries
+        for upstream_build, upstream_url in self.upstream_causes:
+            if all(part in upstream_url for part in upstream_url_parts):
+                return upstream_build
+        return None
+
+
+def parse_jenkins_builds(
+    all_builds_data: dict, required: Tuple[str, ...] = ()
+) -> List[JenkinsBuild]:
+    try:
+        all_builds = all_builds_data["allBuilds"]
+    except KeyError as err:
+        raise missing_key_error(err)
+    return [JenkinsBuild.from_jenkins(build, required) for build in all_builds]
+
+
+class PipelineLineage:
+    # a merged pull request followed through its first green st build, the
+    # first green at build it triggered and the production build after that
+    __slots__ = (
+        "pull_request_id",
+        "merge_commit",
+        "merge_timestamp",
+        "st_build_number",
+        "st_start_timestamp",
+        "at_build_number",
+        "production_start_timestamp",
+        "production_duration",
+    )
+
+    def __init__(
+        self,
+        pull_request_id: int,
+        merge_commit: Optional[str] = None,
+        merge_timestamp: Optional[int] = None,
+    ):
+        self.pull_request_id = pull_request_id
+        self.merge_commit = merge_commit
+        self.merge_timestamp = merge_timestamp
+        self.st_build_number: Optional[int] = None
+        self.st_start_timestamp: Optional[int] = None
+        self.at_build_number: Optional[int] = None
+        self.production_start_timestamp: Optional[int] = None
+        self.production_duration: Optional[int] = None
+
+    @property
+    def production_finish_timestamp(self) -> int:
+        return self.production_start_timestamp + self.production_duration
+
+    @property
+    def duration_seconds(self) -> float:
+        return (self.production_finish_timestamp - self.st_start_timestamp) / 1000.0
+
+    def to_lead_time_record(self) -> dict:
+        return {
+            "pullRequestId": self.pull_request_id,
+            "mergeCommit": self.merge_commit,
+            "stBuildNumber": self.st_build_number,
+            "atBuildNumber": self.at_build_number,
+            "stStartTimestamp": self.st_start_timestamp,
+            "productionFinishTimestamp": self.production_finish_timestamp,
+            "durationSeconds": self.duration_seconds,
+        }
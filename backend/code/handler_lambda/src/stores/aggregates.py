@@ -0,0 +1,114 @@
+from __future__ import annotations
+import threading
+from bisect import bisect_left
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from .series import LEAD_TIME_SERIES, RECOVERY_SERIES, observe_series
+
+# upper bounds in seconds, from fifteen minutes to a week
+DURATION_BUCKETS_SECONDS = (900, 1800, 3600, 7200, 14400, 28800, 86400, 172800, 604800)
+
+
+class DurationHistogram:
+    def __init__(self):
+        # one count per bucket plus the +Inf bucket, not cumulative
+        self.bucket_counts: List[int] = [0] * (len(DURATION_BUCKETS_SECONDS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.bucket_counts[bisect_left(DURATION_BUCKETS_SECONDS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+class RepoAggregates:
+    def __init__(self):
+        self.lead_time = DurationHistogram()
+        self.time_to_recovery = DurationHistogram()
+        self.change_failure_ratio: Optional[float] = None
+
+
+class DeploymentAggregates:
+    def __init__(self):
+        self.deployments: Optional[int] = None
+        self.last_deployment_timestamp: Optional[float] = None
+
+
+# folded in as the routes, series and webhooks produce results, so reading them
+# never walks jenkins or bitbucket; the generation moves on every change so
+# rendered exposition text can be cached against it.
+# these live in process memory and are not seeded from anything: a cold
+# container serves no samples until its own routes have run, and each
+# container only counts the records it resolved itself. /metrics is therefore
+# per container, and scrapes of several containers must not be summed, since
+# containers that resolved the same pull requests would count them twice
+repo_aggregates: Dict[str, RepoAggregates] = {}
+deployment_aggregates: Dict[str, DeploymentAggregates] = {}
+aggregates_lock = threading.Lock()
+generation = 0
+
+
+def aggregates_generation() -> int:
+    return generation
+
+
+def get_repo_aggregates(repo_slug: str) -> Optional[RepoAggregates]:
+    return repo_aggregates.get(repo_slug)
+
+
+def get_deployment_aggregates(job_name: str) -> Optional[DeploymentAggregates]:
+    return deployment_aggregates.get(job_name)
+
+
+def update_repo_aggregates(repo_slug: str, update):
+    global generation
+    with aggregates_lock:
+        if repo_slug not in repo_aggregates:
+            repo_aggregates[repo_slug] = RepoAggregates()
+        update(repo_aggregates[repo_slug])
+        generation += 1
+
+
+def observe_lead_time(repo_slug: str, record: dict):
+    update_repo_aggregates(
+        repo_slug,
+        lambda aggregates: aggregates.lead_time.observe(record["durationSeconds"]),
+    )
+
+
+def observe_time_to_recovery(repo_slug: str, record: dict):
+    update_repo_aggregates(
+        repo_slug,
+        lambda aggregates: aggregates.time_to_recovery.observe(
+            record["durationSeconds"]
+        ),
+    )
+
+
+def set_change_failure_ratio(repo_slug: str, percentage_of_change_failures: int):
+    def update(aggregates: RepoAggregates):
+        aggregates.change_failure_ratio = percentage_of_change_failures / 100.0
+
+    update_repo_aggregates(repo_slug, update)
+
+
+def set_deployment_frequency(job_name: str, deployment_frequency: dict):
+    global generation
+    latest_build_datetime = deployment_frequency["latestBuildDatetime"]
+    with aggregates_lock:
+        if job_name not in deployment_aggregates:
+            deployment_aggregates[job_name] = DeploymentAggregates()
+        aggregates = deployment_aggregates[job_name]
+        aggregates.deployments = deployment_frequency["numberOfDeployments"]
+        aggregates.last_deployment_timestamp = (
+            datetime.fromisoformat(latest_build_datetime).timestamp()
+            if latest_build_datetime
+            else None
+        )
+        generation += 1
+
+
+observe_series(LEAD_TIME_SERIES, observe_lead_time)
+observe_series(RECOVERY_SERIES, observe_time_to_recovery)
@@ -0,0 +1,231 @@
+from __future__ import annotations
+import os
+import mmap
+import struct
+import threading
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+MAGIC = b"DBI1"
+# magic, record size, reserved
+HEADER = struct.Struct("<4sHH")
+# build number, upstream build (0 when none), timestamp ms, duration ms, result
+BUILD_RECORD = struct.Struct("<iiqqB7x")
+# upstream build, build number
+UPSTREAM_RECORD = struct.Struct("<ii")
+
+RESULT_CODES = {
+    "SUCCESS": 1,
+    "UNSTABLE": 2,
+    "FAILURE": 3,
+    "ABORTED": 4,
+    "NOT_BUILT": 5,
+}
+RESULTS = {code: result for result, code in RESULT_CODES.items()}
+
+
+class BuildRecord(NamedTuple):
+    number: int
+    upstream_build: Optional[int]
+    timestamp: int
+    duration: int
+    result: Optional[str]
+
+
+class MappedRecordFile:
+    # a header followed by fixed-width records, sorted by their leading fields
+    # and read straight out of the mapped buffer
+    def __init__(self, path: str, record: struct.Struct):
+        self.path = path
+        self.record = record
+        if not os.path.exists(path) or os.path.getsize(path) < HEADER.size:
+            self.rewrite([])
+        self.file = open(path, "r+b")
+        magic, record_size, _ = HEADER.unpack(self.file.read(HEADER.size))
+        if magic != MAGIC or record_size != record.size:
+            self.file.close()
+            raise ValueError(f"{path} is not a build index file")
+
+        # drop a record torn by a container that was frozen mid-append
+        size = os.path.getsize(path)
+        whole_size = HEADER.size + (size - HEADER.size) // record.size * record.size
+        if whole_size != size:
+            self.file.truncate(whole_size)
+        self.map()
+
+    def map(self):
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.count = (len(self.buffer) - HEADER.size) // self.record.size
+
+    def unpack(self, position: int) -> tuple:
+        return self.record.unpack_from(
+            self.buffer, HEADER.size + position * self.record.size
+        )
+
+    def bisect_left(self, key: tuple) -> int:
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.unpack(middle)[: len(key)] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def bisect_field(self, field: int, value: int) -> int:
+        # for fields that grow with the sort key, like build timestamps
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.unpack(middle)[field] < value:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def append(self, rows: List[tuple]):
+        self.file.seek(0, os.SEEK_END)
+        self.file.write(b"".join(self.record.pack(*row) for row in rows))
+        self.file.flush()
+        self.buffer.close()
+        self.map()
+
+    def rows(self) -> List[tuple]:
+        return [self.unpack(position) for position in range(self.count)]
+
+    def rewrite(self, rows: List[tuple]):
+        partial_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.partial"
+        with open(partial_path, "wb") as partial_file:
+            partial_file.write(HEADER.pack(MAGIC, self.record.size, 0))
+            partial_file.write(b"".join(self.record.pack(*row) for row in rows))
+        os.replace(partial_path, self.path)
+
+    def reopen(self):
+        self.close()
+        self.file = open(self.path, "r+b")
+        self.map()
+
+    def close(self):
+        self.buffer.close()
+        self.file.close()
+
+
+class MappedBuildIndex:
+    def __init__(self, base_path: str):
+        self.lock = threading.Lock()
+        try:
+            self.open(base_path)
+        except ValueError:
+            for path in (f"{base_path}.builds", f"{base_path}.upstream"):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.open(base_path)
+        self.refreshed_at: Optional[float] = None
+        # held while the index is refreshed from jenkins, apart from self.lock
+        # so that lookups carry on during the refresh
+        self.refresh_lock = threading.Lock()
+
+    def open(self, base_path: str):
+        self.builds = MappedRecordFile(f"{base_path}.builds", BUILD_RECORD)
+        self.upstream = MappedRecordFile(f"{base_path}.upstream", UPSTREAM_RECORD)
+
+    def __len__(self) -> int:
+        return self.builds.count
+
+    @property
+    def last_number(self) -> int:
+        with self.lock:
+            return (
+                self.builds.unpack(self.builds.count - 1)[0] if self.builds.count else 0
+            )
+
+    def append(self, builds: Iterable[BuildRecord]) -> int:
+        with self.lock:
+            last_number = (
+                self.builds.unpack(self.builds.count - 1)[0] if self.builds.count else 0
+            )
+            new_builds = sorted(
+                (build for build in builds if build.number > last_number),
+                key=lambda build: build.number,
+            )
+            if not new_builds:
+                return 0
+
+            self.builds.append(
+                [
+                    (
+                        build.number,
+                        build.upstream_build or 0,
+                        build.timestamp,
+                        build.duration,
+                        RESULT_CODES.get(build.result, 0),
+                    )
+                    for build in new_builds
+                ]
+            )
+
+            upstream_rows = sorted(
+                (build.upstream_build, build.number)
+                for build in new_builds
+                if build.upstream_build
+            )
+            if upstream_rows:
+                if self.upstream.count and upstream_rows[0] < self.upstream.unpack(
+                    self.upstream.count - 1
+                ):
+                    # upstream builds arrived out of order, so merge and rewrite
+                    self.upstream.rewrite(sorted(self.upstream.rows() + upstream_rows))
+                    self.upstream.reopen()
+                else:
+                    self.upstream.append(upstream_rows)
+            return len(new_builds)
+
+    def find(self, number: int) -> Optional[BuildRecord]:
+        with self.lock:
+            return self.find_unlocked(number)
+
+    def find_unlocked(self, number: int) -> Optional[BuildRecord]:
+        position = self.builds.bisect_left((number,))
+        if position == self.builds.count:
+            return None
+        record = self.builds.unpack(position)
+        return to_build_record(record) if record[0] == number else None
+
+    def next_build(self, number: int) -> Optional[BuildRecord]:
+        with self.lock:
+            position = self.builds.bisect_left((number + 1,))
+            if position == self.builds.count:
+                return None
+            return to_build_record(self.builds.unpack(position))
+
+    def window(
+        self, since: Optional[int] = None, until: Optional[int] = None
+    ) -> List[BuildRecord]:
+        # builds start in number order, so timestamps are sorted as well
+        with self.lock:
+            start = 0 if since is None else self.builds.bisect_field(2, since)
+            end = (
+                self.builds.count
+                if until is None
+                else self.builds.bisect_field(2, until + 1)
+            )
+            return [
+                to_build_record(self.builds.unpack(position))
+                for position in range(start, end)
+            ]
+
+    def first_by_upstream(self, upstream_build: int) -> Optional[BuildRecord]:
+        with self.lock:
+            position = self.upstream.bisect_left((upstream_build,))
+            if position == self.upstream.count:
+                return None
+            indexed_upstream_build, number = self.upstream.unpack(position)
+            if indexed_upstream_build != upstream_build:
+                return None
+            return self.find_unlocked(number)
+
+
+def to_build_record(record: Tuple[int, int, int, int, int]) -> BuildRecord:
+    number, upstream_build, timestamp, duration, result_code = record
+    return BuildRecord(
+        number, upstream_build or None, timestamp, duration, RESULTS.get(result_code)
+    )
@@ -0,0 +1,247 @@
+from __future__ import annotations
+import os
+import json
+import time
+import zlib
+import struct
+import threading
+from collections import OrderedDict
+from hashlib import sha256
+from typing import Any, Dict, Optional, Tuple
+from aws_lambda_powertools import Logger
+
+try:
+    import zstandard
+except ImportError:
+    # optional: entries are zlib compressed without it
+    zstandard = None
+
+DISK_CACHE_DIR = os.getenv("DISK_CACHE_DIR", "/tmp/dora-cache")
+# lambda ephemeral storage defaults to 512MB and is shared with the build index
+DISK_CACHE_MAX_BYTES = int(os.getenv("DISK_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+DISK_CACHE_CODEC = os.getenv("DISK_CACHE_CODEC", "zstd")
+MEMORY_CACHE_MAX_ENTRIES = int(os.getenv("MEMORY_CACHE_MAX_ENTRIES", "512"))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "60"))
+
+ENTRY_MAGIC = b"DCE1"
+# magic, expires at (epoch seconds, the files outlive the process), codec
+ENTRY_HEADER = struct.Struct("<4sdB")
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+logger = Logger(child=True)
+
+
+def compress(payload: bytes) -> tuple:
+    if DISK_CACHE_CODEC == "zstd" and zstandard is not None:
+        return CODEC_ZSTD, zstandard.ZstdCompressor(level=3).compress(payload)
+    return CODEC_ZLIB, zlib.compress(payload, 6)
+
+
+def decompress(codec: int, payload: bytes) -> bytes:
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("zstd entry without zstandard installed")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    return zlib.decompress(payload)
+
+
+UNREADABLE_ENTRY_ERRORS = (OSError, ValueError, struct.error, zlib.error) + (
+    (zstandard.ZstdError,) if zstandard is not None else ()
+)
+
+
+class MemoryCache:
+    def __init__(self, max_entries: int = MEMORY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.time():
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: Any, expires_at: float):
+        with self.lock:
+            self.entries[key] = (expires_at, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class DiskCache:
+    # one compressed file per entry, written atomically with os.replace so a
+    # concurrent reader sees either the old or the new entry, and evicted in
+    # least recently used order once the directory outgrows its byte budget
+    def __init__(
+        self, directory: str = DISK_CACHE_DIR, max_bytes: int = DISK_CACHE_MAX_BYTES
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.sizes: OrderedDict = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.errors = 0
+        self.load()
+
+    def load(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            entries = []
+            with os.scandir(self.directory) as directory_entries:
+                for entry in directory_entries:
+                    if entry.name.endswith(".partial"):
+                        os.remove(entry.path)
+                    elif entry.is_file():
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, entry.name, stat.st_size))
+        except OSError as err:
+            logger.warning("disk cache unavailable", error=str(err))
+            return
+        with self.lock:
+            for _, name, size in sorted(entries):
+                self.sizes[name] = size
+                self.total_bytes += size
+            self.evict()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        name = sha256(key.encode("utf-8")).hexdigest()
+        try:
+            with open(self.path(name), "rb") as entry_file:
+                data = entry_file.read()
+            magic, expires_at, codec = ENTRY_HEADER.unpack_from(data)
+            if magic != ENTRY_MAGIC:
+                raise ValueError("not a cache entry")
+            if expires_at < time.time():
+                self.remove(name)
+                value = None
+            else:
+                value = decompress(codec, data[ENTRY_HEADER.size :])
+        except FileNotFoundError:
+            value = None
+        except UNREADABLE_ENTRY_ERRORS as err:
+            logger.warning("discarding unreadable disk cache entry", error=str(err))
+            self.remove(name)
+            value = None
+
+        with self.lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if name in self.sizes:
+                self.sizes.move_to_end(name)
+        return value, expires_at
+
+    def set(self, key: str, value: bytes, expires_at: float):
+        name = sha256(key.encode("utf-8")).hexdigest()
+        codec, payload = compress(value)
+        data = ENTRY_HEADER.pack(ENTRY_MAGIC, expires_at, codec) + payload
+        partial_path = self.path(
+            f"{name}.{os.getpid()}.{threading.get_ident()}.partial"
+        )
+        try:
+            with open(partial_path, "wb") as entry_file:
+                entry_file.write(data)
+            os.replace(partial_path, self.path(name))
+        except OSError as err:
+            logger.warning("disk cache write failed", error=str(err))
+            with self.lock:
+                self.errors += 1
+            return
+
+        with self.lock:
+            self.total_bytes += len(data) - self.sizes.pop(name, 0)
+            self.sizes[name] = len(data)
+            self.writes += 1
+            self.evict()
+
+    def remove(self, name: str):
+        try:
+            os.remove(self.path(name))
+        except OSError:
+            pass
+        with self.lock:
+            self.total_bytes -= self.sizes.pop(name, 0)
+
+    def evict(self):
+        # callers hold the lock
+        while self.total_bytes > self.max_bytes and self.sizes:
+            name, size = self.sizes.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path(name))
+            except OSError:
+                pass
+
+    def snapshot(self) -> Dict[str, float]:
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "errors": self.errors,
+                "bytes": self.total_bytes,
+                "entries": len(self.sizes),
+            }
+
+
+class TieredCache:
+    # a per namespace in-memory lru in front of the shared disk cache; values
+    # must be json serialisable and are shared, so callers must not mutate them
+    def __init__(self, namespace: str, disk_cache: Optional[DiskCache]):
+        self.namespace = namespace
+        self.memory = MemoryCache()
+        self.disk = disk_cache
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is not None or self.disk is None:
+            return value
+
+        entry = self.disk.get(f"{self.namespace}:{key}")
+        if entry is None:
+            return None
+        payload, expires_at = entry
+        value = json.loads(payload)
+        self.memory.set(key, value, expires_at)
+        return value
+
+    def set(self, key: str, value: Any, ttl_seconds: float):
+        if ttl_seconds <= 0:
+            return
+        expires_at = time.time() + ttl_seconds
+        self.memory.set(key, value, expires_at)
+        if self.disk is not None:
+            self.disk.set(
+                f"{self.namespace}:{key}",
+                json.dumps(value, separators=(",", ":")).encode("utf-8"),
+                expires_at,
+            )
+
+    def snapshot(self) -> Dict[str, float]:
+        with self.memory.lock:
+            return {"memoryHits": self.memory.hits, "memoryMisses": self.memory.misses}
+
+
+disk_cache = DiskCache() if DISK_CACHE_MAX_BYTES > 0 else None
+upstream_cache = TieredCache("upstream", disk_cache)
+result_cache = TieredCache("results", disk_cache)
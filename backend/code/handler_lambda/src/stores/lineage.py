@@ -0,0 +1,112 @@
+from __future__ import annotations
+import heapq
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from ..models import PipelineLineage
+
+# bitbucket abbreviates merge commit hashes, so lineages are keyed on a prefix
+SHA_PREFIX_LENGTH = 12
+PENDING_LINEAGE_LIMIT = int(os.getenv("PENDING_LINEAGE_LIMIT", "1000"))
+
+
+class PendingLineages:
+    # pull requests reported merged by webhook, walked through the st, at and
+    # production stages as their build notifications arrive; every stage is a
+    # dictionary lookup, so each event costs the same however long the history
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_merge_commit: Dict[str, PipelineLineage] = {}
+        # (merge timestamp, key) of every merge awaiting its st build, oldest
+        # first; entries whose key has since left by_merge_commit are skipped
+        self.merge_order: List[Tuple[int, str]] = []
+        self.awaiting_green_st: List[PipelineLineage] = []
+        self.awaiting_at: Dict[int, List[PipelineLineage]] = {}
+        self.awaiting_green_at: List[PipelineLineage] = []
+        self.awaiting_production: Dict[int, List[PipelineLineage]] = {}
+
+    def add_merge(self, pull_request_id: int, merge_commit: str, merge_timestamp: int):
+        key = merge_commit[:SHA_PREFIX_LENGTH]
+        with self.lock:
+            self.by_merge_commit[key] = PipelineLineage(
+                pull_request_id, merge_commit, merge_timestamp
+            )
+            heapq.heappush(self.merge_order, (merge_timestamp, key))
+            while len(self.by_merge_commit) > PENDING_LINEAGE_LIMIT:
+                # merges whose st build never reported are left to the polled path
+                del self.by_merge_commit[next(iter(self.by_merge_commit))]
+            if len(self.merge_order) > 2 * max(PENDING_LINEAGE_LIMIT, 1):
+                self.merge_order = [
+                    (lineage.merge_timestamp, key)
+                    for key, lineage in self.by_merge_commit.items()
+                ]
+                heapq.heapify(self.merge_order)
+
+    def st_build_finished(
+        self, number: int, timestamp: int, result: str, commits: List[str]
+    ) -> int:
+        with self.lock:
+            built = [
+                self.by_merge_commit[commit[:SHA_PREFIX_LENGTH]]
+                for commit in commits
+                if commit[:SHA_PREFIX_LENGTH] in self.by_merge_commit
+            ]
+            if built:
+                # a build of a later merge also contains every earlier one,
+                # which are the front of the merge order
+                newest_merge = max(lineage.merge_timestamp for lineage in built)
+                while self.merge_order and self.merge_order[0][0] <= newest_merge:
+                    merge_timestamp, key = heapq.heappop(self.merge_order)
+                    lineage = self.by_merge_commit.get(key)
+                    if lineage is None or lineage.merge_timestamp != merge_timestamp:
+                        continue
+                    del self.by_merge_commit[key]
+                    self.awaiting_green_st.append(lineage)
+
+            if result != "SUCCESS" or not self.awaiting_green_st:
+                return 0
+            lineages, self.awaiting_green_st = self.awaiting_green_st, []
+            for lineage in lineages:
+                lineage.st_build_number = number
+                lineage.st_start_timestamp = timestamp
+            self.awaiting_at.setdefault(number, []).extend(lineages)
+            return len(lineages)
+
+    def at_build_finished(
+        self, number: int, upstream_build: Optional[int], result: str
+    ) -> int:
+        with self.lock:
+            if upstream_build is not None:
+                self.awaiting_green_at.extend(self.awaiting_at.pop(upstream_build, []))
+
+            if result != "SUCCESS" or not self.awaiting_green_at:
+                return 0
+            lineages, self.awaiting_green_at = self.awaiting_green_at, []
+            for lineage in lineages:
+                lineage.at_build_number = number
+            self.awaiting_production.setdefault(number, []).extend(lineages)
+            return len(lineages)
+
+    def production_build_finished(
+        self, upstream_build: Optional[int], timestamp: int, duration: int
+    ) -> List[PipelineLineage]:
+        if upstream_build is None:
+            return []
+        with self.lock:
+            lineages = self.awaiting_production.pop(upstream_build, [])
+        for lineage in lineages:
+            lineage.production_start_timestamp = timestamp
+            lineage.production_duration = duration
+        return lineages
+
+
+pending_lineages: Dict[str, PendingLineages] = {}
+pending_lineages_lock = threading.Lock()
+
+
+def get_pending_lineages(repo_slug: str) -> PendingLineages:
+    with pending_lineages_lock:
+        if repo_slug not in pending_lineages:
+            pending_lineages[repo_slug] = PendingLineages()
+        return pending_lineages[repo_slug]
@@ -0,0 +1,33 @@
+from __future__ import annotations
+import os
+from typing import Any, Optional
+
+from .cache import TieredCache, disk_cache
+
+# merged pull requests never change, so a running aggregate only goes stale by
+# missing newer merges, which the next request folds in; the ttl merely lets
+# the aggregates of projects nobody asks about leave the disk cache
+RUNNING_AGGREGATE_TTL_SECONDS = float(
+    os.getenv("RUNNING_AGGREGATE_TTL_SECONDS", str(30 * 86400))
+)
+
+CHANGE_FAILURE_AGGREGATE = "change-failure"
+RECOVERY_AGGREGATE = "recovery"
+
+running_aggregate_cache = TieredCache("running", disk_cache)
+
+
+def running_aggregate_key(aggregate: str, repo_slug: str) -> str:
+    return f"{aggregate}:{repo_slug}"
+
+
+def get_running_aggregate(aggregate: str, repo_slug: str) -> Optional[Any]:
+    return running_aggregate_cache.get(running_aggregate_key(aggregate, repo_slug))
+
+
+def set_running_aggregate(aggregate: str, repo_slug: str, value: Any):
+    running_aggregate_cache.set(
+        running_aggregate_key(aggregate, repo_slug),
+        value,
+        RUNNING_AGGREGATE_TTL_SECONDS,
+    )
@@ -0,0 +1,114 @@
+from __future__ import annotations
+import threading
+from bisect import bisect_left, bisect_right, insort
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+LEAD_TIME_SERIES = "lead-time-for-changes"
+PRODUCTION_FINISH_SERIES = "production-finish"
+RECOVERY_SERIES = "mean-time-to-recovery"
+MERGE_SERIES = "pull-request-merges"
+
+
+class SeriesIndex:
+    # records kept sorted by (timestamp, pull request id) so a since/until
+    # window is a pair of bisections and a slice
+    def __init__(self):
+        self.keys: List[Tuple[int, int]] = []
+        self.records: Dict[int, dict] = {}
+        self.timestamps_by_id: Dict[int, int] = {}
+        # merge position of the pull request that reached past the oldest
+        # retained jenkins build; everything merged before it is out of reach
+        self.history_limit_position: Optional[List[int]] = None
+        self.observers: List[Callable[[dict], None]] = []
+        self.lock = threading.Lock()
+
+    def __contains__(self, record_id: int) -> bool:
+        return record_id in self.records
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def get(self, record_id: int) -> Optional[dict]:
+        return self.records.get(record_id)
+
+    def add(self, record_id: int, timestamp: int, record: dict):
+        with self.lock:
+            if record_id in self.records:
+                return
+            insort(self.keys, (timestamp, record_id))
+            self.records[record_id] = record
+            self.timestamps_by_id[record_id] = timestamp
+        for observer in self.observers:
+            observer(record)
+
+    def ordered_records(self) -> Iterator[dict]:
+        # snapshot the keys so writers are not blocked while the caller streams
+        with self.lock:
+            keys = list(self.keys)
+        for _, record_id in keys:
+            yield self.records[record_id]
+
+    def window(
+        self, since: Optional[int] = None, until: Optional[int] = None
+    ) -> List[dict]:
+        with self.lock:
+            start = 0 if since is None else bisect_left(self.keys, (since, -1))
+            end = (
+                len(self.keys)
+                if until is None
+                else bisect_right(self.keys, (until, float("inf")))
+            )
+            return [self.records[record_id] for _, record_id in self.keys[start:end]]
+
+    def page(
+        self,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        cursor: Optional[int] = None,
+        limit: int = 50,
+    ) -> Tuple[List[dict], Optional[int]]:
+        with self.lock:
+            start = 0 if since is None else bisect_left(self.keys, (since, -1))
+            end = (
+                len(self.keys)
+                if until is None
+                else bisect_right(self.keys, (until, float("inf")))
+            )
+            if cursor is not None and cursor in self.timestamps_by_id:
+                start = max(
+                    start,
+                    bisect_right(self.keys, (self.timestamps_by_id[cursor], cursor)),
+                )
+            window = self.keys[start : min(end, start + limit)]
+            records = [self.records[record_id] for _, record_id in window]
+            next_cursor = window[-1][1] if window and start + limit < end else None
+        return records, next_cursor
+
+
+series_indexes: Dict[Tuple[str, str], SeriesIndex] = {}
+series_indexes_lock = threading.Lock()
+# called with the repo slug and record for every record newly added to a series
+series_observers: Dict[str, List[Callable[[str, dict], None]]] = {}
+
+
+def observe_series(series: str, observer: Callable[[str, dict], None]):
+    with series_indexes_lock:
+        series_observers.setdefault(series, []).append(observer)
+        for (indexed_series, repo_slug), series_index in series_indexes.items():
+            if indexed_series == series:
+                series_index.observers.append(
+                    lambda record, repo_slug=repo_slug: observer(repo_slug, record)
+                )
+
+
+def get_series_index(series: str, repo_slug: str) -> SeriesIndex:
+    with series_indexes_lock:
+        key = (series, repo_slug)
+        if key not in series_indexes:
+            series_index = SeriesIndex()
+            series_index.observers = [
+                lambda record, observer=observer: observer(repo_slug, record)
+                for observer in series_observers.get(series, [])
+            ]
+            series_indexes[key] = series_index
+        return series_indexes[key]
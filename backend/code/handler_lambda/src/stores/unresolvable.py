@@ -0,0 +1,61 @@
+from __future__ import annotations
+import os
+import time
+from typing import Optional
+from typing_extensions import TypedDict
+
+from .cache import TieredCache, disk_cache
+
+# how long a pull request whose lineage failed is skipped, doubling with every
+# repeated failure up to the cap
+UNRESOLVABLE_TTL_SECONDS = float(os.getenv("UNRESOLVABLE_TTL_SECONDS", "300"))
+UNRESOLVABLE_MAX_TTL_SECONDS = float(os.getenv("UNRESOLVABLE_MAX_TTL_SECONDS", "86400"))
+
+MERGE_COMMIT_WITHOUT_PARENTS = "merge-commit-without-parents"
+PARENT_COMMIT_WITHOUT_STATUSES = "parent-commit-without-statuses"
+ST_BUILD_WITHOUT_NEXT_BUILD = "st-build-without-next-build"
+NO_GREEN_AT_BUILD = "no-green-at-build"
+UNEXPECTED_AT_BUILD = "unexpected-acceptance-build"
+UNEXPECTED_PRODUCTION_BUILD = "unexpected-production-build"
+# what a pull request still on its way to production fails with as well
+IN_FLIGHT_REASONS = (ST_BUILD_WITHOUT_NEXT_BUILD, NO_GREEN_AT_BUILD)
+
+unresolvable_cache = TieredCache("unresolvable", disk_cache)
+
+
+class UnresolvableEntry(TypedDict):
+    reason: str
+    failures: int
+    retryAt: float
+
+
+def unresolvable_key(repo_slug: str, pull_request_id: int) -> str:
+    return f"{repo_slug}:{pull_request_id}"
+
+
+def get_unresolvable(
+    repo_slug: str, pull_request_id: int
+) -> Optional[UnresolvableEntry]:
+    entry = unresolvable_cache.get(unresolvable_key(repo_slug, pull_request_id))
+    if entry is None or entry["retryAt"] <= time.time():
+        return None
+    return entry
+
+
+def record_unresolvable(
+    repo_slug: str, pull_request_id: int, reason: str
+) -> UnresolvableEntry:
+    key = unresolvable_key(repo_slug, pull_request_id)
+    previous = unresolvable_cache.get(key)
+    failures = previous["failures"] + 1 if previous is not None else 1
+    ttl_seconds = min(
+        UNRESOLVABLE_TTL_SECONDS * 2 ** (failures - 1), UNRESOLVABLE_MAX_TTL_SECONDS
+    )
+    entry: UnresolvableEntry = {
+        "reason": reason,
+        "failures": failures,
+        "retryAt": time.time() + ttl_seconds,
+    }
+    # kept past the retry so that failing again backs off further
+    unresolvable_cache.set(key, entry, ttl_seconds + UNRESOLVABLE_MAX_TTL_SECONDS)
+    return entry
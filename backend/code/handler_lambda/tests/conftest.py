@@ -0,0 +1,85 @@
+"""Shared setup for the handler tests.
+
+The handler reads its configuration when src is first imported, so the
+upstream stub is started and the environment set here, before any test module
+imports from src. Every test gets a fresh copy of the synthetic history and
+empty in-process stores.
+"""
+import copy
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from tools.load_test import configure_environment
+from tools.synthetic_history import HistoryOptions, generate_history
+from tools.upstream_stub import UpstreamStub
+
+HISTORY = generate_history(HistoryOptions(projects=1, pull_requests=30))
+BUILD_INDEX_DIR = tempfile.mkdtemp(prefix="build-index-")
+
+stub = UpstreamStub(copy.deepcopy(HISTORY))
+configure_environment(stub.start(), HISTORY)
+os.environ.update(
+    {
+        "BUILD_INDEX_DIR": BUILD_INDEX_DIR,
+        "CONTINUATION_TOKEN_SECRET": "test-secret",
+        "DISK_CACHE_MAX_BYTES": "0",
+        "UPSTREAM_BURST": "1000",
+        "UPSTREAM_CACHE_TTL_SECONDS": "0",
+        "UPSTREAM_RATE_PER_SECOND": "1000",
+        "WEBHOOK_SECRET": "test-webhook-secret",
+    }
+)
+
+
+def reset_stores():
+    from src.calculators import commit_build_index, jenkins_folders
+    from src.calculators import upstream_build_index
+    from src.handlers import post_webhooks
+    from src.stores import aggregates, lineage, running, series, unresolvable
+    from src.stores.cache import result_cache, upstream_cache
+
+    for cache in (
+        result_cache,
+        upstream_cache,
+        unresolvable.unresolvable_cache,
+        running.running_aggregate_cache,
+    ):
+        cache.memory.entries.clear()
+    post_webhooks.seen_deliveries.entries.clear()
+    for store in (
+        series.series_indexes,
+        lineage.pending_lineages,
+        aggregates.repo_aggregates,
+        aggregates.deployment_aggregates,
+        commit_build_index.commit_build_indexes,
+        commit_build_index.commit_build_index_refresh_locks,
+        jenkins_folders.folder_builds,
+        upstream_build_index.build_indexes,
+    ):
+        store.clear()
+    shutil.rmtree(BUILD_INDEX_DIR, ignore_errors=True)
+    os.makedirs(BUILD_INDEX_DIR)
+
+
+@pytest.fixture
+def history():
+    # tests reshape their own copy and hand it to the upstream fixture
+    return copy.deepcopy(HISTORY)
+
+
+@pytest.fixture
+def upstream(history):
+    reset_stores()
+    stub.load(history)
+    yield stub
+    stub.load(copy.deepcopy(HISTORY))
+
+
+@pytest.fixture
+def global_variables(upstream):
+    from src.globals import validate_project_id_param
+
+    return validate_project_id_param(1)
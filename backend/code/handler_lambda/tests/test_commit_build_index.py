@@ -0,0 +1,19 @@
+from src.calculators.commit_build_index import (
+    commit_build_index_refresh_locks,
+    get_commit_build_index,
+)
+
+ST_JOB = "/job/st-1"
+
+
+def test_readers_do_not_wait_for_a_rebuild_in_flight(global_variables, upstream):
+    commit_build_index = get_commit_build_index(ST_JOB)
+    commit_build_index.built_at -= 3600
+    calls_before = upstream.call_count()
+
+    with commit_build_index_refresh_locks[ST_JOB]:
+        # another thread is rebuilding, so the stale index is served as it is
+        assert get_commit_build_index(ST_JOB) is commit_build_index
+        assert upstream.call_count() == calls_before
+
+    assert get_commit_build_index(ST_JOB) is not commit_build_index
@@ -0,0 +1,102 @@
+import json
+
+import pytest
+
+from src.exceptions import FourTwoTwoError
+from src.handlers.get_lead_time_for_changes import get_lead_time_for_changes_handler
+from src.handlers.get_mean_time_to_recovery_handler import (
+    get_mean_time_to_recovery_handler,
+)
+from src.helpers import continuation
+from src.helpers.deadline import Deadline
+
+
+class CountdownDeadline(Deadline):
+    # expires after a fixed number of checks instead of wall clock time
+    def __init__(self, checks: int):
+        super().__init__(None)
+        self.checks = checks
+
+    def expired(self) -> bool:
+        self.checks -= 1
+        return self.checks < 0
+
+
+def swap_merge_order(history: dict, first: int, second: int):
+    # pull requests keep their place in the merged list but trade ids, so one
+    # with a lower id is merged after one with a higher id
+    pull_requests = history["projects"][0]["pullRequests"]
+    pull_requests[first]["id"], pull_requests[second]["id"] = (
+        pull_requests[second]["id"],
+        pull_requests[first]["id"],
+    )
+
+
+# the mean time to recovery walks the newest page only for a window; without
+# one it folds into a running aggregate that keeps its own progress
+WINDOWS = {
+    get_lead_time_for_changes_handler: None,
+    get_mean_time_to_recovery_handler: {"since": 0, "until": 2_000_000_000_000},
+}
+MEAN_KEYS = {
+    get_lead_time_for_changes_handler: "meanDurationInSeconds",
+    get_mean_time_to_recovery_handler: "meanTimeToRecoverySeconds",
+}
+
+
+def resume_until_complete(handler, global_variables, checks: int) -> dict:
+    token = None
+    for _ in range(100):
+        response = handler(
+            global_variables, CountdownDeadline(checks), token, WINDOWS[handler]
+        )
+        body = json.loads(response.body)
+        if body["complete"]:
+            return body
+        token = body["continuationToken"]
+        assert token is not None
+    raise AssertionError("never completed")
+
+
+@pytest.fixture
+def history(history):
+    swap_merge_order(history, 2, 3)
+    swap_merge_order(history, 6, 8)
+    return history
+
+
+@pytest.mark.parametrize("handler", list(WINDOWS))
+@pytest.mark.parametrize("checks", [1, 2, 3, 5])
+def test_resumed_passes_match_a_single_pass(handler, global_variables, checks):
+    single = json.loads(
+        handler(global_variables, Deadline(None), None, WINDOWS[handler]).body
+    )
+    resumed = resume_until_complete(handler, global_variables, checks)
+
+    assert resumed["sampleSize"] == single["sampleSize"]
+    assert resumed["skipped"] == single["skipped"]
+    assert resumed[MEAN_KEYS[handler]] == pytest.approx(single[MEAN_KEYS[handler]])
+
+
+def test_tokens_are_refused_without_a_secret(global_variables, monkeypatch):
+    response = get_lead_time_for_changes_handler(global_variables, CountdownDeadline(2))
+    token = json.loads(response.body)["continuationToken"]
+
+    monkeypatch.setattr(continuation, "CONTINUATION_TOKEN_SECRET", b"")
+    with pytest.raises(FourTwoTwoError):
+        get_lead_time_for_changes_handler(global_variables, Deadline(None), token)
+
+    partial = json.loads(
+        get_lead_time_for_changes_handler(global_variables, CountdownDeadline(2)).body
+    )
+    assert partial["complete"] is False
+    assert partial["continuationToken"] is None
+
+
+def test_forged_tokens_are_refused(global_variables):
+    forged = continuation.encode_continuation_token(
+        "lead-time-for-changes", "repo-1", {"position": None, "sum": 1.0, "count": 1}
+    )
+    tampered = forged[:-2] + ("A" if forged[-2] != "A" else "B") + forged[-1]
+    with pytest.raises(FourTwoTwoError):
+        get_lead_time_for_changes_handler(global_variables, Deadline(None), tampered)
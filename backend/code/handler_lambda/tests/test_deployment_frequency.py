@@ -0,0 +1,51 @@
+import json
+
+from src.handlers.get_deployment_frequency import get_deployment_frequency_handler
+from src.handlers.post_webhooks import post_jenkins_webhook_handler
+
+WEBHOOK_SECRET = "test-webhook-secret"
+
+
+def production_build_body(history: dict) -> str:
+    newest = max(history["builds"]["/job/pr-1"], key=lambda build: build["number"])
+    return json.dumps(
+        {
+            "name": "pr-1",
+            "url": "job/pr-1/",
+            "build": {
+                "number": newest["number"] + 1,
+                "phase": "FINALIZED",
+                "status": "SUCCESS",
+                "timestamp": newest["timestamp"] + 3_600_000,
+                "duration": 60_000,
+            },
+        }
+    )
+
+
+def test_etag_follows_deployments_added_by_webhooks(global_variables, history):
+    before = get_deployment_frequency_handler(global_variables)
+    before_etag = before.headers["ETag"]
+
+    assert (
+        get_deployment_frequency_handler(
+            global_variables, None, before_etag
+        ).status_code
+        == 304
+    )
+
+    post_jenkins_webhook_handler(production_build_body(history), WEBHOOK_SECRET)
+    after = get_deployment_frequency_handler(global_variables, None, before_etag)
+
+    assert after.status_code == 200
+    assert (
+        json.loads(after.body)["numberOfDeployments"]
+        == json.loads(before.body)["numberOfDeployments"] + 1
+    )
+    assert after.headers["ETag"] != before_etag
+    assert (
+        get_deployment_frequency_handler(
+            global_variables, None, after.headers["ETag"]
+        ).status_code
+        == 304
+    )
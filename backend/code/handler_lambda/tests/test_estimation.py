@@ -0,0 +1,106 @@
+import json
+import math
+
+import pytest
+
+from src.calculators import shared
+from src.calculators.estimation import StratifiedSampler, t_quantile
+from src.calculators.mean_time_to_recovery import filter_out_hotfix_pull_requests
+from src.handlers.get_lead_time_for_changes_estimate import (
+    get_lead_time_for_changes_estimate_handler,
+)
+from src.handlers.get_mean_time_to_recovery_estimate import (
+    get_mean_time_to_recovery_estimate_handler,
+)
+from src.helpers.deadline import Deadline
+from src.models import parse_pull_requests
+
+
+def sampled(values_by_stratum: dict, population_sizes: dict) -> StratifiedSampler:
+    sampler = StratifiedSampler(
+        [
+            (key, index)
+            for key, population_size in population_sizes.items()
+            for index in range(population_size)
+        ],
+        seed=1,
+    )
+    for stratum in sampler.strata:
+        for value in values_by_stratum.get(stratum.key, []):
+            stratum.remaining.pop()
+            stratum.values.append(value)
+    return sampler
+
+
+def test_estimate_without_samples_has_no_mean():
+    estimate = sampled({}, {"a": 3, "b": 2}).estimate(0.95)
+
+    assert estimate["meanSeconds"] is None
+    assert estimate["widthSeconds"] is None
+    assert estimate["sampleSize"] == 0
+    assert estimate["populationSize"] == 5
+
+
+def test_estimate_of_a_census_is_exact():
+    values = {"a": [1.0, 2.0, 6.0], "b": [10.0, 20.0]}
+
+    estimate = sampled(values, {"a": 3, "b": 2}).estimate(0.95)
+
+    assert estimate["meanSeconds"] == pytest.approx(39.0 / 5)
+    assert estimate["widthSeconds"] == 0
+
+
+def test_estimate_weights_strata_by_population():
+    # a: 2 of 4 sampled, b: 2 of 2 so it adds no variance
+    values = {"a": [1.0, 3.0], "b": [10.0, 14.0]}
+
+    estimate = sampled(values, {"a": 4, "b": 2}).estimate(0.95)
+
+    mean = 4 / 6 * 2.0 + 2 / 6 * 12.0
+    variance_of_mean = (4 / 6) ** 2 * 2.0 * (1 / 2 - 1 / 4)
+    # a single stratum contributes variance, with one degree of freedom
+    half_width = t_quantile(0.95, 1) * math.sqrt(variance_of_mean)
+    assert estimate["meanSeconds"] == pytest.approx(mean)
+    assert estimate["lowerSeconds"] == pytest.approx(mean - half_width)
+    assert estimate["upperSeconds"] == pytest.approx(mean + half_width)
+    assert estimate["sampleSize"] == 4
+    assert [summary["meanSeconds"] for summary in estimate["strata"]] == [2.0, 12.0]
+
+
+def test_unsampled_strata_are_left_out_of_the_mean():
+    values = {"a": [4.0, 6.0]}
+
+    estimate = sampled(values, {"a": 2, "b": 8}).estimate(0.95)
+
+    assert estimate["meanSeconds"] == pytest.approx(5.0)
+    assert estimate["populationSize"] == 10
+
+
+@pytest.mark.parametrize(
+    "handler, population_size",
+    [
+        (get_lead_time_for_changes_estimate_handler, 30),
+        # recoveries pair each hotfix with the pull request before it, and the
+        # oldest hotfix is on the last page
+        (get_mean_time_to_recovery_estimate_handler, None),
+    ],
+)
+def test_estimate_population_spans_every_page(
+    global_variables, history, monkeypatch, handler, population_size
+):
+    monkeypatch.setattr(shared, "PULL_REQUEST_PAGE_LENGTH", 10)
+    if population_size is None:
+        pull_requests = filter_out_hotfix_pull_requests(
+            parse_pull_requests({"values": history["projects"][0]["pullRequests"]})
+        )
+        population_size = len(pull_requests) - 1
+
+    response = handler(
+        global_variables,
+        Deadline(None),
+        None,
+        {"confidence": 0.95, "targetWidth": None, "budget": 4, "seed": 1},
+    )
+
+    assert response.status_code == 200
+    assert json.loads(response.body)["populationSize"] == population_size
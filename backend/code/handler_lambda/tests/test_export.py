@@ -0,0 +1,37 @@
+import base64
+import gzip
+import json
+
+import pytest
+
+from src.app import handler
+from src.helpers import columnar
+from tools.load_test import EXAMPLE_EVENT_PATH, LoadTestContext, synthesize_event
+
+
+def get_export(table: str, query: dict = None) -> dict:
+    event = synthesize_event(
+        json.loads(EXAMPLE_EVENT_PATH.read_text()), f"/export/1/{table}", query
+    )
+    return handler(event, LoadTestContext(60_000))
+
+
+def test_exports_default_to_csv(global_variables):
+    response = get_export("builds")
+
+    assert response["statusCode"] == 200
+    assert response["multiValueHeaders"]["Content-Type"] == ["text/csv"]
+    body = gzip.decompress(base64.b64decode(response["body"])).decode("utf-8")
+    assert body.startswith("repoSlug,timestamp,")
+
+
+@pytest.mark.parametrize("export_format", ["parquet", "arrow"])
+def test_columnar_exports_without_pyarrow_are_refused(
+    global_variables, monkeypatch, export_format
+):
+    monkeypatch.setattr(columnar, "pyarrow", None)
+
+    response = get_export("builds", {"format": export_format})
+
+    assert response["statusCode"] == 422
+    assert "format=csv" in json.loads(response["body"])["message"]
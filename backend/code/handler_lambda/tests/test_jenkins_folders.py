@@ -0,0 +1,86 @@
+import copy
+
+import pytest
+
+from src.calculators import jenkins_folders
+from src.calculators.jenkins_folders import get_folder_builds
+
+PR_JOB = "/job/pr-1"
+
+
+@pytest.fixture(autouse=True)
+def short_refresh_pages(monkeypatch):
+    monkeypatch.setattr(jenkins_folders, "JENKINS_FOLDER_REFRESH_PAGE", 2)
+
+
+def with_new_builds(history: dict, count: int) -> dict:
+    later = copy.deepcopy(history)
+    builds = later["builds"][PR_JOB]
+    newest = max(builds, key=lambda build: build["number"])
+    for number in range(newest["number"] + 1, newest["number"] + count + 1):
+        builds.append({**copy.deepcopy(newest), "number": number})
+    return later
+
+
+def build_numbers(job_name: str) -> list:
+    return [build.number for build in get_folder_builds(job_name)]
+
+
+def expire_folder():
+    jenkins_folders.folder_builds[""].fetched_at -= 3600
+
+
+@pytest.mark.parametrize(
+    "new_builds, pages",
+    # more new builds than a page holds read the whole history again
+    [(1, [2]), (3, [2, None])],
+)
+def test_refreshes_merge_the_newest_builds_into_the_history(
+    global_variables, history, upstream, monkeypatch, new_builds, pages
+):
+    first = build_numbers(PR_JOB)
+
+    later = with_new_builds(history, new_builds)
+    upstream.load(later)
+    expire_folder()
+    fetched_pages = []
+    fetch_folder_builds = jenkins_folders.fetch_folder_builds
+
+    def recording_fetch(folder, job_names, page=None):
+        fetched_pages.append(page)
+        return fetch_folder_builds(folder, job_names, page)
+
+    monkeypatch.setattr(jenkins_folders, "fetch_folder_builds", recording_fetch)
+
+    assert build_numbers(PR_JOB) == sorted(
+        (build["number"] for build in later["builds"][PR_JOB]), reverse=True
+    )
+    assert len(get_folder_builds(PR_JOB)) == len(first) + new_builds
+    assert fetched_pages == pages
+
+
+def test_refreshes_pick_up_builds_that_were_running(
+    global_variables, history, upstream
+):
+    running = copy.deepcopy(history)
+    newest = max(running["builds"][PR_JOB], key=lambda build: build["number"])
+    newest["result"] = None
+    upstream.load(running)
+    assert get_folder_builds(PR_JOB)[0].result is None
+
+    # the running build falls outside the newest page once two more follow it
+    upstream.load(with_new_builds(history, 2))
+    expire_folder()
+
+    assert get_folder_builds(PR_JOB)[2].number == newest["number"]
+    assert get_folder_builds(PR_JOB)[2].result is not None
+
+
+def test_readers_do_not_wait_for_a_folder_refresh_in_flight(global_variables, upstream):
+    first = get_folder_builds(PR_JOB)
+    expire_folder()
+    calls_before = upstream.call_count()
+
+    with jenkins_folders.folder_builds[""].refresh_lock:
+        assert get_folder_builds(PR_JOB) is first
+    assert upstream.call_count() == calls_before
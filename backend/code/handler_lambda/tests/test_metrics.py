@@ -0,0 +1,26 @@
+import json
+
+from src.helpers.metrics import publish_cache_metrics
+from src.stores.cache import result_cache
+
+
+def published_results_cache_metrics(capsys) -> dict:
+    publish_cache_metrics()
+    for line in capsys.readouterr().out.splitlines():
+        metric_set = json.loads(line)
+        if metric_set.get("cache") == "results":
+            return metric_set
+    raise AssertionError("no metric set for the results cache")
+
+
+def test_counters_are_published_as_changes_since_the_last_publish(upstream, capsys):
+    # counted by earlier tests in this process
+    published_results_cache_metrics(capsys)
+    result_cache.get("missing")
+    result_cache.get("missing")
+    assert published_results_cache_metrics(capsys)["MemoryCacheMisses"] == [2]
+
+    assert published_results_cache_metrics(capsys)["MemoryCacheMisses"] == [0]
+
+    result_cache.get("missing")
+    assert published_results_cache_metrics(capsys)["MemoryCacheMisses"] == [1]
@@ -0,0 +1,52 @@
+import copy
+
+import pytest
+
+from src.calculators.shared import extract_parent_commits
+from src.exceptions import FiveHundredError, UnresolvableLineage
+from src.models import JenkinsBuild, parse_jenkins_builds, parse_pull_requests
+from src.stores.unresolvable import MERGE_COMMIT_WITHOUT_PARENTS
+
+
+@pytest.fixture
+def pull_request(history) -> dict:
+    return copy.deepcopy(history["projects"][0]["pullRequests"][0])
+
+
+@pytest.mark.parametrize(
+    "path",
+    [("merge_commit", "hash"), ("merge_commit", "date"), ("merge_commit",)],
+)
+def test_pull_requests_without_their_merge_commit_are_rejected(pull_request, path):
+    parent = pull_request
+    for key in path[:-1]:
+        parent = parent[key]
+    del parent[path[-1]]
+
+    with pytest.raises(FiveHundredError):
+        parse_pull_requests({"values": [pull_request]})
+
+
+@pytest.mark.parametrize("key", ["hash", "links"])
+def test_pull_requests_with_partial_parents_are_rejected(pull_request, key):
+    del pull_request["merge_commit"]["parents"][0][key]
+
+    with pytest.raises(FiveHundredError):
+        parse_pull_requests({"values": [pull_request]})
+
+
+def test_merge_commits_without_parents_are_unresolvable(global_variables, pull_request):
+    pull_request["merge_commit"]["parents"] = []
+    (parsed,) = parse_pull_requests({"values": [pull_request]})
+
+    with pytest.raises(UnresolvableLineage) as raised:
+        extract_parent_commits(global_variables, parsed)
+    assert raised.value.reason == MERGE_COMMIT_WITHOUT_PARENTS
+
+
+def test_builds_without_a_required_field_are_rejected():
+    build = {"number": 7, "result": "SUCCESS"}
+
+    assert JenkinsBuild.from_jenkins(build).timestamp is None
+    with pytest.raises(FiveHundredError):
+        parse_jenkins_builds({"allBuilds": [build]}, ("timestamp",))
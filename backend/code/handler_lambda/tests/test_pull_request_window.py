@@ -0,0 +1,194 @@
+import json
+
+import pytest
+
+from src.calculators import shared
+from src.calculators.shared import filter_pull_requests_to_window
+from src.handlers.get_lead_time_for_changes import get_lead_time_for_changes_handler
+from src.handlers.get_lead_time_for_changes_series import (
+    get_lead_time_for_changes_series_handler,
+)
+from src.handlers.get_mean_time_to_recovery_handler import (
+    get_mean_time_to_recovery_handler,
+)
+from src.handlers.get_mean_time_to_recovery_series import (
+    get_mean_time_to_recovery_series_handler,
+)
+from src.helpers.continuation import merge_position
+from src.helpers.datetime import bitbucket_datetime_to_jenkins_timestamp
+from src.helpers.deadline import Deadline
+from src.models import parse_pull_requests
+from src.stores.series import LEAD_TIME_SERIES, get_series_index
+
+
+@pytest.fixture(autouse=True)
+def short_pages(monkeypatch):
+    # thirty pull requests span three pages
+    monkeypatch.setattr(shared, "PULL_REQUEST_PAGE_LENGTH", 10)
+
+
+def merge_timestamps(history: dict) -> dict:
+    return {
+        pull_request["id"]: bitbucket_datetime_to_jenkins_timestamp(
+            pull_request["merge_commit"]["date"]
+        )
+        for pull_request in history["projects"][0]["pullRequests"]
+    }
+
+
+def newest_page(history: dict):
+    return parse_pull_requests({"values": history["projects"][0]["pullRequests"][:10]})
+
+
+def window_between(history: dict, newest: int, oldest: int) -> dict:
+    # from the merge of the oldest-th pull request, newest first, to the merge
+    # of the newest-th
+    pull_requests = history["projects"][0]["pullRequests"]
+    return {
+        "since": bitbucket_datetime_to_jenkins_timestamp(
+            pull_requests[oldest]["merge_commit"]["date"]
+        ),
+        "until": bitbucket_datetime_to_jenkins_timestamp(
+            pull_requests[newest]["merge_commit"]["date"]
+        ),
+    }
+
+
+def ids_in_window(history: dict, time_window: dict) -> set:
+    return {
+        pull_request_id
+        for pull_request_id, merge_timestamp in merge_timestamps(history).items()
+        if (time_window["since"] is None or merge_timestamp >= time_window["since"])
+        and (time_window["until"] is None or merge_timestamp <= time_window["until"])
+    }
+
+
+@pytest.mark.parametrize("newest, oldest", [(2, 6), (12, 18), (8, 24), (25, 29)])
+def test_windows_older_than_the_newest_page_are_paged_back_to(
+    global_variables, history, newest, oldest
+):
+    time_window = window_between(history, newest, oldest)
+
+    windowed = filter_pull_requests_to_window(
+        global_variables, newest_page(history), time_window
+    )
+
+    assert {pull_request.id for pull_request in windowed} == ids_in_window(
+        history, time_window
+    )
+    assert len(windowed) == oldest - newest + 1
+
+
+def test_windows_within_the_newest_page_read_nothing_more(
+    global_variables, history, upstream
+):
+    time_window = window_between(history, 2, 6)
+    pull_requests = newest_page(history)
+    calls_before = upstream.call_count()
+
+    windowed = filter_pull_requests_to_window(
+        global_variables, pull_requests, time_window
+    )
+
+    assert upstream.call_count() == calls_before
+    assert len(windowed) == 5
+
+
+def test_windows_without_a_start_read_the_whole_history(global_variables, history):
+    time_window = {"since": None, "until": window_between(history, 20, 20)["until"]}
+
+    windowed = filter_pull_requests_to_window(
+        global_variables, newest_page(history), time_window
+    )
+
+    assert [pull_request.id for pull_request in windowed] == [
+        pull_request["id"]
+        for pull_request in history["projects"][0]["pullRequests"][20:]
+    ]
+
+
+def test_lead_time_for_an_old_window_has_a_mean(global_variables, history):
+    time_window = window_between(history, 20, 26)
+
+    response = get_lead_time_for_changes_handler(
+        global_variables, Deadline(None), None, time_window
+    )
+    body = json.loads(response.body)
+
+    assert response.status_code == 200
+    assert body["sampleSize"] > 0
+    assert body["meanDurationInSeconds"] is not None
+
+
+def test_recovery_for_a_window_starting_at_a_hotfix_has_a_mean(
+    global_variables, history
+):
+    pull_requests = history["projects"][0]["pullRequests"]
+    oldest_hotfix = max(
+        index
+        for index, pull_request in enumerate(
+            parse_pull_requests({"values": pull_requests})
+        )
+        if pull_request.is_hotfix
+    )
+    time_window = window_between(history, 0, oldest_hotfix)
+
+    response = get_mean_time_to_recovery_handler(
+        global_variables, Deadline(None), None, time_window
+    )
+    body = json.loads(response.body)
+
+    assert response.status_code == 200
+    assert body["sampleSize"] > 0
+
+
+def series_query(time_window: dict) -> dict:
+    return {**time_window, "cursor": None, "limit": 500, "format": "rows"}
+
+
+@pytest.mark.parametrize(
+    "handler, timestamp_key",
+    [
+        (get_lead_time_for_changes_series_handler, "productionFinishTimestamp"),
+        (get_mean_time_to_recovery_series_handler, "recoveryFinishTimestamp"),
+    ],
+)
+def test_series_for_an_old_window_have_records(
+    global_variables, history, handler, timestamp_key
+):
+    # both hotfixes merge within it
+    time_window = window_between(history, 10, 29)
+
+    response = handler(global_variables, Deadline(None), series_query(time_window))
+    records = json.loads(response.body)["records"]
+
+    assert records
+    assert all(
+        time_window["since"] <= record[timestamp_key] <= time_window["until"]
+        for record in records
+    )
+
+
+def test_series_stop_at_the_history_limit_by_merge_order(global_variables, history):
+    pull_requests = history["projects"][0]["pullRequests"]
+    # a pull request on the second page carries a lower id than the limit on
+    # the third
+    pull_requests[15]["id"], pull_requests[28]["id"] = (
+        pull_requests[28]["id"],
+        pull_requests[15]["id"],
+    )
+    parsed = parse_pull_requests({"values": pull_requests})
+    series_index = get_series_index(
+        LEAD_TIME_SERIES, global_variables["BITBUCKET_REPO_SLUG"]
+    )
+    series_index.history_limit_position = merge_position(parsed[25])
+
+    get_lead_time_for_changes_series_handler(
+        global_variables, Deadline(None), series_query({"since": None, "until": None})
+    )
+
+    assert parsed[15].id < parsed[25].id
+    assert parsed[15].id in series_index
+    assert {record["pullRequestId"] for record in series_index.ordered_records()} <= {
+        pull_request.id for pull_request in parsed[:25]
+    }
@@ -0,0 +1,125 @@
+import copy
+import json
+
+import pytest
+
+from src.calculators import shared
+from src.calculators.change_failure_rate import (
+    build_change_failure_aggregate,
+    calculate_change_failure_rate,
+)
+from src.calculators.shared import get_pull_requests_after
+from src.handlers.get_change_failure_rate import (
+    get_change_failure_rate_handler,
+    refresh_change_failure_aggregate,
+)
+from src.models import parse_pull_requests
+from src.stores import running
+
+
+@pytest.fixture(autouse=True)
+def short_pages(monkeypatch):
+    # thirty pull requests span three pages
+    monkeypatch.setattr(shared, "PULL_REQUEST_PAGE_LENGTH", 10)
+
+
+@pytest.fixture
+def history(history):
+    # the fourth newest pull request was opened before the twelfth newest but
+    # merged after it, so it carries the lower id
+    pull_requests = history["projects"][0]["pullRequests"]
+    pull_requests[3]["id"], pull_requests[11]["id"] = (
+        pull_requests[11]["id"],
+        pull_requests[3]["id"],
+    )
+    return history
+
+
+def merged_ids(history: dict) -> list:
+    return [
+        pull_request["id"] for pull_request in history["projects"][0]["pullRequests"]
+    ]
+
+
+def without_newest(history: dict, count: int) -> dict:
+    earlier = copy.deepcopy(history)
+    del earlier["projects"][0]["pullRequests"][:count]
+    return earlier
+
+
+def test_pull_requests_after_include_lower_ids_merged_later(global_variables, history):
+    ids = merged_ids(history)
+
+    pull_requests = get_pull_requests_after(global_variables, ids[5])
+
+    assert [pull_request.id for pull_request in pull_requests] == ids[:5]
+    assert min(ids[:5]) < ids[5]
+
+
+def test_pull_requests_after_reach_back_across_pages(global_variables, history):
+    ids = merged_ids(history)
+
+    pull_requests = get_pull_requests_after(global_variables, ids[24])
+
+    assert [pull_request.id for pull_request in pull_requests] == ids[:24]
+
+
+def test_pull_requests_after_one_never_merged_are_unknown(global_variables):
+    assert get_pull_requests_after(global_variables, 999_999) is None
+
+
+def test_change_failure_aggregate_seeds_from_every_page(global_variables, history):
+    change_failure_aggregate, updated = refresh_change_failure_aggregate(
+        global_variables, merged_ids(history)[0]
+    )
+
+    assert updated
+    assert change_failure_aggregate == build_change_failure_aggregate(
+        parse_pull_requests({"values": history["projects"][0]["pullRequests"]})
+    )
+    assert change_failure_aggregate["totalPullRequests"] == 30
+
+
+def test_folded_change_failure_aggregate_matches_a_fresh_one(
+    global_variables, history, upstream
+):
+    # seeded before the four newest merges, the lower id among them included
+    upstream.load(without_newest(history, 4))
+    seeded, _ = refresh_change_failure_aggregate(
+        global_variables, merged_ids(history)[4]
+    )
+    assert seeded["totalPullRequests"] == 26
+
+    upstream.load(history)
+    folded, updated = refresh_change_failure_aggregate(
+        global_variables, merged_ids(history)[0]
+    )
+
+    assert updated
+    assert folded == build_change_failure_aggregate(
+        parse_pull_requests({"values": history["projects"][0]["pullRequests"]})
+    )
+
+
+def test_warm_and_fresh_containers_agree(global_variables, history, upstream):
+    upstream.load(without_newest(history, 4))
+    get_change_failure_rate_handler(global_variables)
+    upstream.load(history)
+    warm = get_change_failure_rate_handler(global_variables)
+
+    running.running_aggregate_cache.memory.entries.clear()
+    fresh = get_change_failure_rate_handler(global_variables)
+
+    assert json.loads(fresh.body) == json.loads(warm.body)
+    assert json.loads(fresh.body) == calculate_change_failure_rate(
+        build_change_failure_aggregate(
+            parse_pull_requests({"values": history["projects"][0]["pullRequests"]})
+        )
+    )
+    assert fresh.headers["ETag"] == warm.headers["ETag"]
+    assert (
+        get_change_failure_rate_handler(
+            global_variables, None, warm.headers["ETag"]
+        ).status_code
+        == 304
+    )
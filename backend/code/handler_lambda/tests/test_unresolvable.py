@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.calculators.shared import resolve_pipeline_lineage
+from src.exceptions import UnresolvableLineage
+from src.models import parse_pull_requests
+from src.stores.unresolvable import NO_GREEN_AT_BUILD, get_unresolvable
+
+
+@pytest.fixture
+def history(history):
+    # the newest pull request's at builds all went red and nothing ran since
+    at_builds = history["builds"]["/job/at-1"]
+    first_at_build = max(
+        build["number"]
+        for build in at_builds
+        for action in build["actions"]
+        if action.get("causes", [{}])[0].get("upstreamBuild")
+    )
+    for build in at_builds:
+        if build["number"] >= first_at_build:
+            build["result"] = "FAILURE"
+    return history
+
+
+def newest_pull_request(history: dict, merged_ago: timedelta):
+    pull_request = history["projects"][0]["pullRequests"][0]
+    pull_request["merge_commit"]["date"] = (
+        datetime.now(timezone.utc) - merged_ago
+    ).isoformat()
+    return parse_pull_requests({"values": [pull_request]})[0]
+
+
+def test_pull_requests_still_in_flight_are_not_negative_cached(
+    global_variables, history
+):
+    pull_request = newest_pull_request(history, timedelta(minutes=5))
+
+    with pytest.raises(UnresolvableLineage) as raised:
+        resolve_pipeline_lineage(global_variables, pull_request)
+
+    assert raised.value.reason == NO_GREEN_AT_BUILD
+    assert get_unresolvable("repo-1", pull_request.id) is None
+
+
+def test_settled_pull_requests_are_negative_cached(global_variables, history):
+    pull_request = newest_pull_request(history, timedelta(days=2))
+
+    with pytest.raises(UnresolvableLineage):
+        resolve_pipeline_lineage(global_variables, pull_request)
+
+    assert get_unresolvable("repo-1", pull_request.id)["reason"] == NO_GREEN_AT_BUILD
@@ -0,0 +1,121 @@
+import pytest
+
+from src.calculators import shared
+from src.calculators.upstream_build_index import (
+    AT_UPSTREAM_URL_PARTS,
+    get_build_index,
+    record_finished_build,
+    resolve_at_build_from_index,
+)
+from src.stores.build_index import BuildRecord
+from tools.synthetic_history import UPSTREAM_PROJECT_URL
+
+AT_JOB = "/job/at-1"
+DECOY_URLS = (
+    "job/Beehive%20Improvement%20Program/job/feature/",
+    "job/Other%20Program/job/main/",
+)
+
+
+def upstream_build_of(build: dict):
+    for action in build["actions"]:
+        for cause in action.get("causes", []):
+            if "upstreamBuild" in cause:
+                return cause["upstreamBuild"]
+    return None
+
+
+def triggered_at_builds(history: dict) -> list:
+    at_builds = sorted(history["builds"][AT_JOB], key=lambda build: build["number"])
+    return [build for build in at_builds if upstream_build_of(build) is not None]
+
+
+@pytest.fixture(params=DECOY_URLS)
+def decoy_url(request):
+    return request.param
+
+
+@pytest.fixture
+def history(history, decoy_url):
+    # the at build before the middle upstream-triggered one is re-pointed at
+    # the same st build number, as if a build of another branch or project
+    # with an overlapping number had triggered it
+    triggered = triggered_at_builds(history)
+    target = triggered[len(triggered) // 2]
+    decoy = next(
+        build
+        for build in history["builds"][AT_JOB]
+        if build["number"] == target["number"] - 1
+    )
+    decoy["result"] = "SUCCESS"
+    decoy["actions"] = [
+        {},
+        {
+            "causes": [
+                {"upstreamBuild": upstream_build_of(target), "upstreamUrl": decoy_url}
+            ]
+        },
+    ]
+    # the stub serves only the projects and builds
+    history["target"] = target
+    return history
+
+
+def test_mapped_index_matches_the_xpath_resolver(
+    global_variables, history, monkeypatch
+):
+    target = history["target"]
+    st_build_number = upstream_build_of(target)
+
+    monkeypatch.setattr(shared, "UPSTREAM_BUILD_RESOLVER", "xpath")
+    from_xpath = shared.get_at_jenkins_build_of_current_pull_request(
+        global_variables, st_build_number
+    )
+    from_index = resolve_at_build_from_index(global_variables, st_build_number)
+
+    assert from_xpath == target["number"]
+    assert from_index == from_xpath
+
+
+def test_every_upstream_triggered_build_resolves_alike(
+    global_variables, history, monkeypatch
+):
+    monkeypatch.setattr(shared, "UPSTREAM_BUILD_RESOLVER", "xpath")
+    for build in triggered_at_builds(history)[1:]:
+        st_build_number = upstream_build_of(build)
+        assert resolve_at_build_from_index(
+            global_variables, st_build_number
+        ) == shared.get_at_jenkins_build_of_current_pull_request(
+            global_variables, st_build_number
+        )
+
+
+def test_webhook_builds_from_other_upstream_jobs_are_not_indexed(
+    global_variables, decoy_url
+):
+    build_index = get_build_index(AT_JOB, AT_UPSTREAM_URL_PARTS)
+    number = build_index.last_number + 1
+    unused_st_build = 10_000
+
+    assert record_finished_build(
+        AT_JOB, BuildRecord(number, unused_st_build, 0, 0, "SUCCESS"), decoy_url
+    )
+    assert build_index.find(number).upstream_build is None
+    assert build_index.first_by_upstream(unused_st_build) is None
+
+    assert record_finished_build(
+        AT_JOB,
+        BuildRecord(number + 1, unused_st_build, 0, 0, "SUCCESS"),
+        UPSTREAM_PROJECT_URL,
+    )
+    assert build_index.first_by_upstream(unused_st_build).number == number + 1
+
+
+def test_readers_do_not_wait_for_a_refresh_in_flight(global_variables):
+    build_index = get_build_index(AT_JOB, AT_UPSTREAM_URL_PARTS)
+    build_index.refreshed_at -= 3600
+
+    with build_index.refresh_lock:
+        # another thread is refreshing, so the stale index is served as it is
+        assert get_build_index(AT_JOB, AT_UPSTREAM_URL_PARTS) is build_index
+        assert get_build_index("/job/pr-1").refreshed_at is not None
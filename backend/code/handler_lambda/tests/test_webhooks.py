@@ -0,0 +1,102 @@
+import json
+
+import pytest
+
+from src.app import handler
+from src.handlers.post_webhooks import post_jenkins_webhook_handler
+from src.stores.lineage import PendingLineages, get_pending_lineages
+from src.stores.series import LEAD_TIME_SERIES, get_series_index
+from tools.load_test import EXAMPLE_EVENT_PATH, LoadTestContext, synthesize_event
+from tools.synthetic_history import UPSTREAM_PROJECT_URL
+
+WEBHOOK_SECRET = "test-webhook-secret"
+MERGE_TIMESTAMP = 1_700_000_000_000
+
+
+def jenkins_body(job: str, number: int, result: str = "SUCCESS", **build) -> str:
+    return json.dumps(
+        {
+            "name": job,
+            "url": f"job/{job}/",
+            "build": {
+                "number": number,
+                "phase": "FINALIZED",
+                "status": result,
+                "timestamp": MERGE_TIMESTAMP + number * 60_000,
+                "duration": 60_000,
+                **build,
+            },
+        }
+    )
+
+
+def post_jenkins(body: str, headers: dict, query: dict = None) -> dict:
+    event = synthesize_event(
+        json.loads(EXAMPLE_EVENT_PATH.read_text()), "/webhooks/jenkins", query
+    )
+    event["httpMethod"] = event["requestContext"]["httpMethod"] = "POST"
+    event["headers"] = {**(event.get("headers") or {}), **headers}
+    event["multiValueHeaders"] = {
+        name: [value] for name, value in event["headers"].items()
+    }
+    event["body"] = body
+    event["isBase64Encoded"] = False
+    return handler(event, LoadTestContext(60_000))
+
+
+def test_jenkins_token_is_only_read_from_the_header(upstream):
+    body = jenkins_body("st-1", 900, phase="STARTED")
+
+    assert post_jenkins(body, {}, {"token": WEBHOOK_SECRET})["statusCode"] == 401
+    assert post_jenkins(body, {"X-Webhook-Token": "wrong"})["statusCode"] == 401
+    assert post_jenkins(body, {"X-Webhook-Token": WEBHOOK_SECRET})["statusCode"] == 202
+
+
+@pytest.mark.parametrize(
+    "decoy_url",
+    [
+        "job/Beehive%20Improvement%20Program/job/feature/",
+        "job/Other%20Program/job/main/",
+    ],
+)
+def test_lineages_ignore_at_builds_from_other_upstream_jobs(upstream, decoy_url):
+    get_pending_lineages("repo-1").add_merge(1000, "abcdef1234567890", MERGE_TIMESTAMP)
+    for body in (
+        jenkins_body("st-1", 900, scm={"commit": "abcdef1234567890"}),
+        jenkins_body("at-1", 900, upstreamBuild=900, upstreamUrl=decoy_url),
+        jenkins_body("pr-1", 900, upstreamBuild=900),
+    ):
+        post_jenkins_webhook_handler(body, WEBHOOK_SECRET)
+
+    lead_time_index = get_series_index(LEAD_TIME_SERIES, "repo-1")
+    assert lead_time_index.get(1000) is None
+
+    for body in (
+        jenkins_body("at-1", 901, upstreamBuild=900, upstreamUrl=UPSTREAM_PROJECT_URL),
+        jenkins_body("pr-1", 901, upstreamBuild=901),
+    ):
+        post_jenkins_webhook_handler(body, WEBHOOK_SECRET)
+
+    lead_time_record = lead_time_index.get(1000)
+    assert lead_time_record["stBuildNumber"] == 900
+    assert lead_time_record["atBuildNumber"] == 901
+
+
+def test_st_builds_release_the_merges_they_contain():
+    pending_lineages = PendingLineages()
+    for pull_request_id, merge_commit in enumerate(
+        ("aaaa00000000", "bbbb00000000", "cccc00000000", "dddd00000000"), 1
+    ):
+        pending_lineages.add_merge(
+            pull_request_id, merge_commit, MERGE_TIMESTAMP + pull_request_id
+        )
+
+    assert pending_lineages.st_build_finished(10, 0, "SUCCESS", ["cccc00000000"]) == 3
+    released = pending_lineages.awaiting_at[10]
+    assert [lineage.pull_request_id for lineage in released] == [1, 2, 3]
+    assert list(pending_lineages.by_merge_commit) == ["dddd00000000"]
+
+    # a redelivered merge is released once
+    pending_lineages.add_merge(4, "dddd00000000", MERGE_TIMESTAMP + 4)
+    assert pending_lineages.st_build_finished(11, 0, "SUCCESS", ["dddd00000000"]) == 1
+    assert pending_lineages.st_build_finished(12, 0, "SUCCESS", ["dddd00000000"]) == 0
@@ -0,0 +1,71 @@
+"""Compare row and columnar series encodings, with and without gzip.
+
+Run from backend/code/handler_lambda:
+
+    python -m tools.bench_encoding --records 5000
+"""
+import argparse
+import gzip
+import json
+import random
+import timeit
+
+from src.helpers.encoding import COMPRESSION_LEVEL, records_to_columns
+
+
+def synthetic_lead_time_records(count: int, seed: int):
+    rng = random.Random(seed)
+    timestamp = 1_600_000_000_000
+    records = []
+    for pull_request_id in range(1, count + 1):
+        timestamp += rng.randint(600_000, 86_400_000)
+        duration_ms = rng.randint(1_800_000, 172_800_000)
+        records.append(
+            {
+                "pullRequestId": pull_request_id,
+                "mergeCommit": "%040x" % rng.getrandbits(160),
+                "stStartTimestamp": timestamp,
+                "productionFinishTimestamp": timestamp + duration_ms,
+                "durationSeconds": duration_ms / 1000.0,
+            }
+        )
+    return records
+
+
+def encoders(records):
+    return {
+        "rows": lambda: json.dumps({"records": records}),
+        "columnar": lambda: json.dumps({"columns": records_to_columns(records)}),
+        "rows+gzip": lambda: gzip.compress(
+            json.dumps({"records": records}).encode("utf-8"),
+            compresslevel=COMPRESSION_LEVEL,
+        ),
+        "columnar+gzip": lambda: gzip.compress(
+            json.dumps({"columns": records_to_columns(records)}).encode("utf-8"),
+            compresslevel=COMPRESSION_LEVEL,
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    records = synthetic_lead_time_records(args.records, args.seed)
+    baseline = None
+    print(f"{'encoding':<16}{'bytes':>12}{'saved':>9}{'encode ms':>12}")
+    for name, encode in encoders(records).items():
+        encoded = encode()
+        size = len(encoded if isinstance(encoded, bytes) else encoded.encode("utf-8"))
+        baseline = baseline or size
+        seconds = min(timeit.repeat(encode, number=1, repeat=args.repeat))
+        print(
+            f"{name:<16}{size:>12}{(1 - size / baseline) * 100:>8.1f}%{seconds * 1000:>12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
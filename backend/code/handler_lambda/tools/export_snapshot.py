@@ -0,0 +1,61 @@
+"""Export resolved lineages, recoveries and build tables to columnar files.
+
+Resolves every configured project (or the ones given with --project-id) with
+the same environment variables the handler Lambda uses and writes one file per
+project and table, sorted by timestamp and batched into row groups. Parquet and
+Arrow IPC need pyarrow; without it the files are written as csv. Run from
+backend/code/handler_lambda:
+
+    python -m tools.export_snapshot --output-dir /tmp/dora-export --format parquet
+"""
+from __future__ import annotations
+import argparse
+import os
+import time
+
+from src import globals as project_globals
+from src.handlers.get_export import EXPORT_TABLES, write_export
+from src.helpers.columnar import EXPORT_FORMATS, FILE_EXTENSIONS
+from src.helpers.deadline import Deadline
+
+
+def export_project(project_id: int, tables: list, export_format: str, output_dir: str):
+    global_variables = project_globals.validate_project_id_param(project_id)
+    for table in tables:
+        repo_slug = global_variables["BITBUCKET_REPO_SLUG"]
+        partial_path = os.path.join(output_dir, f".{repo_slug}-{table}.partial")
+        started_at = time.perf_counter()
+        with open(partial_path, "wb") as sink:
+            written_format, row_count, complete = write_export(
+                global_variables, table, export_format, sink, Deadline(None)
+            )
+        output_path = os.path.join(
+            output_dir, f"{repo_slug}-{table}.{FILE_EXTENSIONS[written_format]}"
+        )
+        os.replace(partial_path, output_path)
+        print(
+            f"{output_path}: {row_count} rows in "
+            f"{time.perf_counter() - started_at:.1f}s"
+            f"{'' if complete else ' (incomplete)'}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="parquet")
+    parser.add_argument("--table", action="append", choices=list(EXPORT_TABLES))
+    parser.add_argument("--project-id", type=int, action="append")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    project_globals.validate_job_names()
+    project_ids = args.project_id or range(1, project_globals.MAX_PROJECT_ID + 1)
+    for project_id in project_ids:
+        export_project(
+            project_id, args.table or list(EXPORT_TABLES), args.format, args.output_dir
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""Concurrent load generator for the handler Lambda entry point.
+
+Synthesises API Gateway REST events for every route (modelled on
+backend/example-event.json), drives src.app.handler at a given concurrency
+and arrival rate against tools.upstream_stub, and reports throughput,
+latency percentiles, error rates and upstream amplification. Each
+concurrency slot is its own worker process that imports the handler once
+and serves one request at a time, as a warm Lambda container does, so
+repeated requests exercise the caches a real container would reuse. Run
+from backend/code/handler_lambda:
+
+    python -m tools.load_test --requests 200 --concurrency 8 --rate 20
+"""
+from __future__ import annotations
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from urllib.parse import parse_qsl, urlsplit
+
+from .synthetic_history import (
+    add_history_arguments,
+    generate_history,
+    history_options_from_args,
+)
+from .upstream_stub import UpstreamStub, load_fixture
+
+EXAMPLE_EVENT_PATH = Path(__file__).resolve().parents[3] / "example-event.json"
+
+# every GET route, and each windowed one again over the middle half of the
+# project's merges; the webhooks are left to tests/test_webhooks.py
+WINDOW = "from={since}&to={until}"
+SERIES_WINDOW = "since={since}&until={until}"
+ROUTES = [
+    "/deployment-frequency/{project_id}",
+    "/lead-time-for-changes/{project_id}",
+    "/mean-time-to-recovery/{project_id}",
+    "/change-failure-rate/{project_id}",
+    "/lead-time-for-changes/{project_id}/series",
+    "/mean-time-to-recovery/{project_id}/series",
+    "/lead-time-for-changes/{project_id}/stream",
+    "/mean-time-to-recovery/{project_id}/stream",
+    "/lead-time-for-changes/{project_id}/estimate",
+    "/mean-time-to-recovery/{project_id}/estimate",
+    "/export/{project_id}/lead-times?format=csv",
+    "/export/{project_id}/recoveries?format=csv",
+    "/export/{project_id}/builds?format=csv",
+    "/metrics",
+    f"/deployment-frequency/{{project_id}}?{WINDOW}",
+    f"/lead-time-for-changes/{{project_id}}?{WINDOW}",
+    f"/mean-time-to-recovery/{{project_id}}?{WINDOW}",
+    f"/change-failure-rate/{{project_id}}?{WINDOW}",
+    f"/lead-time-for-changes/{{project_id}}/series?{SERIES_WINDOW}",
+    f"/mean-time-to-recovery/{{project_id}}/series?{SERIES_WINDOW}",
+    f"/lead-time-for-changes/{{project_id}}/stream?{WINDOW}",
+    f"/mean-time-to-recovery/{{project_id}}/stream?{WINDOW}",
+    f"/lead-time-for-changes/{{project_id}}/estimate?{WINDOW}",
+    f"/mean-time-to-recovery/{{project_id}}/estimate?{WINDOW}",
+]
+
+
+class LoadTestContext:
+    function_name = "load-test-handler-lambda"
+    memory_limit_in_mb = 128
+    invoked_function_arn = "arn:aws:lambda:eu-west-1:000000000000:function:load-test"
+
+    def __init__(self, timeout_ms: int):
+        self.aws_request_id = str(uuid.uuid4())
+        self.deadline = time.monotonic() + timeout_ms / 1000.0
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(0, int((self.deadline - time.monotonic()) * 1000))
+
+
+def synthesize_event(template: dict, path: str, query: dict | None = None) -> dict:
+    event = json.loads(json.dumps(template))
+    event["path"] = path
+    event["pathParameters"] = {"proxy": path.lstrip("/")}
+    event["requestContext"]["path"] = path
+    event["requestContext"]["requestId"] = str(uuid.uuid4())
+    event["queryStringParameters"] = query
+    event["multiValueQueryStringParameters"] = (
+        {key: [value] for key, value in query.items()} if query else None
+    )
+    return event
+
+
+def configure_environment(base_url: str, fixture: dict):
+    projects = fixture["projects"]
+    os.environ.update(
+        {
+            "JENKINS_API_URL": f"{base_url}/jenkins",
+            "BITBUCKET_API_URL": f"{base_url}/bitbucket",
+            "BITBUCKET_WORKSPACE": "workspace",
+            "JENKINS_ST_JOB_NAMES": ",".join(p["jobs"]["st"] for p in projects),
+            "JENKINS_AT_JOB_NAMES": ",".join(p["jobs"]["at"] for p in projects),
+            "JENKINS_PR_JOB_NAMES": ",".join(p["jobs"]["pr"] for p in projects),
+            "JENKINS_JOB_NAMES": ",".join(p["jobs"]["pr"] for p in projects),
+            "BITBUCKET_REPO_SLUGS": ",".join(p["repoSlug"] for p in projects),
+        }
+    )
+    os.environ.setdefault("CONTINUATION_TOKEN_SECRET", "load-test")
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+    os.environ.setdefault("POWERTOOLS_LOG_LEVEL", "ERROR")
+
+
+def project_windows(fixture: dict) -> dict:
+    # merge dates of the pull requests a quarter and three quarters of the way
+    # back through each project's merges, newest first
+    windows = {}
+    for project_id, project in enumerate(fixture["projects"], 1):
+        merge_dates = [
+            pull_request["merge_commit"]["date"]
+            for pull_request in project["pullRequests"]
+        ]
+        windows[project_id] = {
+            "since": merge_dates[3 * (len(merge_dates) - 1) // 4],
+            "until": merge_dates[(len(merge_dates) - 1) // 4],
+        }
+    return windows
+
+
+def route_event(template: dict, route: str, project_id: int, window: dict) -> dict:
+    # the window is filled in after the query is split, as its offsets carry a +
+    url = urlsplit(route)
+    query = {key: value.format(**window) for key, value in parse_qsl(url.query)}
+    return synthesize_event(
+        template, url.path.format(project_id=project_id), query or None
+    )
+
+
+worker_handler = None
+
+
+def start_worker():
+    global worker_handler
+    # the handler prints EMF metric lines; keep them out of the report
+    sys.stdout = open(os.devnull, "w")
+    from src.app import handler
+
+    worker_handler = handler
+
+
+def invoke_in_worker(event: dict, timeout_ms: int) -> tuple:
+    started_at = time.perf_counter()
+    try:
+        response = worker_handler(event, LoadTestContext(timeout_ms))
+        status_code = int(response["statusCode"])
+    except Exception:
+        status_code = 599
+    return status_code, time.perf_counter() - started_at
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run(args) -> dict:
+    fixture = (
+        load_fixture(args.fixture)
+        if args.fixture
+        else generate_history(history_options_from_args(args))
+    )
+    stub = UpstreamStub(fixture, args.upstream_latency_ms)
+    base_url = stub.start(args.stub_port)
+    configure_environment(base_url, fixture)
+    if args.cassette:
+        # replays only match when the stub listens on the recorded port
+        os.environ["UPSTREAM_CASSETTE_MODE"] = args.cassette_mode
+        os.environ["UPSTREAM_CASSETTE_PATH"] = args.cassette
+
+    template = json.loads(EXAMPLE_EVENT_PATH.read_text())
+    windows = project_windows(fixture)
+    rng = random.Random(args.seed)
+    routes = [route for route in ROUTES if not args.route or route in args.route]
+
+    # workers are spawned rather than forked, so they start from the
+    # environment above and not from a copy of this process's threads
+    with ProcessPoolExecutor(
+        max_workers=args.concurrency,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=start_worker,
+    ) as executor:
+        # every worker imports the handler before the clock starts
+        list(executor.map(time.sleep, [0.1] * args.concurrency))
+
+        upstream_calls_before = stub.call_count()
+        started_at = time.perf_counter()
+        next_arrival = time.perf_counter()
+        submitted = []
+        for _ in range(args.requests):
+            if args.rate > 0:
+                # open loop with poisson arrivals
+                next_arrival += rng.expovariate(args.rate)
+                time.sleep(max(0.0, next_arrival - time.perf_counter()))
+            route = rng.choice(routes)
+            project_id = rng.randint(1, len(fixture["projects"]))
+            event = route_event(template, route, project_id, windows[project_id])
+            submitted.append(
+                (route, executor.submit(invoke_in_worker, event, args.timeout_ms))
+            )
+        results = [(route, *future.result()) for route, future in submitted]
+    elapsed = time.perf_counter() - started_at
+    upstream_calls = stub.call_count() - upstream_calls_before
+    stub.stop()
+
+    report = {
+        "requests": len(results),
+        "elapsedSeconds": round(elapsed, 3),
+        "throughputPerSecond": round(len(results) / elapsed, 2),
+        "upstreamCalls": upstream_calls,
+        "upstreamAmplification": round(upstream_calls / max(1, len(results)), 2),
+        "routes": {},
+    }
+    for route in routes:
+        route_results = [result for result in results if result[0] == route]
+        latencies = sorted(result[2] * 1000 for result in route_results)
+        errors = sum(1 for result in route_results if result[1] >= 400)
+        report["routes"][route] = {
+            "requests": len(route_results),
+            "errorRate": round(errors / max(1, len(route_results)), 3),
+            "p50Ms": round(percentile(latencies, 0.50), 1),
+            "p90Ms": round(percentile(latencies, 0.90), 1),
+            "p99Ms": round(percentile(latencies, 0.99), 1),
+            "maxMs": round(latencies[-1], 1) if latencies else 0.0,
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument(
+        "--rate", type=float, default=0, help="arrivals per second, 0 for closed loop"
+    )
+    parser.add_argument("--upstream-latency-ms", type=float, default=5)
+    parser.add_argument("--timeout-ms", type=int, default=60_000)
+    parser.add_argument("--route", action="append", help="restrict to these routes")
+    parser.add_argument(
+        "--fixture", help="serve a fixture written by tools.synthetic_history"
+    )
+    parser.add_argument("--stub-port", type=int, default=0)
+    parser.add_argument(
+        "--cassette", help="record upstream traffic to or replay it from this file"
+    )
+    parser.add_argument(
+        "--cassette-mode", choices=("record", "replay"), default="record"
+    )
+    add_history_arguments(parser)
+    parser.set_defaults(projects=2)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
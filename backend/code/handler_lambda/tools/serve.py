@@ -0,0 +1,190 @@
+"""Long-running HTTP server mode for the handler Lambda.
+
+Serves every route by synthesising an API Gateway REST event for
+src.app.handler, except the /lead-time-for-changes/<id>/stream and
+/mean-time-to-recovery/<id>/stream routes. Those are written line by line
+with chunked transfer encoding as each pull request resolves, and run
+alongside other requests. The router keeps the event it is resolving as
+class state, so every other route is resolved one at a time. Deployed
+behind API Gateway those routes are buffered instead, because neither REST
+APIs nor the Python Lambda runtime can stream a response. Run from
+backend/code/handler_lambda against the configured upstreams, or against
+tools.upstream_stub with --stub:
+
+    python -m tools.serve --port 8080 --stub
+"""
+from __future__ import annotations
+import argparse
+import contextlib
+import json
+import os
+import re
+import threading
+from base64 import b64decode
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from .load_test import (
+    EXAMPLE_EVENT_PATH,
+    LoadTestContext,
+    configure_environment,
+    synthesize_event,
+)
+from .synthetic_history import (
+    add_history_arguments,
+    generate_history,
+    history_options_from_args,
+)
+from .upstream_stub import UpstreamStub, load_fixture
+
+STREAM_PATH = re.compile(
+    r"^/(?P<metric>lead-time-for-changes|mean-time-to-recovery)/(?P<project_id>\d+)/stream$"
+)
+
+
+def make_request_handler(template: dict, timeout_ms: int):
+    from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
+
+    from src.app import handler
+    from src.exceptions import FiveHundredError, FourTwoTwoError
+    from src.globals import validate_project_id_param
+    from src.handlers.get_lead_time_for_changes_stream import (
+        stream_lead_time_for_changes,
+    )
+    from src.handlers.get_mean_time_to_recovery_stream import (
+        stream_mean_time_to_recovery,
+    )
+    from src.helpers.deadline import Deadline
+    from src.helpers.encoding import NDJSON_CONTENT_TYPE
+    from src.helpers.pagination import parse_time_window
+    from src.helpers.scheduler import scheduled_as
+
+    # app.current_event is shared by every thread, so only one request may be
+    # resolved through the router at a time
+    resolve_lock = threading.Lock()
+    streams = {
+        "lead-time-for-changes": stream_lead_time_for_changes,
+        "mean-time-to-recovery": stream_mean_time_to_recovery,
+    }
+
+    class RequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            event = synthesize_event(template, url.path, dict(parse_qsl(url.query)))
+            event["headers"] = {
+                **(event.get("headers") or {}),
+                **dict(self.headers.items()),
+            }
+            event["multiValueHeaders"] = {
+                key: [value] for key, value in event["headers"].items()
+            }
+
+            match = STREAM_PATH.match(url.path)
+            if match is None:
+                with resolve_lock:
+                    response = handler(event, LoadTestContext(timeout_ms))
+                self.send_handler_response(response)
+                return
+
+            with scheduled_as(project=match["project_id"]):
+                try:
+                    global_variables = validate_project_id_param(
+                        int(match["project_id"])
+                    )
+                    # no lambda timeout to stop short of in server mode
+                    lines = streams[match["metric"]](
+                        global_variables,
+                        Deadline(None),
+                        parse_time_window(APIGatewayProxyEvent(event)),
+                    )
+                except FourTwoTwoError as err:
+                    self.send_json(422, {"message": err.message, "path": url.path})
+                    return
+                except FiveHundredError as err:
+                    self.send_json(500, {"message": err.message, "path": url.path})
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", NDJSON_CONTENT_TYPE)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for line in lines:
+                    self.write_chunk((json.dumps(line) + "\n").encode("utf-8"))
+                self.write_chunk(b"")
+
+        def write_chunk(self, chunk: bytes):
+            self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+            self.wfile.flush()
+
+        def send_json(self, status_code: int, body: dict):
+            self.send_body(status_code, {"Content-Type": ["application/json"]}, body)
+
+        def send_handler_response(self, response: dict):
+            body = response.get("body") or ""
+            if response.get("isBase64Encoded"):
+                body = b64decode(body)
+            self.send_body(
+                int(response["statusCode"]),
+                response.get("multiValueHeaders") or {},
+                body,
+            )
+
+        def send_body(self, status_code: int, headers: dict, body):
+            if isinstance(body, dict):
+                body = json.dumps(body)
+            if isinstance(body, str):
+                body = body.encode("utf-8")
+            self.send_response(status_code)
+            for name, values in headers.items():
+                for value in values:
+                    self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return RequestHandler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--timeout-ms", type=int, default=60_000)
+    parser.add_argument(
+        "--stub", action="store_true", help="serve against tools.upstream_stub"
+    )
+    parser.add_argument("--upstream-latency-ms", type=float, default=0)
+    parser.add_argument(
+        "--fixture", help="serve a fixture written by tools.synthetic_history"
+    )
+    add_history_arguments(parser)
+    args = parser.parse_args()
+
+    if args.stub:
+        fixture = (
+            load_fixture(args.fixture)
+            if args.fixture
+            else generate_history(history_options_from_args(args))
+        )
+        stub = UpstreamStub(fixture, args.upstream_latency_ms)
+        configure_environment(stub.start(), fixture)
+
+    template = json.loads(EXAMPLE_EVENT_PATH.read_text())
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", args.port), make_request_handler(template, args.timeout_ms)
+    )
+    print(f"serving on http://127.0.0.1:{server.server_address[1]}", flush=True)
+    # the handler prints EMF metric lines after every request
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+
+
+if __name__ == "__main__":
+    main()
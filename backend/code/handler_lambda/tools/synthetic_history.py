@@ -0,0 +1,291 @@
+"""Deterministic generator for large Jenkins and Bitbucket histories.
+
+Produces a fixture in the shape tools.upstream_stub serves: merged pull
+requests as Bitbucket returns them (newest first, with parent commits and
+statuses links), and ST/AT/production allBuilds tables as Jenkins returns them
+(newest first, with lastBuiltRevision, upstream causes and nextBuild links).
+The same seed always yields the same history. Run from
+backend/code/handler_lambda:
+
+    python -m tools.synthetic_history --pull-requests 5000 --output /tmp/history.json
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import random
+import time
+from dataclasses import dataclass
+
+UPSTREAM_PLACEHOLDER = "{upstream}"
+BITBUCKET_WORKSPACE = "workspace"
+UPSTREAM_PROJECT_URL = "job/Beehive%20Improvement%20Program/job/main/"
+
+HOUR_MS = 3_600_000
+MINUTE_MS = 60_000
+
+
+@dataclass
+class HistoryOptions:
+    seed: int = 1
+    projects: int = 1
+    pull_requests: int = 20
+    hotfix_rate: float = 0.2
+    red_build_rate: float = 0.0
+    max_red_streak: int = 3
+    retained_builds: int = 0
+    legacy_master_fraction: float = 0.0
+    mean_merge_gap_hours: float = 4.0
+    start_timestamp: int = 1_680_000_000_000
+
+
+def generate_history(options: HistoryOptions) -> dict:
+    rng = random.Random(options.seed)
+    fixture = {"projects": [], "builds": {}}
+    for project in range(1, options.projects + 1):
+        generate_project(rng, options, project, fixture)
+    return fixture
+
+
+def generate_project(
+    rng: random.Random, options: HistoryOptions, project: int, fixture: dict
+):
+    jobs = {
+        "st": f"/job/st-{project}",
+        "at": f"/job/at-{project}",
+        "pr": f"/job/pr-{project}",
+    }
+    slug = f"repo-{project}"
+    st_builds, at_builds, pr_builds = [], [], []
+    pull_requests = []
+    statuses = {}
+    legacy_pull_requests = int(options.pull_requests * options.legacy_master_fraction)
+
+    timestamp = options.start_timestamp
+    parent_hash = commit_hash(slug, 0)
+    st_builds.append(jenkins_build(jobs["st"], 1, timestamp, sha=parent_hash))
+    statuses[parent_hash] = [status_for(jobs["st"], 1, legacy=legacy_pull_requests > 0)]
+
+    for pull_request_id in range(1, options.pull_requests + 1):
+        timestamp += (
+            int(rng.expovariate(1 / options.mean_merge_gap_hours) * HOUR_MS) + MINUTE_MS
+        )
+        merge_hash = commit_hash(slug, pull_request_id)
+        legacy = pull_request_id <= legacy_pull_requests
+
+        # red streaks are retried on the same commit until one goes green
+        build_timestamp = timestamp + rng.randint(1, 5) * MINUTE_MS
+        for result in red_streak(rng, options) + ["SUCCESS"]:
+            st_builds.append(
+                jenkins_build(
+                    jobs["st"],
+                    len(st_builds) + 1,
+                    build_timestamp,
+                    sha=merge_hash,
+                    result=result,
+                    duration=rng.randint(5, 20) * MINUTE_MS,
+                )
+            )
+            build_timestamp = st_builds[-1]["timestamp"] + st_builds[-1]["duration"]
+        green_st_number = st_builds[-1]["number"]
+        statuses[merge_hash] = [status_for(jobs["st"], green_st_number, legacy=legacy)]
+
+        # only the upstream-triggered AT run carries the upstream cause; manual
+        # reruns after a red run are started by a user
+        build_timestamp += rng.randint(1, 10) * MINUTE_MS
+        causes = [upstream_cause(green_st_number)]
+        for result in red_streak(rng, options) + ["SUCCESS"]:
+            at_builds.append(
+                jenkins_build(
+                    jobs["at"],
+                    len(at_builds) + 1,
+                    build_timestamp,
+                    causes=causes,
+                    result=result,
+                    duration=rng.randint(10, 40) * MINUTE_MS,
+                )
+            )
+            build_timestamp = at_builds[-1]["timestamp"] + at_builds[-1]["duration"]
+            causes = [{"userId": "developer"}]
+        green_at_number = at_builds[-1]["number"]
+
+        build_timestamp += int(rng.expovariate(1 / 2.0) * HOUR_MS)
+        pr_builds.append(
+            jenkins_build(
+                jobs["pr"],
+                len(pr_builds) + 1,
+                build_timestamp,
+                causes=[upstream_cause(green_at_number)],
+                duration=rng.randint(5, 15) * MINUTE_MS,
+            )
+        )
+
+        branch = (
+            f"hotfix/incident-{pull_request_id}"
+            if rng.random() < options.hotfix_rate
+            else f"feature/change-{pull_request_id}"
+        )
+        pull_requests.append(
+            bitbucket_pull_request(
+                slug, pull_request_id, branch, merge_hash, parent_hash, timestamp
+            )
+        )
+        parent_hash = merge_hash
+
+    fixture["projects"].append(
+        {
+            "repoSlug": slug,
+            "jobs": jobs,
+            "pullRequests": list(reversed(pull_requests)),
+            "statuses": statuses,
+        }
+    )
+    for job, builds in (("st", st_builds), ("at", at_builds), ("pr", pr_builds)):
+        fixture["builds"][jobs[job]] = link_builds(
+            prune(builds, options.retained_builds)
+        )
+
+
+def red_streak(rng: random.Random, options: HistoryOptions) -> list:
+    if rng.random() >= options.red_build_rate:
+        return []
+    return ["FAILURE"] * rng.randint(1, options.max_red_streak)
+
+
+def prune(builds: list, retained_builds: int) -> list:
+    # jenkins discards the oldest builds once a job exceeds its retention
+    return builds[-retained_builds:] if retained_builds else builds
+
+
+def commit_hash(slug: str, number: int) -> str:
+    return hashlib.sha1(f"{slug}-{number}".encode("utf-8")).hexdigest()
+
+
+def upstream_cause(upstream_build: int) -> dict:
+    return {"upstreamBuild": upstream_build, "upstreamUrl": UPSTREAM_PROJECT_URL}
+
+
+def jenkins_build(
+    job, number, timestamp, sha=None, causes=None, result="SUCCESS", duration=300_000
+):
+    actions = [{}]
+    if sha is not None:
+        actions.append({"lastBuiltRevision": {"SHA1": sha}})
+    if causes:
+        actions.append({"causes": causes})
+    return {
+        "number": number,
+        "id": str(number),
+        "result": result,
+        "timestamp": timestamp,
+        "duration": duration,
+        "url": f"{UPSTREAM_PLACEHOLDER}/jenkins{job}/{number}/",
+        "actions": actions,
+    }
+
+
+def link_builds(builds: list) -> list:
+    # newest first, like allBuilds
+    for build, next_build in zip(builds, builds[1:] + [None]):
+        build["nextBuild"] = (
+            {"number": next_build["number"], "url": next_build["url"]}
+            if next_build
+            else None
+        )
+    return list(reversed(builds))
+
+
+def status_for(job: str, number: int, legacy: bool = False) -> dict:
+    # statuses from before the main branch rename point at the master job
+    branch_job = f"{job}/job/master" if legacy else job
+    return {
+        "key": f"st-{number}",
+        "type": "build",
+        "state": "SUCCESSFUL",
+        "name": job,
+        "url": f"{UPSTREAM_PLACEHOLDER}/jenkins{branch_job}/{number}/display/redirect",
+    }
+
+
+def bitbucket_pull_request(
+    slug, pull_request_id, branch, merge_hash, parent_hash, timestamp
+):
+    commit_url = f"{UPSTREAM_PLACEHOLDER}/bitbucket/repositories/{BITBUCKET_WORKSPACE}/{slug}/commit"
+    merge_date = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(timestamp / 1000))
+    return {
+        "id": pull_request_id,
+        "title": f"Change {pull_request_id}",
+        "state": "MERGED",
+        "source": {"branch": {"name": branch}},
+        "merge_commit": {
+            "hash": merge_hash[:12],
+            "date": merge_date,
+            "links": {
+                "self": {"href": f"{commit_url}/{merge_hash}"},
+                "statuses": {"href": f"{commit_url}/{merge_hash}/statuses"},
+            },
+            "parents": [
+                {
+                    "hash": parent_hash[:12],
+                    "links": {
+                        "self": {"href": f"{commit_url}/{parent_hash}"},
+                        "html": {"href": f"{commit_url}/{parent_hash}"},
+                        "statuses": {"href": f"{commit_url}/{parent_hash}/statuses"},
+                    },
+                }
+            ],
+        },
+    }
+
+
+def add_history_arguments(parser: argparse.ArgumentParser):
+    defaults = HistoryOptions()
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--projects", type=int, default=defaults.projects)
+    parser.add_argument("--pull-requests", type=int, default=defaults.pull_requests)
+    parser.add_argument("--hotfix-rate", type=float, default=defaults.hotfix_rate)
+    parser.add_argument("--red-build-rate", type=float, default=defaults.red_build_rate)
+    parser.add_argument("--max-red-streak", type=int, default=defaults.max_red_streak)
+    parser.add_argument(
+        "--retained-builds",
+        type=int,
+        default=defaults.retained_builds,
+        help="keep only the newest N builds per job, 0 keeps everything",
+    )
+    parser.add_argument(
+        "--legacy-master-fraction",
+        type=float,
+        default=defaults.legacy_master_fraction,
+        help="fraction of the oldest PRs whose statuses point at the master job",
+    )
+
+
+def history_options_from_args(args) -> HistoryOptions:
+    return HistoryOptions(
+        seed=args.seed,
+        projects=args.projects,
+        pull_requests=args.pull_requests,
+        hotfix_rate=args.hotfix_rate,
+        red_build_rate=args.red_build_rate,
+        max_red_streak=args.max_red_streak,
+        retained_builds=args.retained_builds,
+        legacy_master_fraction=args.legacy_master_fraction,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_history_arguments(parser)
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args()
+
+    fixture = generate_history(history_options_from_args(args))
+    with open(args.output, "w") as output:
+        json.dump(fixture, output, separators=(",", ":"))
+    builds = sum(len(builds) for builds in fixture["builds"].values())
+    pull_requests = sum(len(project["pullRequests"]) for project in fixture["projects"])
+    print(f"wrote {pull_requests} pull requests and {builds} builds to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""Local stand-in for the Jenkins and Bitbucket APIs the handler Lambda calls.
+
+Serves a fixture (see build_fixture and tools.synthetic_history) over HTTP in the same JSON/XML shapes the
+real services return for the queries in calculators/shared.py, and counts the
+requests it receives. Run from backend/code/handler_lambda:
+
+    python -m tools.upstream_stub --port 8081
+"""
+from __future__ import annotations
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import xmltodict
+
+from .synthetic_history import (
+    UPSTREAM_PLACEHOLDER,
+    HistoryOptions,
+    add_history_arguments,
+    generate_history,
+    history_options_from_args,
+)
+
+UPSTREAM_BUILD_XPATH = re.compile(r"upstreamBuild\s*=\s*'?(\d+)'?")
+UPSTREAM_URL_XPATH = re.compile(r"contains\(upstreamUrl,\s*'([^']*)'\)")
+BUILD_NUMBER_XPATH = re.compile(r"allBuild\[number=(\d+)\]")
+BUILD_PATH = re.compile(r"^(?P<job>/.+)/(?P<number>\d+)/api/json$")
+JOB_API_PATH = re.compile(r"^(?P<job>/.+)/api/(?P<format>json|xml)$")
+FOLDER_API_PATH = re.compile(r"^(?P<folder>.*)/api/json$")
+FOLDER_BUILD_RANGE = re.compile(r"allBuilds\[.*\]\{\d*,(\d+)\}")
+PULL_REQUESTS_PATH = re.compile(
+    r"^/repositories/(?P<workspace>[^/]+)/(?P<slug>[^/]+)/pullrequests$"
+)
+STATUSES_PATH = re.compile(
+    r"^/repositories/(?P<workspace>[^/]+)/(?P<slug>[^/]+)/commit/(?P<hash>[^/]+)/statuses$"
+)
+
+
+def build_fixture(projects: int = 1, pull_requests: int = 20) -> dict:
+    # a small, fully green history with a fifth of the PRs merged from hotfix
+    # branches; see tools.synthetic_history for larger and messier ones
+    return generate_history(
+        HistoryOptions(projects=projects, pull_requests=pull_requests)
+    )
+
+
+def load_fixture(path: str) -> dict:
+    with open(path) as fixture_file:
+        return json.load(fixture_file)
+
+
+class UpstreamStub:
+    def __init__(self, fixture: dict, latency_ms: float = 0):
+        self.latency_ms = latency_ms
+        self.load(fixture)
+        self.calls = 0
+        self.calls_by_api = {"jenkins": 0, "bitbucket": 0}
+        self.lock = threading.Lock()
+        self.server = None
+        self.base_url = None
+
+    def load(self, fixture: dict):
+        # swaps the history served without restarting the server
+        self.fixture = fixture
+        self.projects = {
+            project["repoSlug"]: project for project in fixture["projects"]
+        }
+        self.builds_by_number = {
+            job: {build["number"]: build for build in builds}
+            for job, builds in fixture["builds"].items()
+        }
+        # every build triggered by each upstream build, oldest first
+        self.builds_by_upstream = {}
+        for job, builds in fixture["builds"].items():
+            builds_by_upstream = self.builds_by_upstream.setdefault(job, {})
+            for build in reversed(builds):
+                for upstream_build, _ in upstream_causes(build):
+                    builds_by_upstream.setdefault(upstream_build, []).append(build)
+
+    def first_by_upstream(self, job: str, upstream_build: int, url_parts: list):
+        # like the xpath query, the first build with a cause from the upstream
+        # build whose url contains every part; the query arrives unquoted one
+        # time more than jenkins sees it, so both sides are compared unquoted
+        for build in self.builds_by_upstream[job].get(upstream_build, []):
+            if any(
+                cause_build == upstream_build
+                and all(unquote(part) in unquote(url) for part in url_parts)
+                for cause_build, url in upstream_causes(build)
+            ):
+                return build
+        return None
+
+    def start(self, port: int = 0) -> str:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, content_type, body = stub.respond(self.path)
+                body = body.replace(UPSTREAM_PLACEHOLDER, stub.base_url).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def call_count(self) -> int:
+        with self.lock:
+            return self.calls
+
+    def respond(self, raw_path: str):
+        url = urlsplit(raw_path)
+        path = unquote(url.path)
+        query = {key: values[0] for key, values in parse_qs(unquote(url.query)).items()}
+        api, _, api_path = path[1:].partition("/")
+        with self.lock:
+            self.calls += 1
+            self.calls_by_api[api] = self.calls_by_api.get(api, 0) + 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        if api == "jenkins":
+            return self.respond_jenkins(f"/{api_path}", query)
+        if api == "bitbucket":
+            return self.respond_bitbucket(f"/{api_path}", query)
+        return not_found()
+
+    def respond_bitbucket(self, path: str, query: dict):
+        match = STATUSES_PATH.match(path)
+        if match:
+            project = self.projects.get(match["slug"])
+            if project is None:
+                return not_found()
+            statuses = project["statuses"].get(match["hash"], [])
+            return json_response({"values": statuses})
+
+        match = PULL_REQUESTS_PATH.match(path)
+        if match:
+            project = self.projects.get(match["slug"])
+            if project is None:
+                return not_found()
+            pull_requests = project["pullRequests"]
+            if query.get("fields") == "size":
+                return json_response({"size": len(pull_requests)})
+            pagelen = int(query.get("pagelen", "10"))
+            page = int(query.get("page", "1"))
+            response = {
+                "values": pull_requests[(page - 1) * pagelen : page * pagelen],
+                "pagelen": pagelen,
+                "page": page,
+                "size": len(pull_requests),
+            }
+            if page * pagelen < len(pull_requests):
+                response["next"] = (
+                    f"{UPSTREAM_PLACEHOLDER}/bitbucket{path}?state=MERGED"
+                    f"&pagelen={pagelen}&page={page + 1}"
+                )
+            return json_response(response)
+
+        return not_found()
+
+    def respond_jenkins(self, path: str, query: dict):
+        match = BUILD_PATH.match(path)
+        if match:
+            build = self.builds_by_number.get(match["job"], {}).get(
+                int(match["number"])
+            )
+            return json_response(build) if build else not_found()
+
+        match = FOLDER_API_PATH.match(path)
+        if match and query.get("tree", "").startswith("jobs["):
+            # allBuilds[...]{0,n} keeps the newest n builds of every job
+            build_range = FOLDER_BUILD_RANGE.search(query["tree"])
+            return json_response(
+                {
+                    "jobs": [
+                        {
+                            "name": unquote(job[len(match["folder"]) + 5 :]),
+                            "allBuilds": sorted(
+                                builds,
+                                key=lambda build: build["number"],
+                                reverse=True,
+                            )[: int(build_range[1]) if build_range else None],
+                        }
+                        for job, builds in self.fixture["builds"].items()
+                        if job.rpartition("/job/")[0] == match["folder"]
+                    ]
+                }
+            )
+
+        match = JOB_API_PATH.match(path)
+        if not match or match["job"] not in self.fixture["builds"]:
+            return not_found()
+        builds = self.fixture["builds"][match["job"]]
+        if match["format"] == "json":
+            if query.get("tree", "").startswith("lastCompletedBuild"):
+                completed = [build["number"] for build in builds if build["result"]]
+                return json_response(
+                    {
+                        "lastCompletedBuild": {"number": max(completed)}
+                        if completed
+                        else None
+                    }
+                )
+            if query.get("tree", "").startswith("firstBuild"):
+                first = min(builds, key=lambda build: build["number"], default=None)
+                return json_response(
+                    {
+                        "firstBuild": {
+                            "number": first["number"],
+                            "timestamp": first["timestamp"],
+                        }
+                        if first
+                        else None
+                    }
+                )
+            return json_response({"allBuilds": builds})
+
+        xpath = query.get("xpath", "")
+        number_match = BUILD_NUMBER_XPATH.search(xpath)
+        upstream_match = UPSTREAM_BUILD_XPATH.search(xpath)
+        build = None
+        if number_match:
+            build = self.builds_by_number[match["job"]].get(int(number_match[1]))
+        elif upstream_match:
+            build = self.first_by_upstream(
+                match["job"], int(upstream_match[1]), UPSTREAM_URL_XPATH.findall(xpath)
+            )
+        return xml_response(build) if build else not_found()
+
+
+def upstream_causes(build: dict) -> list:
+    return [
+        (cause["upstreamBuild"], cause.get("upstreamUrl", ""))
+        for action in build["actions"]
+        for cause in action.get("causes", [])
+        if "upstreamBuild" in cause
+    ]
+
+
+def json_response(data) -> tuple:
+    return 200, "application/json;charset=utf-8", json.dumps(data)
+
+
+def xml_response(build: dict) -> tuple:
+    element = {
+        "@_class": "org.jenkinsci.plugins.workflow.job.WorkflowRun",
+        "action": [
+            {"cause": cause}
+            for action in build["actions"]
+            for cause in action.get("causes", [])
+        ],
+        "duration": build["duration"],
+        "number": build["number"],
+        "result": build["result"],
+        "timestamp": build["timestamp"],
+        "url": build["url"],
+    }
+    return (
+        200,
+        "application/xml;charset=utf-8",
+        xmltodict.unparse({"allBuild": element}, full_document=False),
+    )
+
+
+def not_found() -> tuple:
+    return 404, "text/plain", "Not Found"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument(
+        "--fixture", help="serve a fixture written by tools.synthetic_history"
+    )
+    add_history_arguments(parser)
+    args = parser.parse_args()
+
+    fixture = (
+        load_fixture(args.fixture)
+        if args.fixture
+        else generate_history(history_options_from_args(args))
+    )
+    stub = UpstreamStub(fixture, args.latency_ms)
+    base_url = stub.start(args.port)
+    print(f"JENKINS_API_URL={base_url}/jenkins")
+    print(f"BITBUCKET_API_URL={base_url}/bitbucket")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
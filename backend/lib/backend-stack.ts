@@ -20,6 +20,8 @@ const cdkStack = process.env.CDK_STACK || 'BackendStack';
 const cdkId = process.env.CDK_ID || 'BackendStack';
 
 const authToken = process.env.AUTH_TOKEN || 'test-token';
+const authTokens = process.env.AUTH_TOKENS || '{}';
+const authorizerCacheTtlSeconds = Number(process.env.AUTHORIZER_CACHE_TTL_SECONDS || '300');
 
 const jenkinsApiUrl = process.env.JENKINS_API_URL || 'url';
 const bitbucketApiUrl = process.env.BITBUCKET_API_URL || 'url';
@@ -37,6 +39,8 @@ const jenkinsPrJobNames = process.env.JENKINS_PR_JOB_NAMES ?? '';
 const jenkinsJobNames = process.env.JENKINS_JOB_NAMES ?? '';
 const bitbucketWorkspace = process.env.BITBUCKET_WORKSPACE || 'value';
 const bitbucketRepoSlugs = process.env.BITBUCKET_REPO_SLUGS ?? '';
+const webhookSecret = process.env.WEBHOOK_SECRET ?? '';
+const continuationTokenSecret = process.env.CONTINUATION_TOKEN_SECRET ?? '';
 
 
 export class BackendStack extends Stack {
@@ -65,7 +69,9 @@ export class BackendStack extends Stack {
         JENKINS_PR_JOB_NAMES: jenkinsPrJobNames,
         JENKINS_JOB_NAMES: jenkinsJobNames,
         BITBUCKET_WORKSPACE: bitbucketWorkspace,
-        BITBUCKET_REPO_SLUGS: bitbucketRepoSlugs
+        BITBUCKET_REPO_SLUGS: bitbucketRepoSlugs,
+        WEBHOOK_SECRET: webhookSecret,
+        CONTINUATION_TOKEN_SECRET: continuationTokenSecret
       },
       vpc: awsVpc,
       vpcSubnets: { subnetGroupName: awsSubnetName },
@@ -78,19 +84,21 @@ export class BackendStack extends Stack {
       code: Code.fromAsset(path.join(__dirname, '../build', 'auth_lambda')),
       handler: 'src.app.handler',
       environment: {
-        AUTH_TOKEN: authToken
+        AUTH_TOKEN: authToken,
+        AUTH_TOKENS: authTokens
       }
     });
 
     const authoriser = new TokenAuthorizer(this, `${cdkId}ApiGatewayAuth`,{
       handler: authLambda,
       identitySource:'method.request.header.Authorization',
-      resultsCacheTtl: Duration.seconds(0),
+      resultsCacheTtl: Duration.seconds(authorizerCacheTtlSeconds),
     });
 
     const api = new LambdaRestApi(this, `${cdkId}Api`, {
       handler: handlerLambda,
       restApiName: `${cdkStack}-api`,
+      binaryMediaTypes: ['*/*'],
       defaultMethodOptions: {
         authorizer: authoriser,
       },
@@ -103,12 +111,21 @@ export class BackendStack extends Stack {
       }
     });
 
+    // bitbucket and jenkins cannot send the dashboard token, webhooks are
+    // checked against WEBHOOK_SECRET by the handler instead
+    api.root.addResource('webhooks').addProxy({ anyMethod: true });
+
     api.methods
-      .filter((method) => method.httpMethod === "OPTIONS")
+      .filter((method) => method.httpMethod === "OPTIONS" || method.resource.path.startsWith("/webhooks"))
       .forEach((method) => {
         const methodCfn = method.node.defaultChild as CfnMethod;
         methodCfn.authorizationType = AuthorizationType.NONE;
         methodCfn.authorizerId = undefined;
+        // binaryMediaTypes '*/*' makes every request binary, which the
+        // preflight mock integration cannot map, convert it back to text
+        if (method.httpMethod === "OPTIONS") {
+          methodCfn.addPropertyOverride('Integration.ContentHandling', 'CONVERT_TO_TEXT');
+        }
       });
     
       const uiBucket = new Bucket(this, `${cdkId}UiBucket`, {